@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of the installed encryption backends.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_backends.py
+
+The fastest backend can be selected with settings.SETTINGS_ENCRYPTION_BACKEND.
+"""
+import timeit
+
+from django.conf import settings
+
+settings.configure(SECRET_KEY="b(l$!na5rzuo+h(psyrlees(p9talk)u!=pjk#6=0v!n*q#y!m")
+
+from django_settings_custom import encryption  # noqa: E402
+
+NUMBER = 20000
+VALUE_SIZES = (16, 4096)
+
+
+def main():
+    """Print the per-call cost of encrypt / decrypt for each backend and mode."""
+    for name in encryption.available_backends():
+        encryption.set_backend(name)
+        for mode in encryption.MODES:
+            for size in VALUE_SIZES:
+                value = encryption.encrypt("a" * size, mode=mode)
+                encrypt = timeit.timeit(
+                    lambda: encryption.encrypt("a" * size, mode=mode), number=NUMBER
+                )
+                decrypt = timeit.timeit(
+                    lambda: encryption.decrypt(value), number=NUMBER
+                )
+                print(
+                    "%-12s %s %6sB: encrypt %8.2f us/call, decrypt %8.2f us/call"
+                    % (
+                        name,
+                        mode,
+                        size,
+                        encrypt / NUMBER * 1e6,
+                        decrypt / NUMBER * 1e6,
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
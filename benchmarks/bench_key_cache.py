@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of the derived key cache used by encrypt / decrypt.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_key_cache.py
+"""
+import timeit
+
+from django.conf import settings
+
+settings.configure(SECRET_KEY="b(l$!na5rzuo+h(psyrlees(p9talk)u!=pjk#6=0v!n*q#y!m")
+
+from django_settings_custom import encryption  # noqa: E402
+
+NUMBER = 20000
+
+
+def uncached_decrypt(value):
+    """Decrypt with the key cache emptied before each call."""
+    encryption.clear_key_cache()
+    return encryption.decrypt(value)
+
+
+def main():
+    """Print the per-call cost of decrypt with and without the key cache."""
+    value = encryption.encrypt("A protected sentence !")
+    uncached = timeit.timeit(lambda: uncached_decrypt(value), number=NUMBER)
+    encryption.clear_key_cache()
+    cached = timeit.timeit(lambda: encryption.decrypt(value), number=NUMBER)
+    print("decrypt without key cache: %.2f us/call" % (uncached / NUMBER * 1e6))
+    print("decrypt with key cache:    %.2f us/call" % (cached / NUMBER * 1e6))
+    saving = (uncached - cached) / NUMBER * 1e6
+    print("saving:                    %.2f us/call" % saving)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the host CPU time to boot N forked workers loading the settings file.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_prefork.py --workers 64 --values 500
+
+Cold: each worker parses and decrypts the settings file.
+Warm: the master calls prefork.warm_settings before forking, workers use the cache.
+The total is the CPU time (user + system) of the master and of every worker.
+"""
+import argparse
+import os
+import resource
+import shutil
+import tempfile
+
+from six.moves.configparser import RawConfigParser
+
+from django.conf import settings
+
+settings.configure(SECRET_KEY="b(l$!na5rzuo+h(psyrlees(p9talk)u!=pjk#6=0v!n*q#y!m")
+
+from django_settings_custom import (  # noqa: E402
+    encryption,
+    generation,
+    loader,
+    prefork,
+    template,
+)
+
+
+def write_files(directory, count):
+    """Write a template with count encrypted values and its settings file."""
+    config = RawConfigParser()
+    values = {}
+    for index in range(count):
+        section = "SECTION_%s" % (index // 50)
+        if not config.has_section(section):
+            config.add_section(section)
+            values[section] = {}
+        config.set(section, "key_%s" % index, "{ ENCRYPTED_USER_VALUE }")
+        values[section]["key_%s" % index] = "value %s" % index
+    config.add_section("DJANGO")
+    config.set("DJANGO", "key", "{ DJANGO_SECRET_KEY }")
+    template_path = os.path.join(directory, "template.ini")
+    with open(template_path, "w") as template_file:
+        config.write(template_file)
+    settings_path = os.path.join(directory, "conf.ini")
+    filled, _ = generation.render_settings(template_path, values)
+    generation.write_settings(filled, settings_path)
+    return settings_path, template_path
+
+
+def cpu_time(who):
+    """Return the user + system CPU time of the process or of its children."""
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def boot(workers, settings_path, template_path, warm):
+    """Fork the workers and return the CPU time of the master and the workers."""
+    loader.clear_cache()
+    template.clear_template_cache()
+    encryption.clear_key_cache()
+    master_start = cpu_time(resource.RUSAGE_SELF)
+    children_start = cpu_time(resource.RUSAGE_CHILDREN)
+    if warm:
+        prefork.warm_settings(
+            settings_path, template_path, use_snapshot=False, freeze_gc=False
+        )
+    master = cpu_time(resource.RUSAGE_SELF) - master_start
+    for _ in range(workers):
+        if os.fork() == 0:
+            loader.load_settings(settings_path, template_path, use_snapshot=False)
+            os._exit(0)
+    for _ in range(workers):
+        os.wait()
+    return master, cpu_time(resource.RUSAGE_CHILDREN) - children_start
+
+
+def main():
+    """Print the host CPU time of a cold and of a warm boot."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--values", type=int, default=500)
+    options = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        settings_path, template_path = write_files(directory, options.values)
+        for name, warm in (("cold", False), ("warm", True)):
+            master, workers = boot(options.workers, settings_path, template_path, warm)
+            print(
+                "%s: master %8.2f ms, %s workers %8.2f ms, total %8.2f ms"
+                % (
+                    name,
+                    master * 1e3,
+                    options.workers,
+                    workers * 1e3,
+                    (master + workers) * 1e3,
+                )
+            )
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
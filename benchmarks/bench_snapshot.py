@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Startup benchmark: INI parsing compared with binary snapshot loading.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_snapshot.py
+"""
+import os
+import shutil
+import tempfile
+import timeit
+
+from django_settings_custom import snapshot
+
+SIZES = (100, 1000, 10000)
+KEYS_BY_SECTION = 50
+NUMBER = 20
+
+
+def write_settings_file(path, size):
+    """Write a settings file with size keys."""
+    with open(path, "w") as settings_file:
+        for index in range(size):
+            if index % KEYS_BY_SECTION == 0:
+                settings_file.write("\n[SECTION_%s]\n" % (index // KEYS_BY_SECTION))
+            settings_file.write("KEY_%s = value number %s\n" % (index, index))
+
+
+def main():
+    """Print the time to read settings files of several sizes."""
+    directory = tempfile.mkdtemp()
+    try:
+        print("%8s %14s %14s" % ("keys", "INI (ms)", "snapshot (ms)"))
+        for size in SIZES:
+            path = os.path.join(directory, "conf_%s.ini" % size)
+            write_settings_file(path, size)
+            snapshot.write_snapshot(path)
+            parse = timeit.timeit(
+                lambda: snapshot.read_values(path, use_snapshot=False), number=NUMBER
+            )
+            load = timeit.timeit(lambda: snapshot.read_values(path), number=NUMBER)
+            print(
+                "%8s %14.3f %14.3f"
+                % (size, parse / NUMBER * 1000, load / NUMBER * 1000)
+            )
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for encryption and settings generation.
+
+Usage:
+    PYTHONPATH=. python benchmarks/suite.py --output results.json
+    PYTHONPATH=. python benchmarks/suite.py --compare results.json
+
+Each result is the time of one operation in seconds. With --compare, results are
+compared with a stored baseline and the script exits with status 1 when one of them
+is slower than the baseline by more than the threshold.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from six.moves.configparser import RawConfigParser
+
+from django.conf import settings
+
+settings.configure(SECRET_KEY="b(l$!na5rzuo+h(psyrlees(p9talk)u!=pjk#6=0v!n*q#y!m")
+
+from django_settings_custom import encryption, generation, template  # noqa: E402
+
+VALUE_SIZES = (16, 256, 4096, 65536, 1048576)
+PLACEHOLDER_COUNTS = (10, 100, 1000, 10000)
+ENCRYPTED_EVERY = 10
+IMPORT_REPEAT = 5
+OVERLAY_COUNT = 50
+
+
+def measure(function):
+    """Return the time of one call of function, in seconds."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=3, number=number)) / number
+
+
+def bench_encryption():
+    """Encrypt / decrypt time by value size."""
+    results = {}
+    for size in VALUE_SIZES:
+        value = "a" * size
+        encrypted_value = encryption.encrypt(value)
+        results["encrypt_%sB" % size] = measure(lambda: encryption.encrypt(value))
+        results["decrypt_%sB" % size] = measure(
+            lambda: encryption.decrypt(encrypted_value)
+        )
+    return results
+
+
+def bench_key_derivation():
+    """Key derivation time, with and without the key cache."""
+
+    def uncached():
+        encryption.clear_key_cache()
+        encryption._compute_key()
+
+    return {
+        "compute_key_uncached": measure(uncached),
+        "compute_key_cached": measure(encryption._compute_key),
+    }
+
+
+def build_template(count):
+    """Return a template with count placeholders and the values to render it."""
+    template = RawConfigParser()
+    values = {}
+    for index in range(count):
+        section = "SECTION_%s" % (index // 50)
+        if not template.has_section(section):
+            template.add_section(section)
+            values[section] = {}
+        value_type = (
+            "ENCRYPTED_USER_VALUE" if index % ENCRYPTED_EVERY == 0 else "USER_VALUE"
+        )
+        template.set(section, "key_%s" % index, "{ %s }" % value_type)
+        values[section]["key_%s" % index] = "value %s" % index
+    template.add_section("DJANGO")
+    template.set("DJANGO", "key", "{ DJANGO_SECRET_KEY }")
+    return template, values
+
+
+def bench_generation():
+    """Render time by number of placeholders in the template."""
+    results = {}
+    for count in PLACEHOLDER_COUNTS:
+        template, values = build_template(count)
+        results["render_%s_placeholders" % count] = measure(
+            lambda: generation.render_settings(template, values)
+        )
+    return results
+
+
+def bench_overlays():
+    """Merge time of OVERLAY_COUNT overlays of a 1000 placeholders template."""
+    directory = tempfile.mkdtemp()
+    try:
+        base, _ = build_template(1000)
+        base_path = os.path.join(directory, "base.ini")
+        with open(base_path, "w") as base_file:
+            base.write(base_file)
+        overlay_paths = []
+        for index in range(OVERLAY_COUNT):
+            overlay_paths.append(os.path.join(directory, "overlay_%s.ini" % index))
+            with open(overlay_paths[-1], "w") as overlay_file:
+                overlay_file.write("[SECTION_0]\nkey_1 = variant %s\n" % index)
+
+        def merge_all():
+            for overlay_path in overlay_paths:
+                template.merge_templates(base_path, [overlay_path])
+
+        def merge_all_uncached():
+            template.clear_template_cache()
+            merge_all()
+
+        return {
+            "merge_%s_overlays_uncached" % OVERLAY_COUNT: measure(merge_all_uncached),
+            "merge_%s_overlays_cached" % OVERLAY_COUNT: measure(merge_all),
+        }
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_import():
+    """Import time of the encryption modules, in a new interpreter."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ, PYTHONPATH=root)
+    results = {}
+    for module in ("encryption", "decryption"):
+        code = (
+            "import time; start = time.time(); "
+            "import django_settings_custom.%s; "
+            "print(time.time() - start)" % module
+        )
+        durations = [
+            float(
+                subprocess.check_output([sys.executable, "-c", code], env=environment)
+            )
+            for _ in range(IMPORT_REPEAT)
+        ]
+        results["import_%s" % module] = min(durations)
+    return results
+
+
+BENCHMARKS = (
+    bench_encryption,
+    bench_key_derivation,
+    bench_generation,
+    bench_overlays,
+    bench_import,
+)
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the results compared with the baseline.
+
+    Returns:
+        list: Names of the results slower than the baseline by more than threshold.
+    """
+    regressions = []
+    for name, duration in sorted(results.items()):
+        reference = baseline.get(name)
+        if reference is None:
+            print("%-32s %12.3f us %10s" % (name, duration * 1e6, "new"))
+            continue
+        ratio = duration / reference - 1
+        flag = ""
+        if ratio > threshold:
+            flag = "REGRESSION"
+            regressions.append(name)
+        print("%-32s %12.3f us %+9.1f%% %s" % (name, duration * 1e6, ratio * 100, flag))
+    return regressions
+
+
+def main():
+    """Run the benchmarks, store and compare the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--output", help="Write the results in this JSON file.")
+    parser.add_argument("--compare", help="Compare with this baseline JSON file.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Accepted slowdown compared with the baseline (default to 0.2).",
+    )
+    options = parser.parse_args()
+
+    results = {}
+    for benchmark in BENCHMARKS:
+        results.update(benchmark())
+
+    if options.output:
+        with open(options.output, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as baseline:
+            regressions = compare(results, json.load(baseline), options.threshold)
+        if regressions:
+            sys.exit(1)
+    else:
+        for name, duration in sorted(results.items()):
+            print("%-32s %12.3f us" % (name, duration * 1e6))
+
+
+if __name__ == "__main__":
+    main()
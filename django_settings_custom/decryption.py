@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+"""
+.. module:: decryption
+   :synopsis: Decrypt-only module, fast to import.
+
+Example:
+    from django_settings_custom import decryption
+
+    password = decryption.decrypt(config.get("DATABASE_CREDENTIALS", "PASSWORD"))
+
+This module only imports the standard library: the AES backend is imported on the
+first decryption and Django settings only when they are needed (no secret key
+passed as parameter) or already loaded. The encryption module provides the same
+functions with the rest of the API.
+"""
+import binascii
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+from django_settings_custom import stats
+
+KEY_CACHE_SIZE = 32
+GCM_PREFIX = "$gcm$"
+GCM_NONCE_SIZE = 12
+GCM_TAG_SIZE = 16
+SIV_PREFIX = "$siv$"
+SIV_TAG_SIZE = 16
+BLOCK_SIZE = 16
+KEY_ID_PREFIX = "$kid$"
+KEY_ID_SIZE = 8
+
+_key_cache = OrderedDict()
+_key_cache_lock = threading.Lock()
+_default_keyring = (None, None)
+
+
+def _get_settings(required=True):
+    """
+    Return Django settings, imported on first use.
+
+    Args:
+        required (bool): Import Django settings if they are not loaded yet ?
+
+    Returns:
+        The settings, or None if they are not required and not loaded yet.
+    """
+    if not required and "django.conf" not in sys.modules:
+        return None
+    from django.conf import settings
+
+    return settings
+
+
+class PyCryptodomeBackend(object):
+    """AES backend based on the pycryptodome package."""
+
+    name = "pycryptodome"
+
+    def __init__(self):
+        from Crypto.Cipher import AES
+
+        self.aes = AES
+
+    def cbc_encrypt(self, key, iv_block, data):
+        """Encrypt padded data with AES-CBC."""
+        return self.aes.new(key, self.aes.MODE_CBC, iv_block).encrypt(data)
+
+    def cbc_decrypt(self, key, iv_block, data):
+        """Decrypt data with AES-CBC, without removing the padding."""
+        return self.aes.new(key, self.aes.MODE_CBC, iv_block).decrypt(data)
+
+    def gcm_encrypt(self, key, nonce, data):
+        """Encrypt data with AES-GCM, return the encrypted data and its tag."""
+        cipher = self.aes.new(key, self.aes.MODE_GCM, nonce=nonce, mac_len=GCM_TAG_SIZE)
+        return cipher.encrypt_and_digest(data)
+
+    def gcm_decrypt(self, key, nonce, data, tag):
+        """Decrypt data with AES-GCM, raise ValueError if the tag is wrong."""
+        cipher = self.aes.new(key, self.aes.MODE_GCM, nonce=nonce, mac_len=GCM_TAG_SIZE)
+        return cipher.decrypt_and_verify(data, tag)
+
+    def siv_encrypt(self, key, data):
+        """Encrypt data with AES-SIV, return the synthetic IV and the encrypted data."""
+        data, tag = self.aes.new(key, self.aes.MODE_SIV).encrypt_and_digest(data)
+        return tag + data
+
+    def siv_decrypt(self, key, data):
+        """Decrypt data with AES-SIV, raise ValueError if the synthetic IV is wrong."""
+        cipher = self.aes.new(key, self.aes.MODE_SIV)
+        return cipher.decrypt_and_verify(data[SIV_TAG_SIZE:], data[:SIV_TAG_SIZE])
+
+
+class CryptographyBackend(object):
+    """AES backend based on the cryptography package (OpenSSL)."""
+
+    name = "cryptography"
+
+    def __init__(self):
+        from cryptography.exceptions import InvalidTag
+        from cryptography.hazmat.backends import default_backend
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        self.invalid_tag = InvalidTag
+        self.openssl = default_backend()
+        self.cipher = Cipher
+        self.algorithm = algorithms.AES
+        self.cbc = modes.CBC
+        self.aesgcm = AESGCM
+        try:
+            from cryptography.hazmat.primitives.ciphers.aead import AESSIV
+        except ImportError:  # cryptography < 35
+            AESSIV = None
+        self.aessiv = AESSIV
+
+    def _cbc_cipher(self, key, iv_block):
+        """Return an AES-CBC cipher."""
+        return self.cipher(self.algorithm(key), self.cbc(iv_block), self.openssl)
+
+    def cbc_encrypt(self, key, iv_block, data):
+        """Encrypt padded data with AES-CBC."""
+        encryptor = self._cbc_cipher(key, iv_block).encryptor()
+        return encryptor.update(data) + encryptor.finalize()
+
+    def cbc_decrypt(self, key, iv_block, data):
+        """Decrypt data with AES-CBC, without removing the padding."""
+        decryptor = self._cbc_cipher(key, iv_block).decryptor()
+        return decryptor.update(data) + decryptor.finalize()
+
+    def gcm_encrypt(self, key, nonce, data):
+        """Encrypt data with AES-GCM, return the encrypted data and its tag."""
+        data = self.aesgcm(key).encrypt(nonce, data, None)
+        return data[:-GCM_TAG_SIZE], data[-GCM_TAG_SIZE:]
+
+    def gcm_decrypt(self, key, nonce, data, tag):
+        """Decrypt data with AES-GCM, raise ValueError if the tag is wrong."""
+        try:
+            return self.aesgcm(key).decrypt(nonce, data + tag, None)
+        except self.invalid_tag:
+            raise ValueError("MAC check failed")
+
+    def _siv_cipher(self, key):
+        """Return an AES-SIV cipher."""
+        if self.aessiv is None:
+            raise ValueError("AES-SIV needs cryptography 35 or later.")
+        return self.aessiv(key)
+
+    def siv_encrypt(self, key, data):
+        """Encrypt data with AES-SIV, return the synthetic IV and the encrypted data."""
+        return self._siv_cipher(key).encrypt(data, None)
+
+    def siv_decrypt(self, key, data):
+        """Decrypt data with AES-SIV, raise ValueError if the synthetic IV is wrong."""
+        try:
+            return self._siv_cipher(key).decrypt(data, None)
+        except self.invalid_tag:
+            raise ValueError("MAC check failed")
+
+
+BACKENDS = OrderedDict(
+    [
+        (CryptographyBackend.name, CryptographyBackend),
+        (PyCryptodomeBackend.name, PyCryptodomeBackend),
+    ]
+)
+
+_backend = None
+_default_backend = None
+
+
+def available_backends():
+    """
+    List the backends which can be used.
+
+    Returns:
+        list of str: Names of the installed backends, by order of preference.
+    """
+    names = []
+    for name, backend_class in BACKENDS.items():
+        try:
+            backend_class()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def set_backend(name=None):
+    """
+    Select the AES backend.
+
+    Args:
+        name (str): Name of a backend of BACKENDS, or None for the first
+            installed one.
+
+    Returns:
+        The selected backend.
+
+    Raises:
+        ImportError: If the backend (or any backend, without name) is not installed.
+    """
+    global _backend
+    if name is not None:
+        if name not in BACKENDS:
+            raise ImportError("Unknown encryption backend %s." % name)
+        _backend = BACKENDS[name]()
+        return _backend
+    _backend = _first_backend()
+    return _backend
+
+
+def _first_backend():
+    """Return the first installed backend of BACKENDS."""
+    for backend_class in BACKENDS.values():
+        try:
+            return backend_class()
+        except ImportError:
+            continue
+    raise ImportError(
+        "No encryption backend, install one of: %s." % ", ".join(BACKENDS)
+    )
+
+
+def get_backend():
+    """
+    Return the AES backend, selecting it on first use.
+
+    The backend is settings.SETTINGS_ENCRYPTION_BACKEND when it is defined,
+    or the first installed one of BACKENDS.
+
+    While Django settings are not configured, which is the case while settings.py
+    itself is executed, the setting can't be read: the first installed backend is
+    used, and the setting is read on the first call once settings are configured.
+    To decrypt values in settings.py with a given backend, call set_backend first.
+    """
+    global _default_backend
+    if _backend is not None:
+        return _backend
+    settings = _get_settings(required=False)
+    if settings is not None and settings.configured:
+        return set_backend(getattr(settings, "SETTINGS_ENCRYPTION_BACKEND", None))
+    if _default_backend is None:
+        _default_backend = _first_backend()
+    return _default_backend
+
+
+def clear_key_cache():
+    """
+    Remove every derived key from the process-wide key cache.
+    """
+    with _key_cache_lock:
+        _key_cache.clear()
+
+
+@stats.timed("compute_key")
+def _compute_key(secret_key=None):
+    """
+    Compute a valid key for AES crypto algorithm.
+
+    Args:
+        secret_key (str): The key for encryption, or None if you want use the SECRET_KEY.
+
+    Returns:
+        byte string: A valid key for AES.
+
+    If the secret_key is not provided, it uses Django settings.SECRET_KEY.
+    Derived keys are cached by secret key, so changing settings.SECRET_KEY
+    naturally uses a new entry. The cache keeps at most KEY_CACHE_SIZE keys.
+    """
+    if secret_key is None:
+        secret_key = _get_settings().SECRET_KEY
+    if isinstance(secret_key, bytearray):
+        secret_key = bytes(secret_key)
+    with _key_cache_lock:
+        key = _key_cache.pop(secret_key, None)
+        if key is not None:
+            _key_cache[secret_key] = key
+            return key
+    raw_key = secret_key
+    if not isinstance(raw_key, bytes):
+        raw_key = raw_key.encode()
+    key = hashlib.sha256(raw_key).digest()
+    with _key_cache_lock:
+        _key_cache[secret_key] = key
+        while len(_key_cache) > KEY_CACHE_SIZE:
+            _key_cache.popitem(last=False)
+    return key
+
+
+def _key_id(key):
+    """Return the key ID of an already computed AES key."""
+    return hashlib.sha256(b"key id:" + key).hexdigest()[:KEY_ID_SIZE]
+
+
+def _siv_key(key):
+    """Return the AES-SIV key (two AES-256 keys) of an already computed AES key."""
+    return hashlib.sha512(b"siv key:" + key).digest()
+
+
+def get_key_id(secret_key=None):
+    """
+    Return the default ID of a secret key, a fingerprint which does not reveal it.
+
+    Args:
+        secret_key (str): The key, or None if you want use the SECRET_KEY.
+
+    Returns:
+        str: KEY_ID_SIZE hexadecimal characters.
+    """
+    return _key_id(_compute_key(secret_key))
+
+
+def get_keyring():
+    """
+    Return the secret keys usable to decrypt values carrying a key ID.
+
+    Returns:
+        dict: Secret key by key ID. It is settings.SETTINGS_KEYRING when it is
+            defined, or else the SECRET_KEY and the SECRET_KEY_FALLBACKS by their
+            default ID (see get_key_id).
+
+    The default keyring is built again only when the secret keys change. It is
+    empty while Django settings are not configured, e.g. in settings.py itself:
+    to decrypt values carrying a key ID there, pass a keyring to decrypt.
+    """
+    global _default_keyring
+    settings = _get_settings(required=False)
+    if settings is None or not settings.configured:
+        return {}
+    keyring = getattr(settings, "SETTINGS_KEYRING", None)
+    if keyring is not None:
+        return keyring
+    secret_keys = [settings.SECRET_KEY]
+    secret_keys.extend(getattr(settings, "SECRET_KEY_FALLBACKS", None) or [])
+    cached_keys, keyring = _default_keyring
+    if cached_keys != secret_keys:
+        keyring = {get_key_id(secret_key): secret_key for secret_key in secret_keys}
+        _default_keyring = (secret_keys, keyring)
+    return keyring
+
+
+def _split_key_id(source):
+    """
+    Split an encrypted value in its key ID and the value itself.
+
+    Returns:
+        tuple: The key ID, or None if the value does not carry one, and the value.
+    """
+    if not source.startswith(KEY_ID_PREFIX):
+        return None, source
+    key_id, separator, value = source[len(KEY_ID_PREFIX) :].partition("$")
+    if not separator:
+        raise ValueError("Error in decryption.")
+    return key_id, value
+
+
+def _find_key(key_id, secret_key=None, keyring=None):
+    """
+    Return the AES key of a key ID.
+
+    Args:
+        key_id (str): The key ID read in an encrypted value.
+        secret_key (str): The key passed to decrypt, used if key_id is its default ID.
+        keyring (dict): Secret key by key ID, or None to use get_keyring.
+
+    Returns:
+        byte string: A valid key for AES.
+
+    Raises:
+        ValueError: If no key has this ID.
+    """
+    if secret_key is not None:
+        key = _compute_key(secret_key)
+        if _key_id(key) == key_id:
+            return key
+    if keyring is None:
+        keyring = get_keyring()
+    if key_id in keyring:
+        return _compute_key(keyring[key_id])
+    raise ValueError("Unknown key ID %s." % key_id)
+
+
+def _decrypt_with_key(source, key):
+    """
+    Decrypt the source with an already computed AES key.
+
+    Args:
+        source (str): The encrypted value.
+        key (byte string): A valid key for AES, see _compute_key.
+
+    Returns:
+        str: Decrypted value.
+
+    The integrity of MODE_GCM and MODE_SIV values is checked with their
+    authentication tag.
+    """
+    backend = get_backend()
+    if source.startswith(SIV_PREFIX):
+        source = binascii.a2b_base64(source[len(SIV_PREFIX) :].encode("latin-1"))
+        if len(source) < SIV_TAG_SIZE:
+            raise ValueError("Error in decryption.")
+        return backend.siv_decrypt(_siv_key(key), source).decode("utf-8")
+    if source.startswith(GCM_PREFIX):
+        source = binascii.a2b_base64(source[len(GCM_PREFIX) :].encode("latin-1"))
+        if len(source) < GCM_NONCE_SIZE + GCM_TAG_SIZE:
+            raise ValueError("Error in decryption.")
+        data = backend.gcm_decrypt(
+            key,
+            source[:GCM_NONCE_SIZE],
+            source[GCM_NONCE_SIZE:-GCM_TAG_SIZE],
+            source[-GCM_TAG_SIZE:],
+        )
+        return data.decode("utf-8")
+    source = binascii.a2b_base64(source.encode("latin-1"))
+    if len(source) < 2 * BLOCK_SIZE or len(source) % BLOCK_SIZE:
+        raise ValueError("Error in decryption.")
+    iv_block = source[:BLOCK_SIZE]
+    data = backend.cbc_decrypt(key, iv_block, source[BLOCK_SIZE:]).decode("utf-8")
+    padding = ord(data[-1])
+    if data[-padding:] != (bytearray([padding]) * padding).decode("utf-8"):
+        raise ValueError("Error in decryption.")
+    return data[:-padding]
+
+
+@stats.timed("decrypt")
+def decrypt(source, secret_key=None, keyring=None):
+    """
+    Decrypt the source with the key passed as parameter.
+
+    Args:
+        source (str or byte string): A string or a bytes array to decrypt.
+        secret_key (str): The key for encryption, or None if you want use the SECRET_KEY.
+        keyring (dict): Secret key by key ID for the values carrying a key ID,
+            or None to use get_keyring.
+
+    Returns:
+        str: Decrypted value.
+
+    If the secret_key is not provided, it uses Django settings.SECRET_KEY.
+    """
+    key_id, source = _split_key_id(source)
+    if key_id is None:
+        return _decrypt_with_key(source, _compute_key(secret_key))
+    return _decrypt_with_key(source, _find_key(key_id, secret_key, keyring))
+
+
+@stats.timed("decrypt_many")
+def decrypt_many(sources, secret_key=None, keyring=None):
+    """
+    Decrypt several values with the key passed as parameter.
+
+    Args:
+        sources (iterable of str): The encrypted values.
+        secret_key (str): The key for encryption, or None if you want use the SECRET_KEY.
+        keyring (dict): Secret key by key ID for the values carrying a key ID,
+            or None to use get_keyring.
+
+    Returns:
+        list of str: Decrypted values, in the order of sources.
+
+    Each key is derived only once for the whole batch.
+    If the secret_key is not provided, it uses Django settings.SECRET_KEY.
+    """
+    keys = {}
+    values = []
+    for source in sources:
+        key_id, source = _split_key_id(source)
+        key = keys.get(key_id)
+        if key is None:
+            if key_id is None:
+                key = _compute_key(secret_key)
+            else:
+                key = _find_key(key_id, secret_key, keyring)
+            keys[key_id] = key
+        values.append(_decrypt_with_key(source, key))
+    return values
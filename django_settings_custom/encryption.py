@@ -2,80 +2,415 @@
 """
 .. module:: encryption
    :synopsis: Module to encrypt / decrypt values.
+
+Three formats are supported, all decrypted by decrypt:
+
+- MODE_CBC (default): base64 of the IV and the AES-CBC encrypted value.
+- MODE_GCM: "$gcm$" followed by the base64 of the nonce, the AES-GCM encrypted
+  value and its authentication tag.
+- MODE_SIV: "$siv$" followed by the base64 of the synthetic IV and the AES-SIV
+  encrypted value. This deterministic encryption gives the same value for the same
+  plain text and key, so equal values can be compared without decryption (which
+  also reveals that they are equal).
+
+These formats can be wrapped as "$kid$<key ID>$<value>" to record the ID of the key
+used (see get_key_id), decrypt then reads the key of this ID in the keyring instead
+of the secret key passed as parameter.
+
+With envelope encryption, the values of a settings file are encrypted with a random
+data key, stored in the file wrapped (encrypted) by the secret key in the
+DATA_KEY_SECTION section (see wrap_key and read_data_key).
+
+Large values, like files, are encrypted as binary streams by encrypt_stream: a
+header followed by chunks of STREAM_CHUNK_SIZE bytes, each one encrypted with
+AES-GCM and authenticated, so memory use does not depend on the size of the value.
+
+AES is provided by a backend: "cryptography" (OpenSSL) or "pycryptodome". Both
+produce the same format, the first one installed is used unless
+settings.SETTINGS_ENCRYPTION_BACKEND or set_backend selects another one.
+
+Decryption functions come from the decryption module, which is faster to import.
 """
 
 import base64
+import functools
+import os
+import struct
 
 import six
-from Crypto import Random
-from Crypto.Cipher import AES
-from Crypto.Hash import SHA256
 
-from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 
+from django_settings_custom import stats
+from django_settings_custom.decryption import (  # noqa: F401
+    BACKENDS,
+    BLOCK_SIZE,
+    GCM_NONCE_SIZE,
+    GCM_PREFIX,
+    GCM_TAG_SIZE,
+    KEY_CACHE_SIZE,
+    KEY_ID_PREFIX,
+    KEY_ID_SIZE,
+    SIV_PREFIX,
+    SIV_TAG_SIZE,
+    CryptographyBackend,
+    PyCryptodomeBackend,
+    _compute_key,
+    _decrypt_with_key,
+    _key_cache,
+    _key_id,
+    _siv_key,
+    _split_key_id,
+    available_backends,
+    clear_key_cache,
+    decrypt,
+    decrypt_many,
+    get_backend,
+    get_key_id,
+    get_keyring,
+    set_backend,
+)
+from django_settings_custom.template import ENCRYPTED_VALUE_TYPES, compile_template
 
-def _compute_key(secret_key=None):
+MODE_CBC = "cbc"
+MODE_GCM = "gcm"
+MODE_SIV = "siv"
+MODES = (MODE_CBC, MODE_GCM, MODE_SIV)
+DATA_KEY_SECTION = "DJANGO_SETTINGS_CUSTOM"
+DATA_KEY_OPTION = "data_key"
+STREAM_MAGIC = b"DSCE"
+STREAM_VERSION = 1
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+STREAM_NONCE_PREFIX_SIZE = 7
+STREAM_HEADER_SIZE = len(STREAM_MAGIC) + 5 + STREAM_NONCE_PREFIX_SIZE
+
+
+@stats.timed("encrypt")
+def encrypt(source, secret_key=None, mode=MODE_CBC, key_id=None):
     """
-    Compute a valid key for AES crypto algorithm.
+    Encrypt the source with the key passed as parameter.
 
     Args:
+        source (str or byte string): A string or a bytes array to encrypt.
         secret_key (str): The key for encryption, or None if you want use the SECRET_KEY.
+        mode (str): MODE_CBC, MODE_GCM for authenticated encryption, or MODE_SIV
+            for deterministic authenticated encryption.
+        key_id (str): ID of the key to write in the value (e.g. get_key_id()),
+            or None to write no key ID.
 
     Returns:
-        byte string: A valid key for AES.
+        str: Encrypted value.
 
     If the secret_key is not provided, it uses Django settings.SECRET_KEY.
     """
-    if secret_key is None:
-        secret_key = settings.SECRET_KEY
-    if isinstance(secret_key, six.string_types):
-        secret_key = secret_key.encode()
-    return SHA256.new(bytearray(secret_key)).digest()
+    value = _encrypt_with_key(source, _compute_key(secret_key), mode)
+    if key_id is None:
+        return value
+    if not key_id or "$" in key_id:
+        raise ValueError("Invalid key ID %s." % key_id)
+    return KEY_ID_PREFIX + key_id + "$" + value
 
 
-def encrypt(source, secret_key=None):
+def get_mode(source):
     """
-    Encrypt the source with the key passed as parameter.
+    Return the encryption mode of an encrypted value.
+
+    Args:
+        source (str): The encrypted value.
+
+    Returns:
+        str: MODE_GCM, MODE_SIV or MODE_CBC.
+    """
+    source = _split_key_id(source)[1]
+    if source.startswith(GCM_PREFIX):
+        return MODE_GCM
+    return MODE_SIV if source.startswith(SIV_PREFIX) else MODE_CBC
+
+
+def _encrypt_with_key(source, key, mode=MODE_CBC):
+    """
+    Encrypt the source with an already computed AES key.
 
     Args:
         source (str or byte string): A string or a bytes array to encrypt.
-        secret_key (str): The key for encryption, or None if you want use the SECRET_KEY.
+        key (byte string): A valid key for AES, see _compute_key.
+        mode (str): MODE_CBC, MODE_GCM or MODE_SIV.
 
     Returns:
         str: Encrypted value.
-
-    If the secret_key is not provided, it uses Django settings.SECRET_KEY.
     """
     if isinstance(source, six.string_types):
         source = source.encode()
-    key = _compute_key(secret_key)
-    iv_block = Random.new().read(AES.block_size)
-    cipher = AES.new(key, AES.MODE_CBC, iv_block)
-    padding = AES.block_size - len(source) % AES.block_size
-    source += bytearray([padding]) * padding
-    data = iv_block + cipher.encrypt(source)
+    backend = get_backend()
+    if mode == MODE_SIV:
+        data = backend.siv_encrypt(_siv_key(key), bytes(source))
+        return SIV_PREFIX + base64.b64encode(data).decode("latin-1")
+    if mode == MODE_GCM:
+        nonce = os.urandom(GCM_NONCE_SIZE)
+        data, tag = backend.gcm_encrypt(key, nonce, bytes(source))
+        return GCM_PREFIX + base64.b64encode(nonce + data + tag).decode("latin-1")
+    if mode != MODE_CBC:
+        raise ValueError("Unknown encryption mode %s." % mode)
+    iv_block = os.urandom(BLOCK_SIZE)
+    padding = BLOCK_SIZE - len(source) % BLOCK_SIZE
+    source = bytes(source + bytearray([padding]) * padding)
+    data = iv_block + backend.cbc_encrypt(key, iv_block, source)
     return base64.b64encode(data).decode("latin-1")
 
 
-def decrypt(source, secret_key=None):
+def reencrypt_many(sources, old_secret_key, new_secret_key, mode=None):
     """
-    Decrypt the source with the key passed as parameter.
+    Decrypt values with a key and encrypt them again with another key.
 
     Args:
-        source (str or byte string): A string or a bytes array to decrypt.
+        sources (iterable of str): The values encrypted with old_secret_key.
+        old_secret_key (str): The key used to encrypt sources.
+        new_secret_key (str): The key for the new encryption.
+        mode (str): Encryption mode of the new values, or None to keep the mode
+            of each value.
+
+    Returns:
+        list of str: Values encrypted with new_secret_key, in the order of sources.
+
+    Each key is derived only once for the whole batch. Values carrying a key ID
+    get the default ID of new_secret_key.
+    """
+    old_key = _compute_key(old_secret_key)
+    new_key = _compute_key(new_secret_key)
+    new_key_id = _key_id(new_key)
+    values = []
+    for source in sources:
+        key_id, data = _split_key_id(source)
+        value = _encrypt_with_key(
+            _decrypt_with_key(data, old_key), new_key, mode or get_mode(data)
+        )
+        if key_id is not None:
+            value = KEY_ID_PREFIX + new_key_id + "$" + value
+        values.append(value)
+    return values
+
+
+def wrap_key(data_key, secret_key=None):
+    """
+    Encrypt a data key with the secret key, for envelope encryption.
+
+    Args:
+        data_key (str): The key encrypting the values of a settings file.
         secret_key (str): The key for encryption, or None if you want use the SECRET_KEY.
 
     Returns:
-        str: Decrypted value.
+        str: The wrapped data key, a MODE_GCM value.
+    """
+    return encrypt(data_key, secret_key, MODE_GCM)
 
-    If the secret_key is not provided, it uses Django settings.SECRET_KEY.
+
+def unwrap_key(wrapped_key, secret_key=None):
+    """
+    Decrypt a data key wrapped by wrap_key.
+
+    Args:
+        wrapped_key (str): The wrapped data key.
+        secret_key (str): The key for encryption, or None if you want use the SECRET_KEY.
+
+    Returns:
+        str: The data key.
     """
-    key = _compute_key(secret_key)
-    source = base64.b64decode(source.encode("latin-1"))
-    iv_block = source[: AES.block_size]
-    cipher = AES.new(key, AES.MODE_CBC, iv_block)
-    data = cipher.decrypt(source[AES.block_size :]).decode("utf-8")
-    padding = ord(data[-1])
-    if data[-padding:] != (bytearray([padding]) * padding).decode("utf-8"):
+    return decrypt(wrapped_key, secret_key)
+
+
+def read_data_key(config, secret_key=None):
+    """
+    Return the key of the encrypted values of a settings file.
+
+    Args:
+        config (RawConfigParser): The configuration read from the settings file.
+        secret_key (str): The key for encryption, or None if you want use the SECRET_KEY.
+
+    Returns:
+        str: The unwrapped data key of a file using envelope encryption,
+            or else secret_key.
+    """
+    if config.has_option(DATA_KEY_SECTION, DATA_KEY_OPTION):
+        return unwrap_key(config.get(DATA_KEY_SECTION, DATA_KEY_OPTION), secret_key)
+    return secret_key
+
+
+def _read_exactly(source, size):
+    """Read size bytes of a binary file object, or less at the end of the file."""
+    data = source.read(size)
+    while data and len(data) < size:
+        more = source.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+def _read_chunks(source, chunk_size):
+    """Yield (chunk, is the last chunk ?) for the content of a binary file object."""
+    chunk = _read_exactly(source, chunk_size)
+    while True:
+        next_chunk = _read_exactly(source, chunk_size)
+        if not next_chunk:
+            yield chunk, True
+            return
+        yield chunk, False
+        chunk = next_chunk
+
+
+def _chunk_nonce(prefix, index, last):
+    """Return the AES-GCM nonce of a stream chunk."""
+    if index > 0xFFFFFFFF:
+        raise ValueError("Stream too large for encryption.")
+    return prefix + struct.pack(">IB", index, 1 if last else 0)
+
+
+def _write_chunks(target, key, chunks, chunk_size):
+    """Encrypt (chunk, last) pairs and write the stream to a binary file object."""
+    backend = get_backend()
+    prefix = os.urandom(STREAM_NONCE_PREFIX_SIZE)
+    target.write(STREAM_MAGIC + struct.pack(">BI", STREAM_VERSION, chunk_size) + prefix)
+    for index, (chunk, last) in enumerate(chunks):
+        data, tag = backend.gcm_encrypt(key, _chunk_nonce(prefix, index, last), chunk)
+        target.write(data)
+        target.write(tag)
+
+
+def _decrypt_chunks(source, key):
+    """Yield the chunk size of a stream, then (chunk, last) for its content."""
+    header = _read_exactly(source, STREAM_HEADER_SIZE)
+    magic_size = len(STREAM_MAGIC)
+    if len(header) != STREAM_HEADER_SIZE or header[:magic_size] != STREAM_MAGIC:
+        raise ValueError("Error in decryption.")
+    version, chunk_size = struct.unpack(">BI", header[magic_size : magic_size + 5])
+    if version != STREAM_VERSION or not 0 < chunk_size <= STREAM_MAX_CHUNK_SIZE:
         raise ValueError("Error in decryption.")
-    return data[:-padding]
+    prefix = header[magic_size + 5 :]
+    yield chunk_size
+    backend = get_backend()
+    blocks = _read_chunks(source, chunk_size + GCM_TAG_SIZE)
+    for index, (block, last) in enumerate(blocks):
+        if len(block) < GCM_TAG_SIZE:
+            raise ValueError("Error in decryption.")
+        nonce = _chunk_nonce(prefix, index, last)
+        yield backend.gcm_decrypt(
+            key, nonce, block[:-GCM_TAG_SIZE], block[-GCM_TAG_SIZE:]
+        ), last
+
+
+@stats.timed("encrypt_stream")
+def encrypt_stream(source, target, secret_key=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Encrypt a binary stream chunk by chunk.
+
+    Args:
+        source (file object): Binary file object to encrypt, read until its end.
+        target (file object): Binary file object receiving the encrypted stream.
+        secret_key (str): The key for encryption, or None if you want use the SECRET_KEY.
+        chunk_size (int): Size of the encrypted chunks, at most STREAM_MAX_CHUNK_SIZE.
+
+    Only two chunks are held in memory, whatever the size of the source.
+    """
+    if not 0 < chunk_size <= STREAM_MAX_CHUNK_SIZE:
+        raise ValueError("Invalid chunk size %s." % chunk_size)
+    _write_chunks(
+        target, _compute_key(secret_key), _read_chunks(source, chunk_size), chunk_size
+    )
+
+
+@stats.timed("decrypt_stream")
+def decrypt_stream(source, target, secret_key=None):
+    """
+    Decrypt a binary stream written by encrypt_stream, chunk by chunk.
+
+    Args:
+        source (file object): Binary file object with the encrypted stream.
+        target (file object): Binary file object receiving the decrypted content.
+        secret_key (str): The key for encryption, or None if you want use the SECRET_KEY.
+
+    Raises:
+        ValueError: If the stream is not valid, altered or truncated. Each chunk is
+            checked before it is written, but the chunks before the error are
+            already written in target.
+    """
+    chunks = _decrypt_chunks(source, _compute_key(secret_key))
+    next(chunks)
+    for chunk, _ in chunks:
+        target.write(chunk)
+
+
+def reencrypt_stream(source, target, old_secret_key, new_secret_key):
+    """
+    Decrypt a binary stream and encrypt it again with another key, chunk by chunk.
+
+    Args:
+        source (file object): Binary file object with the encrypted stream.
+        target (file object): Binary file object receiving the new encrypted stream.
+        old_secret_key (str): The key used to encrypt source.
+        new_secret_key (str): The key for the new encryption.
+    """
+    chunks = _decrypt_chunks(source, _compute_key(old_secret_key))
+    chunk_size = next(chunks)
+    _write_chunks(target, _compute_key(new_secret_key), chunks, chunk_size)
+
+
+def decrypt_section(config, section, keys=None, secret_key=None, template=None):
+    """
+    Decrypt the encrypted fields of a configuration section.
+
+    Args:
+        config (RawConfigParser): The configuration read from the settings file.
+        section (str): Section in the configuration file.
+        keys (iterable of str): Keys of the encrypted fields,
+            or None to read them from the template.
+        secret_key (str): The key for encryption, or None if you want use the SECRET_KEY.
+        template (str, RawConfigParser or CompiledTemplate): The settings template,
+            whose encrypted placeholders are the encrypted fields when keys is None.
+
+    Returns:
+        dict: Decrypted values by key.
+
+    Raises:
+        ValueError: If neither keys nor template is given.
+
+    If the secret_key is not provided, it uses Django settings.SECRET_KEY.
+    """
+    if keys is not None:
+        keys = list(keys)
+    elif template is not None:
+        keys = [
+            key
+            for field_section, key in compile_template(template).fields(
+                *ENCRYPTED_VALUE_TYPES
+            )
+            if field_section == section and config.has_option(section, key)
+        ]
+    else:
+        raise ValueError("The keys of the encrypted fields or the template is needed.")
+    values = decrypt_many((config.get(section, key) for key in keys), secret_key)
+    return dict(zip(keys, values))
+
+
+class LazyDecrypt(SimpleLazyObject):
+    """
+    A value decrypted on first access and memoized afterwards.
+
+    Example:
+        DATABASES["default"]["PASSWORD"] = encryption.LazyDecrypt(
+            config.get("DATABASE_CREDENTIALS", "PASSWORD")
+        )
+
+    Args:
+        source (str): The encrypted value.
+        secret_key (str): The key for encryption, or None if you want use the SECRET_KEY.
+
+    If the secret_key is not provided, Django settings.SECRET_KEY is read at
+    the first access, not when the object is created.
+    """
+
+    def __init__(self, source, secret_key=None):
+        self.__dict__["source"] = source
+        super(LazyDecrypt, self).__init__(
+            functools.partial(decrypt, source, secret_key)
+        )
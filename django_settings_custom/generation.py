@@ -0,0 +1,767 @@
+# -*- coding: utf-8 -*-
+"""
+.. module:: generation
+   :synopsis: Module to generate settings files from a template, without prompt.
+
+Example:
+    config, secret_key = generation.render_settings(
+        "path/to/template/settings.ini",
+        {"DATABASE_CREDENTIALS": {"USER": "user", "PASSWORD": "pass"}},
+    )
+    generation.write_settings(config, "target/path/of/settings.ini")
+"""
+
+import collections
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+
+import six
+from six.moves.configparser import DEFAULTSECT, RawConfigParser
+
+from django.core.management.utils import get_random_secret_key
+
+from django_settings_custom import encryption, sources, stats
+from django_settings_custom.template import (
+    ENCRYPTED_VALUE_TYPES,
+    compile_template,
+    section_items,
+)
+
+SIDECAR_SUFFIX = ".enc"
+MASK = "********"
+
+Change = collections.namedtuple("Change", ["section", "key", "old", "new"])
+Properties = collections.namedtuple(
+    "Properties", ["values", "encrypted_fields", "file_fields", "django_keys"]
+)
+
+
+class ExistingValue(six.text_type):
+    """
+    A value kept as written in an existing settings file.
+
+    Returned by the get_value function of read_properties, it is neither encrypted
+    again nor, for an "ENCRYPTED_FILE" field (the name of its blob), read as a file.
+    """
+
+
+_replace = getattr(os, "replace", os.rename)
+
+
+def generate_secret_key():
+    """Return a new Django secret key usable in a settings file."""
+    return get_random_secret_key().replace("%", "0")
+
+
+def parse_template(template):
+    """
+    Parse a settings template.
+
+    Args:
+        template (str, RawConfigParser or CompiledTemplate): Path to the template,
+            or an already parsed template.
+
+    Returns:
+        RawConfigParser: The parsed template, shared with the template cache when
+            template is a path (see template.compile_template).
+    """
+    if isinstance(template, RawConfigParser):
+        return template
+    return compile_template(template).config
+
+
+def copy_config(config):
+    """
+    Copy a parsed configuration, to fill it without modifying the original.
+
+    Args:
+        config (RawConfigParser): The configuration to copy.
+
+    Returns:
+        RawConfigParser: A new configuration with the same sections and values.
+    """
+    copy = RawConfigParser()
+    for key, value in config.defaults().items():
+        copy.set(DEFAULTSECT, key, value)
+    for section in config.sections():
+        copy.add_section(section)
+        for key, value in section_items(config, section):
+            copy.set(section, key, value)
+    return copy
+
+
+def get_placeholders(template):
+    """
+    List the placeholders of a template.
+
+    Args:
+        template (str, RawConfigParser or CompiledTemplate): The settings template.
+
+    Returns:
+        list: (section, key, value_type) of each placeholder, in template order.
+    """
+    return [
+        (placeholder.section, placeholder.key, placeholder.value_type)
+        for placeholder in compile_template(template).placeholders
+    ]
+
+
+def sidecar_path(settings_file_path, section, key):
+    """
+    Return the path of the encrypted blob of an "ENCRYPTED_FILE" field.
+
+    Args:
+        settings_file_path (str): Path to the settings file.
+        section (str): Section of the field.
+        key (str): Key of the field.
+
+    Returns:
+        str: A path next to the settings file.
+    """
+    return "%s.%s.%s%s" % (
+        settings_file_path,
+        section.lower(),
+        key.lower(),
+        SIDECAR_SUFFIX,
+    )
+
+
+def _write_temporary(path, write):
+    """
+    Write a binary file readable by its owner only, next to path.
+
+    Args:
+        path (str): Target path for the file, its directory is created.
+        write (callable): Function writing the content in the binary file object
+            passed as parameter.
+
+    Returns:
+        str: Path of the temporary file, to rename to path. It is removed if write
+            fails.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    file_descriptor, temporary = tempfile.mkstemp(
+        prefix=".%s." % os.path.basename(path), dir=directory or "."
+    )
+    try:
+        with os.fdopen(file_descriptor, "wb") as blob_file:
+            write(blob_file)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return temporary
+
+
+def _write_blob(path, write):
+    """
+    Write a binary file readable by its owner only, creating its directory.
+
+    Args:
+        path (str): Target path for the file.
+        write (callable): Function writing the content in the binary file object
+            passed as parameter.
+
+    The file is written in a temporary file renamed afterwards.
+    """
+    temporary = _write_temporary(path, write)
+    try:
+        _replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+class _HashWriter(object):
+    """Binary file object computing the SHA256 of the data written in it."""
+
+    def __init__(self):
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        """Add data to the hash."""
+        self.hash.update(data)
+
+
+def blob_matches(blob_path, source_path, secret_key=None):
+    """
+    Check if a blob holds the content of a file.
+
+    Args:
+        blob_path (str): Path to the blob (see encrypt_files).
+        source_path (str): Path to the file.
+        secret_key (str): The key of the blob, or None if you want use the
+            SECRET_KEY.
+
+    Returns:
+        bool: True if both files exist, the blob can be decrypted with secret_key
+            and its content is the content of the file.
+    """
+    if not os.path.isfile(blob_path) or not os.path.isfile(source_path):
+        return False
+    decrypted = _HashWriter()
+    try:
+        with open(blob_path, "rb") as blob_file:
+            encryption.decrypt_stream(blob_file, decrypted, secret_key)
+    except (ValueError, IndexError, TypeError):
+        return False
+    source = _HashWriter()
+    with open(source_path, "rb") as source_file:
+        for chunk in iter(lambda: source_file.read(encryption.STREAM_CHUNK_SIZE), b""):
+            source.write(chunk)
+    return decrypted.hash.digest() == source.hash.digest()
+
+
+def encrypt_files(properties, file_fields, settings_file_path, secret_key=None):
+    """
+    Encrypt the files of "ENCRYPTED_FILE" fields in blobs next to the settings file.
+
+    Args:
+        properties (dict): Values by key, by section. The value of each file field
+            is the path of the file to encrypt.
+        file_fields (list): (section, key) of the "ENCRYPTED_FILE" fields.
+        settings_file_path (str): Path to the settings file.
+        secret_key (str): The key for encryption, or None if you want use the
+            SECRET_KEY (the data key with envelope encryption).
+
+    Returns:
+        dict: The properties with the blob file name (relative to the settings
+            file directory) as value of each file field.
+
+    Raises:
+        ValueError: If a file doesn't exist.
+
+    Files are encrypted with encryption.encrypt_stream, so they are never fully
+    loaded in memory.
+    """
+    properties = {section: dict(values) for section, values in properties.items()}
+    for section, key in file_fields:
+        source_path = properties[section][key]
+        if not os.path.isfile(source_path):
+            raise ValueError(
+                "The file %s of [%s] %s doesn't exists." % (source_path, section, key)
+            )
+        blob_path = sidecar_path(settings_file_path, section, key)
+        with open(source_path, "rb") as source_file:
+            _write_blob(
+                blob_path,
+                lambda blob_file: encryption.encrypt_stream(
+                    source_file, blob_file, secret_key
+                ),
+            )
+        properties[section][key] = os.path.basename(blob_path)
+    return properties
+
+
+def encrypt_values(
+    properties,
+    encrypted_fields,
+    secret_key=None,
+    max_retry=3,
+    mode=encryption.MODE_CBC,
+):
+    """
+    Encrypt the fields of properties and check they can be decrypted.
+
+    Args:
+        properties (dict): Values by key, by section.
+        encrypted_fields (list): (section, key) of the values to encrypt.
+        secret_key (str): The key for encryption, or None to generate one.
+        max_retry (int): Number of new keys to try when a value can't be decrypted.
+        mode (str): Encryption mode, see the encryption module. MODE_GCM and
+            MODE_SIV values are authenticated and not decrypted again to be checked.
+
+    Returns:
+        tuple: The properties with encrypted values and the secret key used.
+
+    Raises:
+        ValueError: If no key can encrypt and decrypt all values.
+    """
+    retry = 0
+    encrypted_properties = {
+        section: dict(values) for section, values in properties.items()
+    }
+    if secret_key is None and not encrypted_fields:
+        secret_key = generate_secret_key()
+    while retry <= max_retry and encrypted_fields:
+        if secret_key is None:
+            secret_key = generate_secret_key()
+        try:
+            for section, key in encrypted_fields:
+                value = encryption.encrypt(properties[section][key], secret_key, mode)
+                if mode == encryption.MODE_CBC:
+                    encryption.decrypt(value, secret_key)
+                encrypted_properties[section][key] = value
+            retry = max_retry
+        except ValueError:
+            stats.record("encrypt_values.retry")
+            secret_key = None
+        retry += 1
+
+    if secret_key is None:
+        raise ValueError(
+            "Error while encoding / decoding passwords with the secret key."
+            "Retried %s. Generation cancelled." % max_retry
+        )
+    return encrypted_properties, secret_key
+
+
+def fill_settings(
+    template,
+    properties,
+    encrypted_fields,
+    django_keys,
+    secret_key=None,
+    max_retry=3,
+    mode=encryption.MODE_CBC,
+    data_key=None,
+):
+    """
+    Encrypt values and fill a copy of the template with them.
+
+    Args:
+        template (str, RawConfigParser or CompiledTemplate): The settings template.
+        properties (dict): Values by key, by section, for each placeholder.
+        encrypted_fields (list): (section, key) of the values to encrypt.
+        django_keys (list): (section, key) of the fields receiving the secret key.
+        secret_key (str): The key for encryption, or None to generate one.
+        max_retry (int): Number of new keys to try when a value can't be decrypted.
+        mode (str): Encryption mode, see the encryption module.
+        data_key (str): A data key for envelope encryption (e.g. a new
+            generate_secret_key()), or None to encrypt values with the secret key.
+            The data key is written wrapped by the secret key in the configuration.
+
+    Returns:
+        tuple: The filled configuration and the secret key used.
+
+    Raises:
+        ValueError: If no key can encrypt and decrypt all values.
+    """
+    if data_key is None:
+        properties, secret_key = encrypt_values(
+            properties, encrypted_fields, secret_key, max_retry, mode
+        )
+    else:
+        properties, data_key = encrypt_values(
+            properties, encrypted_fields, data_key, max_retry, mode
+        )
+        if secret_key is None:
+            secret_key = generate_secret_key()
+    for section, key in django_keys:
+        properties[section][key] = secret_key
+    config = copy_config(parse_template(template))
+    for section, values in properties.items():
+        for key, value in values.items():
+            config.set(section, key, value)
+    if data_key is not None:
+        if not config.has_section(encryption.DATA_KEY_SECTION):
+            config.add_section(encryption.DATA_KEY_SECTION)
+        config.set(
+            encryption.DATA_KEY_SECTION,
+            encryption.DATA_KEY_OPTION,
+            encryption.wrap_key(data_key, secret_key),
+        )
+    return config, secret_key
+
+
+def read_properties(template, get_value, source_values=None):
+    """
+    Get a value for every placeholder of a template, and list the fields to fill.
+
+    Args:
+        template (str, RawConfigParser or CompiledTemplate): The settings template.
+        get_value (callable): Function called with (section, key, value_type) for
+            the "USER_VALUE", "ENCRYPTED_USER_VALUE" and "ENCRYPTED_FILE"
+            placeholders, returning the value, an ExistingValue or None if the
+            value is missing.
+        source_values (dict): Values of the source placeholders by (section, key),
+            or None to read them (see sources.resolve_sources).
+
+    Returns:
+        Properties: The values by key, by section (None for the "DJANGO_SECRET_KEY"
+            fields), and the (section, key) of the values to encrypt, of the
+            "ENCRYPTED_FILE" fields whose file is to encrypt and of the
+            "DJANGO_SECRET_KEY" fields.
+
+    Raises:
+        ValueError: If values are missing or can't be read from their source.
+    """
+    compiled = compile_template(template)
+    if source_values is None:
+        source_values = sources.resolve_sources(compiled.placeholders)
+    properties = Properties({}, [], [], [])
+    missing_values = []
+    for section, key, value_type, _, _ in compiled.placeholders:
+        section_values = properties.values.setdefault(section, {})
+        value = None
+        if value_type == "DJANGO_SECRET_KEY":
+            properties.django_keys.append((section, key))
+        elif sources.get_source_type(value_type) is not None:
+            value = source_values[(section, key)]
+        else:
+            value = get_value(section, key, value_type)
+            if value is None:
+                missing_values.append((section, key))
+        section_values[key] = value
+        if value is None or isinstance(value, ExistingValue):
+            continue
+        if value_type in ENCRYPTED_VALUE_TYPES:
+            properties.encrypted_fields.append((section, key))
+        elif value_type == "ENCRYPTED_FILE":
+            properties.file_fields.append((section, key))
+    if missing_values:
+        raise ValueError(
+            "Missing values for:\n%s"
+            % "\n".join("[%s] %s" % field for field in missing_values)
+        )
+    return properties
+
+
+def render_settings(
+    template,
+    values,
+    secret_key=None,
+    mode=encryption.MODE_CBC,
+    envelope=False,
+    settings_file_path=None,
+):
+    """
+    Render a settings template with the values passed as parameter.
+
+    Args:
+        template (str, RawConfigParser or CompiledTemplate): Path to the template,
+            or an already parsed template which is not modified.
+        values (dict): Values by key, by section, for the "USER_VALUE" and
+            "ENCRYPTED_USER_VALUE" placeholders (case insensitive). The values of
+            the "ENV_VALUE", "FILE_VALUE" and "COMMAND_VALUE" placeholders are read
+            from their source (see the sources module).
+        secret_key (str): The key for encryption, or None to generate one.
+        mode (str): Encryption mode, see the encryption module.
+        envelope (bool): Encrypt values with a new data key wrapped by the secret
+            key (see fill_settings) ?
+        settings_file_path (str): Target path for the settings file, needed if the
+            template has "ENCRYPTED_FILE" placeholders: their files are encrypted
+            next to it (see encrypt_files).
+
+    Returns:
+        tuple: The filled configuration and the secret key written in the
+            "DJANGO_SECRET_KEY" fields and used for encryption.
+
+    Raises:
+        ValueError: If values are missing or can't be read from their source, or in
+            case of encryption error.
+    """
+    compiled = compile_template(template)
+    answers = {}
+    for section, section_values in values.items():
+        for key, value in section_values.items():
+            answers[(section.upper(), key.upper())] = value
+
+    def get_value(section, key, value_type):
+        value = answers.get((section.upper(), key.upper()))
+        return value if value is None else six.text_type(value)
+
+    properties = read_properties(compiled, get_value)
+    values = properties.values
+    data_key = generate_secret_key() if envelope else None
+    # A key given by the caller is never replaced by a new one.
+    max_retry = 0 if secret_key is not None else 3
+    if properties.file_fields:
+        if not settings_file_path:
+            raise ValueError(
+                "A settings file path is needed for ENCRYPTED_FILE placeholders."
+            )
+        if secret_key is None:
+            secret_key = generate_secret_key()
+        values = encrypt_files(
+            values, properties.file_fields, settings_file_path, data_key or secret_key
+        )
+        max_retry = 0
+    return fill_settings(
+        compiled,
+        values,
+        properties.encrypted_fields,
+        properties.django_keys,
+        secret_key,
+        max_retry,
+        mode,
+        data_key,
+    )
+
+
+def settings_to_string(config):
+    """
+    Return the content of the settings file for a filled configuration.
+
+    Args:
+        config (RawConfigParser): The filled configuration.
+
+    Returns:
+        str: The settings file content.
+    """
+    output = six.StringIO()
+    config.write(output)
+    return output.getvalue()
+
+
+def _create_file(directory, prefix):
+    """
+    Create a new file named prefix and a random suffix, with the mode open() gives.
+
+    Returns:
+        tuple: The file descriptor, opened for writing, and the path of the file.
+    """
+    for _ in range(tempfile.TMP_MAX):
+        path = os.path.join(directory, prefix + uuid.uuid4().hex[:8])
+        try:
+            return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), path
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+    raise IOError(errno.EEXIST, "No usable temporary file name found.")
+
+
+def write_settings(config, settings_file_path):
+    """
+    Write a filled configuration in a settings file, creating its directory.
+
+    Args:
+        config (RawConfigParser): The filled configuration.
+        settings_file_path (str): Target path for the settings file.
+
+    The file is written in a temporary file renamed afterwards, so readers see
+    either the previous or the new content. An existing file keeps its mode.
+    """
+    settings_directory = os.path.dirname(settings_file_path)
+    if settings_directory and not os.path.exists(settings_directory):
+        os.makedirs(settings_directory)
+    prefix = ".%s." % os.path.basename(settings_file_path)
+    exists = os.path.exists(settings_file_path)
+    if exists:
+        file_descriptor, temporary = tempfile.mkstemp(
+            prefix=prefix, dir=settings_directory or "."
+        )
+    else:
+        file_descriptor, temporary = _create_file(settings_directory or ".", prefix)
+    try:
+        with os.fdopen(file_descriptor, "w") as config_file:
+            config.write(config_file)
+        if exists:
+            shutil.copymode(settings_file_path, temporary)
+        _replace(temporary, settings_file_path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def _values_key(config, compiled, secret_key=None):
+    """Return the key of the encrypted values of a configuration, or None."""
+    if secret_key is None:
+        for field in compiled.fields("DJANGO_SECRET_KEY"):
+            if config.has_option(*field):
+                secret_key = config.get(*field)
+    if not secret_key:
+        return None
+    try:
+        return encryption.read_data_key(config, secret_key)
+    except (ValueError, IndexError, TypeError):
+        return None
+
+
+def _same_encrypted_value(old_value, old_key, new_value, new_key):
+    """Return True if two encrypted values have the same mode and plain text."""
+    if old_value == new_value:
+        return True
+    if old_key is None or new_key is None:
+        return False
+    if encryption.get_mode(old_value) != encryption.get_mode(new_value):
+        return False
+    try:
+        return encryption.decrypt(old_value, old_key) == encryption.decrypt(
+            new_value, new_key
+        )
+    except (ValueError, IndexError, TypeError):
+        return False
+
+
+@stats.timed("diff_settings")
+def diff_settings(config, settings_file_path, template, secret_key=None):
+    """
+    Compare a filled configuration with the settings file it would replace.
+
+    Args:
+        config (RawConfigParser): The filled configuration.
+        settings_file_path (str): Path to the settings file, which may not exist.
+        template (str, RawConfigParser or CompiledTemplate): The settings template,
+            to know the encrypted and secret key fields.
+        secret_key (str): The secret key of config, or None to read it in its
+            "DJANGO_SECRET_KEY" fields.
+
+    Returns:
+        list of Change: The added (old is None), removed (new is None) and changed
+            fields. Values of encrypted and secret key fields are masked.
+
+    Encrypted fields are compared decrypted, so a value encrypted again with a new
+    IV or a new data key is not a change, while a new encryption mode is. The
+    blobs of "ENCRYPTED_FILE" fields are compared by name only.
+    """
+    compiled = compile_template(template)
+    encrypted_fields = set(compiled.fields(*ENCRYPTED_VALUE_TYPES))
+    secret_fields = encrypted_fields | set(compiled.fields("DJANGO_SECRET_KEY"))
+    secret_fields.add((encryption.DATA_KEY_SECTION, encryption.DATA_KEY_OPTION))
+    existing = RawConfigParser()
+    if os.path.exists(settings_file_path):
+        existing.read(settings_file_path)
+    old_key = _values_key(existing, compiled)
+    new_key = _values_key(config, compiled, secret_key)
+
+    def show(field, value):
+        return MASK if value is not None and field in secret_fields else value
+
+    changes = []
+    sections = config.sections()
+    sections += [section for section in existing.sections() if section not in sections]
+    for section in sections:
+        old_values = (
+            dict(existing.items(section)) if existing.has_section(section) else {}
+        )
+        new_values = dict(config.items(section)) if config.has_section(section) else {}
+        keys = sorted(set(old_values) | set(new_values))
+        for key in keys:
+            field = (section, key)
+            old_value, new_value = old_values.get(key), new_values.get(key)
+            if old_value is not None and new_value is not None:
+                if section == encryption.DATA_KEY_SECTION:
+                    continue
+                if field in encrypted_fields:
+                    if _same_encrypted_value(old_value, old_key, new_value, new_key):
+                        continue
+                elif old_value == new_value:
+                    continue
+            changes.append(
+                Change(section, key, show(field, old_value), show(field, new_value))
+            )
+    return changes
+
+
+def write_settings_if_changed(config, settings_file_path, template, secret_key=None):
+    """
+    Write a filled configuration in a settings file, only if it changes its values.
+
+    Args:
+        config (RawConfigParser): The filled configuration.
+        settings_file_path (str): Target path for the settings file.
+        template (str, RawConfigParser or CompiledTemplate): The settings template.
+        secret_key (str): The secret key of config, or None to read it in its
+            "DJANGO_SECRET_KEY" fields.
+
+    Returns:
+        list of Change: The changes (see diff_settings), the file is not touched
+            when there is none.
+    """
+    changes = diff_settings(config, settings_file_path, template, secret_key)
+    if changes:
+        write_settings(config, settings_file_path)
+    return changes
+
+
+def rotate_settings(
+    settings_file_path, template, new_secret_key=None, old_secret_key=None, mode=None
+):
+    """
+    Encrypt again the encrypted fields of a settings file with a new secret key.
+
+    Args:
+        settings_file_path (str): Path to the settings file.
+        template (str, RawConfigParser or CompiledTemplate): The settings template,
+            to know the encrypted and secret key fields.
+        new_secret_key (str): The new key, or None to generate one (only if the
+            file has a "DJANGO_SECRET_KEY" field to write it).
+        old_secret_key (str): The current key, or None to read it in the
+            "DJANGO_SECRET_KEY" field of the file.
+        mode (str): Encryption mode of the new values, or None to keep the mode
+            of each value.
+
+    Returns:
+        str: The new secret key, also written in the "DJANGO_SECRET_KEY" fields.
+
+    With envelope encryption, only the data key is wrapped again with the new key,
+    values are not encrypted again (and mode is ignored). Otherwise, the blobs of
+    the "ENCRYPTED_FILE" fields are encrypted again too: in temporary files, which
+    replace the blobs once the settings file is written, so nothing is changed if
+    a blob can't be encrypted again.
+
+    Raises:
+        ValueError: If the current key is unknown or can't decrypt the values, or
+            if no new key is given for a file without "DJANGO_SECRET_KEY" field.
+    """
+    compiled = compile_template(template)
+    config = RawConfigParser()
+    config.read(settings_file_path)
+    django_keys = [
+        field
+        for field in compiled.fields("DJANGO_SECRET_KEY")
+        if config.has_option(*field)
+    ]
+    if old_secret_key is None and django_keys:
+        old_secret_key = config.get(*django_keys[0])
+    if not old_secret_key:
+        raise ValueError("The secret key of %s is unknown." % settings_file_path)
+    if new_secret_key is None:
+        if not django_keys:
+            raise ValueError(
+                "%s has no secret key field, a new secret key is needed."
+                % settings_file_path
+            )
+        new_secret_key = generate_secret_key()
+
+    new_blobs = []
+    try:
+        if config.has_option(encryption.DATA_KEY_SECTION, encryption.DATA_KEY_OPTION):
+            data_key = encryption.read_data_key(config, old_secret_key)
+            config.set(
+                encryption.DATA_KEY_SECTION,
+                encryption.DATA_KEY_OPTION,
+                encryption.wrap_key(data_key, new_secret_key),
+            )
+        else:
+            encrypted_fields = [
+                field
+                for field in compiled.fields(*ENCRYPTED_VALUE_TYPES)
+                if config.has_option(*field)
+            ]
+            values = encryption.reencrypt_many(
+                [config.get(*field) for field in encrypted_fields],
+                old_secret_key,
+                new_secret_key,
+                mode,
+            )
+            for (section, key), value in zip(encrypted_fields, values):
+                config.set(section, key, value)
+            directory = os.path.dirname(settings_file_path)
+            for field in compiled.fields("ENCRYPTED_FILE"):
+                if config.has_option(*field):
+                    blob_path = os.path.join(directory, config.get(*field))
+                    with open(blob_path, "rb") as blob_file:
+                        temporary = _write_temporary(
+                            blob_path,
+                            lambda new_blob_file: encryption.reencrypt_stream(
+                                blob_file, new_blob_file, old_secret_key, new_secret_key
+                            ),
+                        )
+                    new_blobs.append((temporary, blob_path))
+        for section, key in django_keys:
+            config.set(section, key, new_secret_key)
+        write_settings(config, settings_file_path)
+    except BaseException:
+        for temporary, _ in new_blobs:
+            os.remove(temporary)
+        raise
+    for temporary, blob_path in new_blobs:
+        _replace(temporary, blob_path)
+    return new_secret_key
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+.. module:: loader
+   :synopsis: Module to read a settings file generated by generate_settings.
+"""
+import collections
+import os
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+
+from django_settings_custom import encryption, snapshot
+from django_settings_custom.template import (
+    ENCRYPTED_VALUE_TYPES,
+    VARIABLE_REGEX,
+    compile_template,
+    merge_templates,
+    parse_tag,
+)
+
+try:
+    from types import MappingProxyType
+except ImportError:  # Python 2
+    MappingProxyType = dict
+
+ParsedSettings = collections.namedtuple(
+    "ParsedSettings", ["raw_values", "values", "encrypted_fields", "key"]
+)
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def clear_cache():
+    """
+    Remove every parsed settings file from the loader cache.
+    """
+    with _cache_lock:
+        _cache.clear()
+
+
+def freeze_cache():
+    """
+    Make the values of the loader cache read-only.
+
+    Returns:
+        int: Number of cached settings files.
+
+    Each cached dict is replaced by a read-only mapping of read-only sections, so
+    callers sharing the cache can't modify it (see prefork.warm_settings). It does
+    not keep memory pages shared after a fork. On Python 2, values are not made
+    read-only.
+    """
+    with _cache_lock:
+        for cache_key, (stamp, values) in list(_cache.items()):
+            _cache[cache_key] = (stamp, _freeze(values))
+        return len(_cache)
+
+
+def _freeze(values):
+    """Return a read-only mapping of read-only sections."""
+    return MappingProxyType(
+        {section: MappingProxyType(dict(items)) for section, items in values.items()}
+    )
+
+
+def _file_stamp(path):
+    """Return what identifies a version of the file: its mtime and its size."""
+    if path is None:
+        return None
+    stat = os.stat(path)
+    return stat.st_mtime, stat.st_size
+
+
+def get_template_fields(settings_template_file, use_snapshot=False, overlays=()):
+    """
+    Read the tagged fields of a settings template.
+
+    Args:
+        settings_template_file (str): Path to the settings template file.
+        use_snapshot (bool): Read the template from its binary snapshot, if it
+            was written beforehand (see snapshot.write_snapshot) ? The snapshot of a
+            template is never written here. Ignored with overlays.
+        overlays (iterable): Paths to the overlays of the template, see
+            template.merge_templates.
+
+    Returns:
+        dict: Tag (e.g. "ENCRYPTED_USER_VALUE") by (section, key).
+    """
+    if overlays or not use_snapshot:
+        return {
+            (placeholder.section, placeholder.key): placeholder.value_type
+            for placeholder in merge_templates(
+                settings_template_file, overlays
+            ).placeholders
+        }
+    template_values = snapshot.read_values(
+        settings_template_file, use_snapshot, refresh=False
+    )
+    fields = {}
+    for section, items in template_values.items():
+        for key, value in items.items():
+            match_groups = VARIABLE_REGEX.match(value)
+            if match_groups:
+                fields[(section, key)] = parse_tag(match_groups.group(1))[0]
+    return fields
+
+
+def _parse(
+    settings_file_path,
+    settings_template_file,
+    secret_key,
+    use_snapshot,
+    previous=None,
+    overlays=(),
+):
+    """
+    Parse the settings file and decrypt its encrypted fields.
+
+    Args:
+        settings_file_path (str): Path to the settings file.
+        settings_template_file (str): Path to the settings template file, or None.
+        secret_key (str): The key for decryption, or None (see load_settings).
+        use_snapshot (bool): Read the files from their binary snapshot ?
+        previous (ParsedSettings): A previous parse of the file. Encrypted fields
+            whose encrypted value and key did not change are not decrypted again.
+        overlays (iterable): Paths to the overlays of the template.
+
+    Returns:
+        ParsedSettings: The values as written in the file (raw_values), the values
+            with encrypted fields decrypted (values), the (section, key) of the
+            encrypted fields and the key used to decrypt them.
+    """
+    raw_values = snapshot.read_values(settings_file_path, use_snapshot)
+    values = {section: dict(items) for section, items in raw_values.items()}
+    wrapped_key = values.pop(encryption.DATA_KEY_SECTION, {}).get(
+        encryption.DATA_KEY_OPTION
+    )
+    fields = (
+        get_template_fields(settings_template_file, use_snapshot, overlays)
+        if settings_template_file
+        else {}
+    )
+
+    directory = os.path.dirname(os.path.abspath(settings_file_path))
+    encrypted_fields = []
+    for (section, key), value_type in fields.items():
+        if key not in values.get(section, {}):
+            continue
+        if value_type in ENCRYPTED_VALUE_TYPES:
+            encrypted_fields.append((section, key))
+        elif value_type == "ENCRYPTED_FILE":
+            values[section][key] = os.path.join(directory, values[section][key])
+        elif value_type == "DJANGO_SECRET_KEY" and secret_key is None:
+            secret_key = values[section][key]
+
+    if not encrypted_fields:
+        return ParsedSettings(raw_values, values, frozenset(), None)
+    if wrapped_key:
+        secret_key = encryption.unwrap_key(wrapped_key, secret_key)
+    if previous is not None and previous.key == secret_key:
+        changed_fields = []
+        for section, key in encrypted_fields:
+            raw_value = raw_values[section][key]
+            if (section, key) in previous.encrypted_fields and (
+                previous.raw_values[section][key] == raw_value
+            ):
+                values[section][key] = previous.values[section][key]
+            else:
+                changed_fields.append((section, key))
+    else:
+        changed_fields = encrypted_fields
+    decrypted_values = encryption.decrypt_many(
+        (values[section][key] for section, key in changed_fields), secret_key
+    )
+    for (section, key), value in zip(changed_fields, decrypted_values):
+        values[section][key] = value
+    return ParsedSettings(raw_values, values, frozenset(encrypted_fields), secret_key)
+
+
+def load_settings(
+    settings_file_path=None,
+    settings_template_file=None,
+    secret_key=None,
+    use_snapshot=None,
+    template_overlays=None,
+):
+    """
+    Read a settings file generated by generate_settings and decrypt its values.
+
+    Args:
+        settings_file_path (str): Path to the settings file,
+            or None if you want use settings.SETTINGS_FILE_PATH.
+        settings_template_file (str): Path to the settings template file used to
+            know the encrypted fields,
+            or None if you want use settings.SETTINGS_TEMPLATE_FILE.
+        secret_key (str): The key for decryption, or None to use the value of the
+            DJANGO_SECRET_KEY field of the file, or else the SECRET_KEY.
+        use_snapshot (bool): Read the files from their binary snapshot (see
+            the snapshot module), or None if you want use settings.SETTINGS_SNAPSHOT.
+        template_overlays (list): Paths to the overlays of the template (see
+            template.merge_templates),
+            or None if you want use settings.SETTINGS_TEMPLATE_OVERLAYS.
+
+    Returns:
+        dict: Values by key, by section. Encrypted fields are decrypted, with the
+            data key of the file when it uses envelope encryption (its section is
+            not returned). "ENCRYPTED_FILE" fields are the absolute path of their
+            blob, to decrypt with encryption.decrypt_stream.
+
+    The result is cached and shared by every call with the same arguments, it must
+    not be modified. The file is parsed again only when the mtime or the size of the
+    settings file, of the template or of its overlays changes.
+    """
+    from django.conf import settings
+
+    if settings_file_path is None and settings.configured:
+        settings_file_path = getattr(settings, "SETTINGS_FILE_PATH", None)
+    if settings_template_file is None and settings.configured:
+        settings_template_file = getattr(settings, "SETTINGS_TEMPLATE_FILE", None)
+    if use_snapshot is None:
+        use_snapshot = settings.configured and getattr(
+            settings, "SETTINGS_SNAPSHOT", False
+        )
+    if template_overlays is None and settings.configured:
+        template_overlays = getattr(settings, "SETTINGS_TEMPLATE_OVERLAYS", None)
+    template_overlays = tuple(template_overlays or ())
+    if not settings_file_path:
+        raise ImproperlyConfigured("Parameter settings_file_path undefined.")
+
+    cache_key = (
+        settings_file_path,
+        settings_template_file,
+        secret_key,
+        template_overlays,
+    )
+    stamp = (
+        _file_stamp(settings_file_path),
+        _file_stamp(settings_template_file),
+        tuple(_file_stamp(overlay) for overlay in template_overlays),
+    )
+    cached = _cache.get(cache_key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    values = _parse(
+        settings_file_path,
+        settings_template_file,
+        secret_key,
+        use_snapshot,
+        overlays=template_overlays,
+    ).values
+    with _cache_lock:
+        _cache[cache_key] = (stamp, values)
+    return values
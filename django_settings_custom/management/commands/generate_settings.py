@@ -1,15 +1,20 @@
 # -*- coding: utf-8 -*-
 """Generate settings command."""
+import csv
 import getpass
+import json
+import multiprocessing
 import os
-import re
 
-from six.moves.configparser import RawConfigParser
+import six
+import yaml
 
 from django.core.management.base import BaseCommand, CommandError
-from django.core.management.utils import get_random_secret_key
 
-from django_settings_custom import encryption
+from django_settings_custom import encryption, generation, snapshot, sources, stats
+from django_settings_custom.template import merge_templates
+
+DEFAULT_ENV_PREFIX = "SETTINGS_"
 
 
 def get_input(text):
@@ -17,6 +22,140 @@ def get_input(text):
     return input(text)
 
 
+def read_answers(answers_file):
+    """
+    Read values from a JSON or YAML answers file.
+
+    Args:
+        answers_file (str): Path to a file like {"SECTION": {"KEY": "value"}}.
+
+    Returns:
+        dict: Values by (SECTION, KEY), upper case.
+    """
+    with open(answers_file) as answers_stream:
+        if answers_file.lower().endswith(".json"):
+            content = json.load(answers_stream)
+        else:
+            content = yaml.safe_load(answers_stream)
+    answers = {}
+    for section, values in (content or {}).items():
+        for key, value in values.items():
+            answers[(section.upper(), key.upper())] = value
+    return answers
+
+
+def read_fleet(fleet_file):
+    """
+    Read the targets of a fleet generation from a CSV or JSON lines file.
+
+    Args:
+        fleet_file (str): Path to the file. Each CSV row has a "path" column and
+            "SECTION.KEY" columns, each JSON line is like
+            {"path": "conf.ini", "SECTION": {"KEY": "value"}}.
+
+    Returns:
+        list: (settings_file_path, answers, error) for each target, answers being
+            values by (SECTION, KEY), upper case. For an invalid row, answers is
+            None, error its message and settings_file_path its path if any, or else
+            its line in the fleet file.
+    """
+    targets = []
+    with open(fleet_file) as fleet_stream:
+        if fleet_file.lower().endswith(".csv"):
+            reader = csv.DictReader(fleet_stream)
+            rows = ((reader.line_num, row) for row in reader)
+        else:
+            rows = (
+                (line_number, line)
+                for line_number, line in enumerate(fleet_stream, 1)
+                if line.strip()
+            )
+        for line_number, row in rows:
+            try:
+                if not isinstance(row, dict):
+                    row = json.loads(row)
+                path, answers = _read_fleet_row(row)
+            except ValueError as error:
+                path = row.get("path") if isinstance(row, dict) else None
+                name = path or "%s line %s" % (fleet_file, line_number)
+                targets.append((name, None, str(error)))
+                continue
+            targets.append((path, answers, None))
+    return targets
+
+
+def _read_fleet_row(row):
+    """
+    Read the path and the answers of a fleet target.
+
+    Args:
+        row (dict): A CSV row, with "SECTION.KEY" columns, or a JSON line, with
+            values by key by section.
+
+    Returns:
+        tuple: The settings file path and the answers by (SECTION, KEY).
+
+    Raises:
+        ValueError: If the row has no path or a value is not in a section.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("The target is not an object.")
+    row = dict(row)
+    path = row.pop("path", None)
+    if not path:
+        raise ValueError("The target has no path.")
+    answers = {}
+    for section, values in row.items():
+        if section is None:
+            raise ValueError("The row has more values than columns.")
+        if not isinstance(values, dict):
+            if "." not in section:
+                raise ValueError("%s is not a SECTION.KEY column." % section)
+            section, key = section.split(".", 1)
+            values = {key: values}
+        for key, value in values.items():
+            answers[(section.upper(), key.upper())] = value
+    return path, answers
+
+
+_fleet_template = None
+
+
+def _init_fleet_worker(settings_template_file, overlays=()):
+    """Parse the template once in each worker of the fleet generation."""
+    global _fleet_template
+    _fleet_template = merge_templates(settings_template_file, overlays)
+
+
+def _render_fleet_target(job):
+    """
+    Encrypt the values of a fleet target and write its settings file.
+
+    Args:
+        job (tuple): (settings_file_path, properties, encrypted_fields, django_keys,
+            encryption mode, envelope encryption ?).
+
+    Returns:
+        tuple: The settings file path and an error message, or None on success.
+    """
+    settings_file_path, properties, encrypted_fields, django_keys, mode, envelope = job
+    try:
+        config, _ = generation.fill_settings(
+            _fleet_template,
+            properties,
+            encrypted_fields,
+            django_keys,
+            mode=mode,
+            data_key=generation.generate_secret_key() if envelope else None,
+        )
+        generation.write_settings(config, settings_file_path)
+    except ValueError as error:
+        return settings_file_path, str(error)
+    except (IOError, OSError) as error:
+        return settings_file_path, error.strerror or str(error)
+    return settings_file_path, None
+
+
 class Command(BaseCommand):
     """
     A Django interactive command for configuration file generation.
@@ -29,6 +168,49 @@ class Command(BaseCommand):
         settings_template_file (str): Path to the settings template file.
         settings_file_path (str): Target path for the created settings file.
         force_secret_key (bool): Generate SECRET_KEY without asking ?
+        write_snapshot (bool): Write the binary snapshot of the created file ?
+        encryption_mode (str): Encryption mode of the values, "cbc", "gcm" or
+            "siv".
+        envelope (bool): Encrypt the values with a data key wrapped by the secret key ?
+        template_overlays (list): Paths to the overlays of the settings template.
+        write_if_changed (bool): Write the settings file only if its values change ?
+
+    Values can also be read from an answers file (--answers) and from environment
+    variables named <prefix><SECTION>_<KEY> (--env-prefix). With --no-input,
+    nothing is prompted: the secret key is generated, an existing file is overridden
+    and every missing value is reported at once.
+
+    With --update, values of the existing settings file are kept (encrypted values
+    are not encrypted again), unless the answers file or the environment gives a
+    value, and only new placeholders, or encrypted placeholders whose value can't be
+    decrypted, are prompted.
+
+    With --fleet, one settings file is generated for each target of a CSV or JSON
+    lines file, without prompt, and values are encrypted by a pool of processes.
+
+    With --envelope, values are encrypted with a random data key per file, written
+    in the file wrapped by the secret key, so rotating the secret key only rewrites
+    the wrapped data key.
+
+    The file whose path is given for an "ENCRYPTED_FILE" placeholder is encrypted
+    in a blob next to the settings file, the placeholder receiving the blob name.
+
+    The values of "ENV_VALUE", "FILE_VALUE" and "COMMAND_VALUE" placeholders (and
+    their "ENCRYPTED_" variants) are read from their source, concurrently, before
+    any prompt (see the sources module). They are read again by --update.
+
+    With --overlay (repeated), the settings template is merged with overlays, in
+    order, whose values are added to the template or replace its values (see
+    template.merge_templates).
+
+    With --dry-run, nothing is written and the changes to the settings file are
+    reported. With --if-changed, the file is only written if its values change,
+    encrypted values being compared decrypted (see generation.diff_settings). Both
+    keep the secret key of the existing file, and the blob of an "ENCRYPTED_FILE"
+    field whose file content did not change.
+
+    With --profile, the time of each phase and the calls of the encryption functions
+    are reported (see the stats module).
     """
 
     help = "A Django interactive command for configuration file generation."
@@ -40,6 +222,11 @@ class Command(BaseCommand):
     settings_template_file = None
     settings_file_path = None
     force_secret_key = None
+    write_snapshot = None
+    encryption_mode = None
+    envelope = None
+    template_overlays = None
+    write_if_changed = None
 
     def __init__(self, *argc, **kwargs):
         super(Command, self).__init__(*argc, **kwargs)
@@ -48,6 +235,16 @@ class Command(BaseCommand):
 
         self.django_keys = []
         self.encrypted_field = []
+        self.file_fields = []
+        self.interactive = True
+        self.answers = {}
+        self.env_prefix = None
+        self.source_values = None
+        self.existing_values = {}
+        self.existing_secret_key = None
+        self.existing_data_key = None
+        self.existing_directory = None
+        self.use_envelope = False
         if self.settings_template_file is None:
             self.default_settings_template_file = (
                 settings.SETTINGS_TEMPLATE_FILE
@@ -75,6 +272,51 @@ class Command(BaseCommand):
         else:
             self.default_force_secret_key = self.force_secret_key
 
+        if self.write_snapshot is None:
+            self.default_write_snapshot = (
+                settings.SETTINGS_SNAPSHOT
+                if hasattr(settings, "SETTINGS_SNAPSHOT")
+                else False
+            )
+        else:
+            self.default_write_snapshot = self.write_snapshot
+
+        if self.encryption_mode is None:
+            self.default_encryption_mode = (
+                settings.SETTINGS_ENCRYPTION_MODE
+                if hasattr(settings, "SETTINGS_ENCRYPTION_MODE")
+                else encryption.MODE_CBC
+            )
+        else:
+            self.default_encryption_mode = self.encryption_mode
+
+        if self.envelope is None:
+            self.default_envelope = (
+                settings.SETTINGS_ENVELOPE
+                if hasattr(settings, "SETTINGS_ENVELOPE")
+                else False
+            )
+        else:
+            self.default_envelope = self.envelope
+
+        if self.template_overlays is None:
+            self.default_template_overlays = (
+                settings.SETTINGS_TEMPLATE_OVERLAYS
+                if hasattr(settings, "SETTINGS_TEMPLATE_OVERLAYS")
+                else []
+            )
+        else:
+            self.default_template_overlays = self.template_overlays
+
+        if self.write_if_changed is None:
+            self.default_write_if_changed = (
+                settings.SETTINGS_WRITE_IF_CHANGED
+                if hasattr(settings, "SETTINGS_WRITE_IF_CHANGED")
+                else False
+            )
+        else:
+            self.default_write_if_changed = self.write_if_changed
+
     def add_arguments(self, parser):
         """
         Add custom arguments to the command.
@@ -95,12 +337,199 @@ class Command(BaseCommand):
             default=self.default_settings_file_path,
             help="Target path for the settings file.",
         )
+        parser.add_argument(
+            "--overlay",
+            action="append",
+            dest="overlays",
+            help="Overlay of the settings template, its values replace the values "
+            "of the template. Can be repeated, applied in order.",
+        )
         parser.add_argument(
             "--force-secretkey",
             action="store_true",
             dest="force_secretkey",
             help="Generate SECRET_KEY without asking.",
         )
+        parser.add_argument(
+            "--snapshot",
+            action="store_true",
+            dest="snapshot",
+            help="Write the binary snapshot of the settings file for fast loading.",
+        )
+        parser.add_argument(
+            "--encryption-mode",
+            dest="encryption_mode",
+            choices=encryption.MODES,
+            default=self.default_encryption_mode,
+            help="Encryption mode of the values: cbc, gcm for authenticated "
+            "encryption, or siv for deterministic authenticated encryption "
+            "(default to %s)." % self.default_encryption_mode,
+        )
+        parser.add_argument(
+            "--envelope",
+            action="store_true",
+            dest="envelope",
+            help="Encrypt the values with a random data key, stored wrapped by the "
+            "secret key.",
+        )
+        parser.add_argument(
+            "--noinput",
+            "--no-input",
+            action="store_false",
+            dest="interactive",
+            help="Do not prompt, read values from the answers file and environment.",
+        )
+        parser.add_argument(
+            "--answers",
+            dest="answers_file",
+            help="JSON or YAML file with values by key, by section.",
+        )
+        parser.add_argument(
+            "--env-prefix",
+            dest="env_prefix",
+            help="Read values from environment variables <prefix><SECTION>_<KEY> "
+            "(default to %s with --no-input)." % DEFAULT_ENV_PREFIX,
+        )
+        parser.add_argument(
+            "--update",
+            action="store_true",
+            dest="update",
+            help="Keep the values of the existing settings file and only ask "
+            "for new ones.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            dest="dry_run",
+            help="Report the changes to the settings file without writing anything.",
+        )
+        parser.add_argument(
+            "--if-changed",
+            action="store_true",
+            dest="if_changed",
+            help="Only write the settings file if its values change.",
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            dest="profile",
+            help="Report the time of each phase and the encryption calls.",
+        )
+        parser.add_argument(
+            "--fleet",
+            dest="fleet_file",
+            help="CSV or JSON lines file with a settings file path and its values "
+            "by row, to generate one settings file by row.",
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            dest="jobs",
+            help="Number of processes for --fleet (default to the number of CPUs).",
+        )
+
+    def get_answer(self, section, key):
+        """
+        Get a value for the [section] key from the environment or the answers file.
+
+        Args:
+            section (str): Section in the configuration file.
+            key (str): Key in the configuration file.
+
+        Returns:
+            str: Value for the [section] key, or None if it is not provided.
+        """
+        if self.env_prefix is not None:
+            variable = ("%s%s_%s" % (self.env_prefix, section, key)).upper()
+            if variable in os.environ:
+                return os.environ[variable]
+        value = self.answers.get((section.upper(), key.upper()))
+        return value if value is None else six.text_type(value)
+
+    def read_existing_values(self, template, settings_file_path):
+        """
+        Read the values, the secret key and the data key of an existing settings file.
+
+        Args:
+            template (CompiledTemplate): The settings template.
+            settings_file_path (str): Path to the existing settings file.
+        """
+        existing_values = snapshot.read_values(settings_file_path, use_snapshot=False)
+        self.existing_directory = os.path.dirname(settings_file_path)
+        self.existing_values = {}
+        for section, values in existing_values.items():
+            for key, value in values.items():
+                self.existing_values[(section.upper(), key.upper())] = value
+        for section, key in template.fields("DJANGO_SECRET_KEY"):
+            secret_key = self.existing_values.get((section.upper(), key.upper()))
+            if secret_key:
+                self.existing_secret_key = secret_key
+        wrapped_key = self.existing_values.get(
+            (encryption.DATA_KEY_SECTION.upper(), encryption.DATA_KEY_OPTION.upper())
+        )
+        if wrapped_key and self.existing_secret_key is not None:
+            try:
+                self.existing_data_key = encryption.unwrap_key(
+                    wrapped_key, self.existing_secret_key
+                )
+            except (ValueError, IndexError, TypeError):
+                pass
+
+    def get_existing_value(self, section, key, to_encrypt):
+        """
+        Get the value of the [section] key in the existing settings file.
+
+        Args:
+            section (str): Section in the configuration file.
+            key (str): Key in the configuration file.
+            to_encrypt (bool): Is the value encrypted in the settings file ?
+
+        Returns:
+            str: The existing value, an ExistingValue still encrypted if to_encrypt,
+                or None if there is no usable value (new key, or a tag changed to
+                encrypted).
+
+        When the file switches to envelope encryption, encrypted values are
+        returned decrypted, to be encrypted again.
+        """
+        value = self.existing_values.get((section.upper(), key.upper()))
+        if value is None:
+            return None
+        decrypted_value = None
+        existing_key = self.existing_data_key or self.existing_secret_key
+        if existing_key is not None:
+            try:
+                decrypted_value = encryption.decrypt(value, existing_key)
+            except (ValueError, IndexError, TypeError):
+                pass
+        if to_encrypt:
+            if decrypted_value is None:
+                return None
+            if self.use_envelope and self.existing_data_key is None:
+                return decrypted_value
+            return generation.ExistingValue(value)
+        return value if decrypted_value is None else decrypted_value
+
+    def get_existing_file(self, section, key):
+        """
+        Get the blob name of the [section] key "ENCRYPTED_FILE" field in the
+        existing settings file.
+
+        Args:
+            section (str): Section in the configuration file.
+            key (str): Key in the configuration file.
+
+        Returns:
+            ExistingValue: The blob name, or None if the blob is missing or was
+                encrypted with the secret key of a file switching to envelope
+                encryption.
+        """
+        value = self.existing_values.get((section.upper(), key.upper()))
+        if not value or (self.use_envelope and self.existing_data_key is None):
+            return None
+        if not os.path.isfile(os.path.join(self.existing_directory, value)):
+            return None
+        return generation.ExistingValue(value)
 
     def get_value(self, section, key, value_type):
         """
@@ -109,30 +538,213 @@ class Command(BaseCommand):
         Args:
             section (str): Section in the configuration file.
             key (str): Key in the configuration file.
-            value_type (str): Value type read in template,
-                must be "DJANGO_SECRET_KEY", "USER_VALUE" or "ENCRYPTED_USER_VALUE".
+            value_type (str): Value type read in template, "USER_VALUE",
+                "ENCRYPTED_USER_VALUE" or "ENCRYPTED_FILE".
+
+        Returns:
+            str: Value for the [section] key, an ExistingValue if it is kept from
+                the existing settings file, or None if it is missing.
+        """
+        value = self.get_answer(section, key)
+        if value is None:
+            if value_type == "ENCRYPTED_FILE":
+                value = self.get_existing_file(section, key)
+            else:
+                value = self.get_existing_value(
+                    section, key, value_type == "ENCRYPTED_USER_VALUE"
+                )
+        if value is not None or not self.interactive:
+            return value
+        if value_type == "ENCRYPTED_FILE":
+            return get_input(
+                "Path of the file for [%s] %s (will be encrypted) : " % (section, key)
+            )
+        if value_type == "ENCRYPTED_USER_VALUE":
+            return getpass.getpass(
+                "Value for [%s] %s (will be encrypted) : " % (section, key)
+            )
+        return get_input("Value for [%s] %s : " % (section, key))
+
+    def read_properties(self, template):
+        """
+        Get a value for every placeholder of the template.
+
+        Args:
+            template (CompiledTemplate): The settings template.
+
+        Returns:
+            dict: Values by key, by section.
+
+        Raises:
+            CommandError: If values are missing (without input only), or can't be
+                read from their source.
+
+        The sources are read on the first call only. The fields to encrypt, the
+        "ENCRYPTED_FILE" fields and the "DJANGO_SECRET_KEY" fields are listed
+        as by generation.read_properties.
+        """
+        try:
+            if self.source_values is None:
+                self.source_values = sources.resolve_sources(template.placeholders)
+            properties = generation.read_properties(
+                template, self.get_value, self.source_values
+            )
+        except ValueError as error:
+            raise CommandError(str(error))
+        self.encrypted_field = properties.encrypted_fields
+        self.file_fields = properties.file_fields
+        self.django_keys = properties.django_keys
+        return properties.values
+
+    def handle_fleet(
+        self,
+        settings_template_file,
+        fleet_file,
+        jobs=None,
+        mode=encryption.MODE_CBC,
+        envelope=False,
+        overlays=(),
+    ):
+        """
+        Generate one settings file for each target of the fleet file.
+
+        Args:
+            settings_template_file (str): Path to the settings template file.
+            fleet_file (str): Path to the CSV or JSON lines file, see read_fleet.
+            jobs (int): Number of processes, or None for the number of CPUs.
+            mode (str): Encryption mode, see the encryption module.
+            envelope (bool): Encrypt the values with a data key per file ?
+            overlays (list): Paths to the overlays of the settings template.
+        """
+        if not os.path.exists(fleet_file):
+            raise CommandError("The fleet file doesn't exists.")
+        self.interactive = False
+        default_answers = self.answers
+        template = merge_templates(settings_template_file, overlays)
+        if template.fields("ENCRYPTED_FILE"):
+            raise CommandError(
+                "ENCRYPTED_FILE placeholders are not supported with --fleet."
+            )
+
+        fleet_jobs = []
+        errors = []
+        for settings_file_path, answers, error in read_fleet(fleet_file):
+            if error:
+                errors.append("%s: %s" % (settings_file_path, error))
+                continue
+            self.answers = dict(default_answers)
+            self.answers.update(answers)
+            try:
+                properties = self.read_properties(template)
+            except CommandError as error:
+                errors.append("%s: %s" % (settings_file_path, error))
+                continue
+            fleet_jobs.append(
+                (
+                    settings_file_path,
+                    properties,
+                    self.encrypted_field,
+                    self.django_keys,
+                    mode,
+                    envelope,
+                )
+            )
+
+        self.stdout.write("** Fleet generation of %s files: **" % len(fleet_jobs))
+        pool = multiprocessing.Pool(
+            jobs, _init_fleet_worker, (settings_template_file, tuple(overlays))
+        )
+        try:
+            for settings_file_path, error in pool.imap_unordered(
+                _render_fleet_target, fleet_jobs
+            ):
+                if error:
+                    errors.append("%s: %s" % (settings_file_path, error))
+                else:
+                    self.stdout.write("Written file at %s" % settings_file_path)
+        finally:
+            pool.close()
+            pool.join()
+
+        if errors:
+            raise CommandError("Fleet generation errors:\n%s" % "\n".join(errors))
+        self.stdout.write(
+            self.style.SUCCESS("Configuration files successfully generated !")
+        )
+
+    def keep_unchanged_blobs(self, properties, settings_file_path, secret_key):
+        """
+        Keep the blobs of the "ENCRYPTED_FILE" fields whose file did not change.
+
+        Args:
+            properties (dict): Values by key, by section, modified in place: the
+                value of a kept field becomes its blob name.
+            settings_file_path (str): Path to the settings file.
+            secret_key (str): The key of the blobs.
 
         Returns:
-            int or str: Value for the [section] key
-        """
-        value = None
-        if value_type == "DJANGO_SECRET_KEY":
-            self.django_keys.append((section, key))
-        elif "USER_VALUE" in value_type:
-            to_encrypt = value_type == "ENCRYPTED_USER_VALUE"
-            if to_encrypt:
-                value = getpass.getpass(
-                    "Value for [%s] %s (will be encrypted) : " % (section, key)
+            list of generation.Change: The fields whose blob must be written.
+
+        Kept fields are removed from the fields to encrypt.
+        """
+        blob_changes = []
+        for section, key in list(self.file_fields):
+            blob_path = generation.sidecar_path(settings_file_path, section, key)
+            if generation.blob_matches(blob_path, properties[section][key], secret_key):
+                properties[section][key] = os.path.basename(blob_path)
+                self.file_fields.remove((section, key))
+            else:
+                old = generation.MASK if os.path.exists(blob_path) else None
+                blob_changes.append(
+                    generation.Change(section, key, old, generation.MASK)
                 )
-                self.encrypted_field.append((section, key))
+        return blob_changes
+
+    def write_changes(self, changes):
+        """
+        Write the changes to the settings file.
+
+        Args:
+            changes (list of generation.Change): The changes, see
+                generation.diff_settings.
+        """
+        self.stdout.write("\n** Changes: **")
+        if not changes:
+            self.stdout.write("No changes.")
+        for section, key, old, new in changes:
+            if old is None:
+                self.stdout.write("+ [%s] %s = %s" % (section, key, new))
+            elif new is None:
+                self.stdout.write("- [%s] %s = %s" % (section, key, old))
             else:
-                value = get_input("Value for [%s] %s : " % (section, key))
-        return value
+                self.stdout.write("~ [%s] %s: %s -> %s" % (section, key, old, new))
+
+    def write_profile(self):
+        """
+        Write the stats collected during the generation.
+        """
+        self.stdout.write("\n** Profile: **")
+        for name, values in sorted(stats.get_stats().items()):
+            self.stdout.write(
+                "%-36s %6s calls %10.3f ms"
+                % (name, values["calls"], values["time"] * 1e3)
+            )
 
     def handle(self, *args, **options):
         """
         Command core.
         """
+        if options.get("profile"):
+            options["profile"] = False
+            previous = stats.enable()
+            stats.reset_stats()
+            try:
+                with stats.timer("generate_settings.total"):
+                    return self.handle(*args, **options)
+            finally:
+                stats.enable(previous)
+                self.write_profile()
+
         settings_template_file = options["settings_template_file"]
         settings_file_path = options["settings_file_path"]
         force_secret_key = options["force_secretkey"]
@@ -142,15 +754,54 @@ class Command(BaseCommand):
             raise CommandError(
                 "Parameter settings_template_file undefined.\nUsage: %s" % self.usage
             )
-        if not settings_file_path:
+        if not settings_file_path and not options.get("fleet_file"):
             raise CommandError(
                 "Parameter settings_file_path undefined.\nUsage: %s" % self.usage
             )
         if not os.path.exists(settings_template_file):
             raise CommandError("The settings template file doesn't exists.")
+        overlays = options.get("overlays") or self.default_template_overlays
+        for overlay in overlays:
+            if not os.path.exists(overlay):
+                raise CommandError("The overlay %s doesn't exists." % overlay)
+        self.interactive = options.get("interactive", True)
+        dry_run = options.get("dry_run", False)
+        write_if_changed = options.get("if_changed") or self.default_write_if_changed
+        encryption_mode = options.get("encryption_mode") or self.default_encryption_mode
+        self.use_envelope = bool(options.get("envelope") or self.default_envelope)
+        self.env_prefix = options.get("env_prefix")
+        if self.env_prefix is None and not self.interactive:
+            self.env_prefix = DEFAULT_ENV_PREFIX
+        if options.get("answers_file"):
+            if not os.path.exists(options["answers_file"]):
+                raise CommandError("The answers file doesn't exists.")
+            self.answers = read_answers(options["answers_file"])
+        if options.get("fleet_file"):
+            return self.handle_fleet(
+                settings_template_file,
+                options["fleet_file"],
+                options.get("jobs"),
+                encryption_mode,
+                self.use_envelope,
+                overlays,
+            )
 
         self.stdout.write("** Configuration file generation: **")
-        if os.path.exists(settings_file_path):
+        with stats.timer("generate_settings.template"):
+            template = merge_templates(settings_template_file, overlays)
+        if options.get("update") and os.path.exists(settings_file_path):
+            with stats.timer("generate_settings.existing_file"):
+                self.read_existing_values(template, settings_file_path)
+            if self.existing_data_key is not None:
+                self.use_envelope = True
+        elif (dry_run or write_if_changed) and os.path.exists(settings_file_path):
+            # Only the keys are kept, so that the same values give the same file.
+            with stats.timer("generate_settings.existing_file"):
+                self.read_existing_values(template, settings_file_path)
+            self.existing_values = {}
+            if not self.use_envelope:
+                self.existing_data_key = None
+        elif os.path.exists(settings_file_path) and self.interactive:
             override = get_input(
                 "A configuration file already exists at %s. "
                 "Would you override it ? (y/N) : " % settings_file_path
@@ -158,71 +809,114 @@ class Command(BaseCommand):
             if override.upper() != "Y":
                 raise CommandError("Generation cancelled.")
 
-        config = RawConfigParser()
-        config.read(settings_template_file)
-
         input_secret_key = False
         secret_key = None
-        if not force_secret_key:
-            generate_secret_key = get_input(
-                "Do you want to generate the secret key for Django ? (Y/n) : "
-            )
-            input_secret_key = generate_secret_key.upper() == "N"
-        if input_secret_key:
-            secret_key = get_input("Enter your secret key : ")
-            if not secret_key:
-                raise CommandError(
-                    "Django secret key is needed for encryption. Generation cancelled."
+        with stats.timer("generate_settings.secret_key"):
+            if self.existing_secret_key is not None:
+                input_secret_key = True
+                secret_key = self.existing_secret_key
+                self.stdout.write("Django secret key read from the existing file.")
+            elif not force_secret_key and self.interactive:
+                generate_secret_key = get_input(
+                    "Do you want to generate the secret key for Django ? (Y/n) : "
                 )
-        else:
-            self.stdout.write("Django secret key generation !")
+                input_secret_key = generate_secret_key.upper() == "N"
+            if input_secret_key and secret_key is None:
+                secret_key = get_input("Enter your secret key : ")
+                if not secret_key:
+                    raise CommandError(
+                        "Django secret key is needed for encryption. "
+                        "Generation cancelled."
+                    )
+            elif not input_secret_key:
+                self.stdout.write("Django secret key generation !")
 
         self.stdout.write("\n** Filling values for configuration file content **")
-        variable_regex = re.compile(r" *{(.+)} *")
-        properties = {}
-        for section in config.sections():
-            properties[section] = {}
-            for key, value in config.items(section):
-                match_groups = variable_regex.match(value)
-                if match_groups:
-                    value_type = match_groups.group(1).strip().upper()
-                    value = self.get_value(section, key, value_type)
-                    properties[section][key] = value
+        with stats.timer("generate_settings.values"):
+            properties = self.read_properties(template)
         max_retry = 0 if input_secret_key else 3
-        retry = 0
-        encrypted_properties = properties.copy()
-        while retry <= max_retry and self.encrypted_field:
+        data_key = self.existing_data_key
+        if data_key is None and self.use_envelope:
+            data_key = generation.generate_secret_key()
+        blob_changes = []
+        if self.file_fields and (dry_run or write_if_changed):
+            if secret_key is None:
+                secret_key = generation.generate_secret_key()
+            max_retry = 0
+            with stats.timer("generate_settings.files"):
+                blob_changes = self.keep_unchanged_blobs(
+                    properties, settings_file_path, data_key or secret_key
+                )
+        if self.file_fields and dry_run:
+            for section, key in self.file_fields:
+                properties[section][key] = os.path.basename(
+                    generation.sidecar_path(settings_file_path, section, key)
+                )
+        elif self.file_fields:
+            # Blobs are encrypted first, the key can't change afterwards.
             if secret_key is None:
-                secret_key = get_random_secret_key().replace("%", "0")
+                secret_key = generation.generate_secret_key()
+            max_retry = 0
             try:
-                for section, key in self.encrypted_field:
-                    value = encryption.encrypt(properties[section][key], secret_key)
-                    encryption.decrypt(value, secret_key)
-                    encrypted_properties[section][key] = value
-                retry = max_retry
-            except ValueError:
-                secret_key = None
-            retry += 1
-
-        if secret_key is None:
-            raise CommandError(
-                "Error while encoding / decoding passwords with the secret key."
-                "Retried %s. Generation cancelled." % max_retry
-            )
+                with stats.timer("generate_settings.files"):
+                    properties = generation.encrypt_files(
+                        properties,
+                        self.file_fields,
+                        settings_file_path,
+                        data_key or secret_key,
+                    )
+            except ValueError as error:
+                raise CommandError(str(error))
+        try:
+            with stats.timer("generate_settings.encryption"):
+                config, secret_key = generation.fill_settings(
+                    template,
+                    properties,
+                    self.encrypted_field,
+                    self.django_keys,
+                    secret_key,
+                    max_retry,
+                    encryption_mode,
+                    data_key,
+                )
+        except ValueError as error:
+            raise CommandError(str(error))
 
-        for section, key in self.django_keys:
-            encrypted_properties[section][key] = secret_key
+        if dry_run or write_if_changed:
+            with stats.timer("generate_settings.diff"):
+                changes = generation.diff_settings(
+                    config, settings_file_path, template, secret_key
+                )
+            changed_fields = set((change.section, change.key) for change in changes)
+            self.write_changes(
+                changes
+                + [
+                    change
+                    for change in blob_changes
+                    if (change.section, change.key) not in changed_fields
+                ]
+            )
+            if dry_run:
+                return
+            if not changes:
+                for change in blob_changes:
+                    self.stdout.write(
+                        "Encrypted file written at %s."
+                        % generation.sidecar_path(
+                            settings_file_path, change.section, change.key
+                        )
+                    )
+                self.stdout.write(
+                    "Configuration file unchanged at %s." % settings_file_path
+                )
+                return
 
-        # Fill config file
-        for section, values in encrypted_properties.items():
-            for key, value in values.items():
-                config.set(section, key, value)
         self.stdout.write("\nWriting file at %s:" % settings_file_path)
-        settings_directory = os.path.dirname(settings_file_path)
-        if not os.path.exists(settings_directory):
-            os.makedirs(settings_directory)
-        with open(settings_file_path, "w") as config_file:
-            config.write(config_file)
+        with stats.timer("generate_settings.write"):
+            generation.write_settings(config, settings_file_path)
+        if options.get("snapshot") or self.default_write_snapshot:
+            with stats.timer("generate_settings.snapshot"):
+                snapshot.write_snapshot(settings_file_path)
         self.stdout.write(
             self.style.SUCCESS("Configuration file successfully generated !")
         )
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""Rotate settings key command."""
+import fnmatch
+import multiprocessing
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_settings_custom import encryption, generation
+from django_settings_custom.template import compile_template
+
+
+def _rotate_file(job):
+    """
+    Rotate the secret key of a settings file.
+
+    Args:
+        job (tuple): (settings_file_path, settings_template_file, new_secret_key,
+            old_secret_key).
+
+    Returns:
+        tuple: The settings file path, an error message or None on success, and the
+            ID of the new key (see encryption.get_key_id) or None on error.
+    """
+    settings_file_path, settings_template_file, new_secret_key, old_secret_key = job
+    try:
+        new_secret_key = generation.rotate_settings(
+            settings_file_path, settings_template_file, new_secret_key, old_secret_key
+        )
+    except (IOError, OSError, ValueError, IndexError, TypeError) as error:
+        return settings_file_path, str(error) or "Error in decryption.", None
+    return settings_file_path, None, encryption.get_key_id(new_secret_key)
+
+
+class Command(BaseCommand):
+    """
+    A Django command to encrypt again the encrypted values of settings files with a
+    new secret key.
+
+    Example:
+        python manage.py rotate_settings_key path/to/settings/directory
+        --template path/to/template/settings.ini
+
+    Each file is decrypted with its DJANGO_SECRET_KEY field (or --old-key), encrypted
+    with --new-key (or a new key generated for each file and written in its
+    DJANGO_SECRET_KEY field, --new-key is needed for files without this field) and
+    written atomically. The ID of the new key of each file is reported. Files are
+    processed in parallel by a pool of processes.
+
+    Attributes:
+        settings_template_file (str): Path to the settings template file.
+        settings_file_path (str): Default settings file to rotate.
+    """
+
+    help = "Encrypt again the values of settings files with a new secret key."
+    usage = (
+        "python manage.py rotate_settings_key "
+        "[path/of/settings.ini or path/of/settings/directory ...] "
+        "[--template path/to/template/settings.ini]"
+    )
+
+    settings_template_file = None
+    settings_file_path = None
+
+    def __init__(self, *argc, **kwargs):
+        super(Command, self).__init__(*argc, **kwargs)
+
+        from django.conf import settings
+
+        if self.settings_template_file is None:
+            self.default_settings_template_file = getattr(
+                settings, "SETTINGS_TEMPLATE_FILE", None
+            )
+        else:
+            self.default_settings_template_file = self.settings_template_file
+
+        if self.settings_file_path is None:
+            self.default_settings_file_path = getattr(
+                settings, "SETTINGS_FILE_PATH", None
+            )
+        else:
+            self.default_settings_file_path = self.settings_file_path
+
+    def add_arguments(self, parser):
+        """
+        Add custom arguments to the command.
+        See python manage.py rotate_settings_key --help.
+        """
+        parser.usage = self.usage
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            type=str,
+            help="Settings files, or directories of settings files.",
+        )
+        parser.add_argument(
+            "--template",
+            dest="settings_template_file",
+            default=self.default_settings_template_file,
+            help="Path to the settings template file.",
+        )
+        parser.add_argument(
+            "--pattern",
+            default="*.ini",
+            help="Pattern of the settings files in directories (default to *.ini).",
+        )
+        parser.add_argument(
+            "--new-key",
+            dest="new_secret_key",
+            help="New secret key for every file (default to a new key by file).",
+        )
+        parser.add_argument(
+            "--old-key",
+            dest="old_secret_key",
+            help="Current secret key (default to the secret key field of each file).",
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            dest="jobs",
+            help="Number of processes (default to the number of CPUs).",
+        )
+
+    def get_settings_files(self, paths, pattern):
+        """
+        List the settings files to rotate.
+
+        Args:
+            paths (list): Settings files or directories.
+            pattern (str): Pattern of the settings files in directories.
+
+        Returns:
+            list: Paths of the settings files.
+        """
+        settings_files = []
+        for path in paths:
+            if os.path.isdir(path):
+                for directory, _, file_names in os.walk(path):
+                    settings_files.extend(
+                        os.path.join(directory, file_name)
+                        for file_name in sorted(fnmatch.filter(file_names, pattern))
+                    )
+            elif os.path.exists(path):
+                settings_files.append(path)
+            else:
+                raise CommandError("The settings file %s doesn't exists." % path)
+        return settings_files
+
+    def handle(self, *args, **options):
+        """
+        Command core.
+        """
+        settings_template_file = options["settings_template_file"]
+        paths = options["paths"] or [
+            path for path in [self.default_settings_file_path] if path
+        ]
+        if not settings_template_file:
+            raise CommandError(
+                "Parameter settings_template_file undefined.\nUsage: %s" % self.usage
+            )
+        if not paths:
+            raise CommandError("Parameter paths undefined.\nUsage: %s" % self.usage)
+        if not os.path.exists(settings_template_file):
+            raise CommandError("The settings template file doesn't exists.")
+        settings_files = self.get_settings_files(paths, options["pattern"])
+        # Compiled once here, forked workers reuse the cached template.
+        compile_template(settings_template_file)
+
+        self.stdout.write("** Key rotation of %s files: **" % len(settings_files))
+        jobs = [
+            (
+                settings_file_path,
+                settings_template_file,
+                options["new_secret_key"],
+                options["old_secret_key"],
+            )
+            for settings_file_path in settings_files
+        ]
+        errors = []
+        pool = multiprocessing.Pool(options.get("jobs"))
+        try:
+            for settings_file_path, error, key_id in pool.imap_unordered(
+                _rotate_file, jobs
+            ):
+                if error:
+                    errors.append("%s: %s" % (settings_file_path, error))
+                else:
+                    self.stdout.write(
+                        "Rotated key of %s (new key ID %s)"
+                        % (settings_file_path, key_id)
+                    )
+        finally:
+            pool.close()
+            pool.join()
+
+        if errors:
+            raise CommandError("Key rotation errors:\n%s" % "\n".join(errors))
+        self.stdout.write(self.style.SUCCESS("Secret keys successfully rotated !"))
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+.. module:: prefork
+   :synopsis: Module to load the settings file once, before workers are forked.
+
+Example, in gunicorn.conf.py:
+    from django_settings_custom import prefork
+
+    def on_starting(server):
+        prefork.warm_settings("path/to/conf.ini", "path/to/template.ini")
+
+The settings file is parsed and decrypted in the master process. Forked workers
+inherit the loader cache, so their calls to loader.load_settings with the same
+arguments return the cached values without parsing nor decrypting anything, as
+long as the files are unchanged.
+"""
+import gc
+
+from django_settings_custom import loader
+
+
+def warm_settings(
+    settings_file_path=None,
+    settings_template_file=None,
+    secret_key=None,
+    use_snapshot=None,
+    freeze_gc=True,
+):
+    """
+    Load a settings file in the loader cache, to share it with forked workers.
+
+    Args:
+        settings_file_path (str): Path to the settings file, see loader.load_settings.
+        settings_template_file (str): Path to the settings template file,
+            see loader.load_settings.
+        secret_key (str): The key for decryption, see loader.load_settings.
+        use_snapshot (bool): Read the files from their binary snapshot,
+            see loader.load_settings.
+        freeze_gc (bool): Move every object to the permanent generation of the
+            garbage collector (gc.freeze, Python 3.7+), so collections in workers
+            skip the inherited objects ?
+
+    Returns:
+        Mapping: The values by key, by section, read-only.
+
+    Call it in the master process, after every other settings file is loaded: the
+    cached values are made read-only, so no caller can modify the shared cache.
+    This does not prevent copy-on-write: reading a value still updates its
+    reference count, which copies its memory page in the worker. Only gc.freeze
+    limits the pages written, those of the garbage collector headers.
+    """
+    loader.load_settings(
+        settings_file_path, settings_template_file, secret_key, use_snapshot
+    )
+    loader.freeze_cache()
+    values = loader.load_settings(
+        settings_file_path, settings_template_file, secret_key, use_snapshot
+    )
+    if freeze_gc and hasattr(gc, "freeze"):
+        gc.collect()
+        gc.freeze()
+    return values
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+.. module:: signals
+   :synopsis: Signals sent by django_settings_custom.
+
+settings_file_changed is sent by a watcher (see the watcher module) when the values
+of its settings file change, with the arguments:
+
+- watcher: The SettingsWatcher.
+- values: The new values by key, by section, encrypted fields being decrypted.
+- changed: The (section, key) of the added, removed and modified values.
+"""
+from django.dispatch import Signal
+
+settings_file_changed = Signal()
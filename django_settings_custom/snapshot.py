@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+.. module:: snapshot
+   :synopsis: Module to store a parsed settings file in a compact binary snapshot.
+
+A snapshot holds the raw values of an INI file, as written in the file (encrypted
+fields stay encrypted). It is stored next to the file and is only used while the
+SHA256 of the file matches the hash stored in the snapshot.
+"""
+import hashlib
+import io
+import marshal
+import os
+import shutil
+import tempfile
+
+from six.moves.configparser import RawConfigParser
+
+SNAPSHOT_SUFFIX = ".snapshot"
+SNAPSHOT_MAGIC = b"DSCS"
+SNAPSHOT_VERSION = 1
+
+_replace = getattr(os, "replace", os.rename)
+
+
+def snapshot_path(path):
+    """Return the path of the snapshot of the file passed as parameter."""
+    return path + SNAPSHOT_SUFFIX
+
+
+def _header(source):
+    """Return the snapshot header for the content of the source file."""
+    return (
+        SNAPSHOT_MAGIC
+        + bytes(bytearray([SNAPSHOT_VERSION, marshal.version]))
+        + hashlib.sha256(source).digest()
+    )
+
+
+def parse_values(source):
+    """
+    Parse the content of an INI file.
+
+    Args:
+        source (str): The content of the file.
+
+    Returns:
+        dict: Raw values by key, by section.
+    """
+    config = RawConfigParser()
+    if hasattr(config, "read_string"):
+        config.read_string(source)
+    else:
+        config.readfp(io.StringIO(source))
+    return {section: dict(config.items(section)) for section in config.sections()}
+
+
+def write_snapshot(path):
+    """
+    Write the snapshot of an INI file.
+
+    Args:
+        path (str): Path to the INI file.
+
+    The snapshot is written in a temporary file renamed afterwards, so a reader
+    never sees a partial snapshot. It gets the mode of the INI file, as it holds
+    the same values.
+    """
+    with open(path, "rb") as source_file:
+        source = source_file.read()
+    _write_snapshot(path, source, parse_values(source.decode("utf-8")))
+
+
+def _write_snapshot(path, source, values):
+    """Write the snapshot of the source content read from path."""
+    target = snapshot_path(path)
+    file_descriptor, temporary = tempfile.mkstemp(
+        prefix=".%s." % os.path.basename(target),
+        dir=os.path.dirname(target) or ".",
+    )
+    try:
+        with os.fdopen(file_descriptor, "wb") as snapshot_file:
+            snapshot_file.write(_header(source))
+            snapshot_file.write(marshal.dumps(values))
+        shutil.copymode(path, temporary)
+        _replace(temporary, target)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def read_values(path, use_snapshot=True, refresh=True):
+    """
+    Read the raw values of an INI file, from its snapshot when it is up to date.
+
+    Args:
+        path (str): Path to the INI file.
+        use_snapshot (bool): Read the snapshot ?
+        refresh (bool): Write the snapshot when it is missing or outdated ?
+
+    Returns:
+        dict: Raw values by key, by section.
+
+    When use_snapshot is True and the snapshot is missing or outdated, the file is
+    parsed and, if refresh is True, the snapshot is written again.
+    """
+    with open(path, "rb") as source_file:
+        source = source_file.read()
+    if not use_snapshot:
+        return parse_values(source.decode("utf-8"))
+
+    header = _header(source)
+    try:
+        with open(snapshot_path(path), "rb") as snapshot_file:
+            data = snapshot_file.read()
+        if data[: len(header)] == header:
+            return marshal.loads(data[len(header) :])
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        pass
+
+    values = parse_values(source.decode("utf-8"))
+    if not refresh:
+        return values
+    try:
+        _write_snapshot(path, source, values)
+    except (IOError, OSError):
+        pass
+    return values
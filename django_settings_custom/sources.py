@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+.. module:: sources
+   :synopsis: Module to read placeholder values from environment, files and commands.
+
+"ENV_VALUE", "FILE_VALUE" and "COMMAND_VALUE" placeholders take their value from
+the environment variable, the file or the output of the command given as argument.
+Prefixed by "ENCRYPTED_", the value is encrypted in the settings file.
+
+Example:
+    [DATABASE]
+    HOST = { ENV_VALUE: DATABASE_HOST }
+    CA = { FILE_VALUE: /run/secrets/database_ca }
+    PASSWORD = { ENCRYPTED_COMMAND_VALUE: pass show database/password }
+
+Sources are read by a pool of threads, so slow commands (e.g. the client of a
+secret store) run concurrently. A source used by several placeholders is read once.
+"""
+import io
+import os
+import shlex
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+import six
+
+from django_settings_custom import stats
+from django_settings_custom.template import SOURCE_VALUE_TYPES
+
+MAX_THREADS = 8
+COMMAND_TIMEOUT = 30
+
+
+def read_env(name):
+    """
+    Read the value of an environment variable.
+
+    Raises:
+        ValueError: If the variable is not defined.
+    """
+    if name not in os.environ:
+        raise ValueError("The environment variable %s is not defined." % name)
+    return os.environ[name]
+
+
+def read_file(path):
+    """
+    Read the content of a text file, without its trailing newlines.
+
+    Raises:
+        ValueError: If the file can't be read.
+    """
+    try:
+        with io.open(path, encoding="utf-8") as source_file:
+            return source_file.read().rstrip("\r\n")
+    except (IOError, OSError) as error:
+        raise ValueError("Can't read %s: %s" % (path, error.strerror or error))
+
+
+def run_command(command):
+    """
+    Run a command, without shell, and return its output without trailing newlines.
+
+    Args:
+        command (str): The command line, split like a shell would do.
+
+    Raises:
+        ValueError: If the command can't be run, fails or times out (after
+            COMMAND_TIMEOUT seconds, on Python 3 only).
+    """
+    try:
+        process = subprocess.Popen(
+            shlex.split(command), stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+    except (IOError, OSError) as error:
+        raise ValueError("Can't run %s: %s" % (command, error.strerror or error))
+    kwargs = {} if six.PY2 else {"timeout": COMMAND_TIMEOUT}
+    try:
+        output, errors = process.communicate(**kwargs)
+    except getattr(subprocess, "TimeoutExpired", ()):
+        process.kill()
+        process.communicate()
+        raise ValueError("%s timed out." % command)
+    if process.returncode:
+        raise ValueError(
+            "%s failed with exit status %s: %s"
+            % (command, process.returncode, errors.decode("utf-8", "replace").strip())
+        )
+    return output.decode("utf-8").rstrip("\r\n")
+
+
+READERS = {
+    "ENV_VALUE": read_env,
+    "FILE_VALUE": read_file,
+    "COMMAND_VALUE": run_command,
+}
+
+
+def get_source_type(value_type):
+    """
+    Return the source tag of a placeholder tag.
+
+    Args:
+        value_type (str): The tag, e.g. "ENCRYPTED_COMMAND_VALUE".
+
+    Returns:
+        str: The source tag, e.g. "COMMAND_VALUE", or None if the tag is not read
+            from a source.
+    """
+    if value_type.startswith("ENCRYPTED_"):
+        value_type = value_type[len("ENCRYPTED_") :]
+    return value_type if value_type in SOURCE_VALUE_TYPES else None
+
+
+def _read_source(source):
+    """Read a (source tag, argument) source, return its value and error message."""
+    source_type, argument = source
+    if not argument:
+        return None, "%s needs an argument, e.g. { %s: NAME }." % (
+            source_type,
+            source_type,
+        )
+    try:
+        return READERS[source_type](argument), None
+    except ValueError as error:
+        return None, str(error)
+
+
+@stats.timed("resolve_sources")
+def resolve_sources(placeholders, max_threads=MAX_THREADS):
+    """
+    Read the values of the placeholders whose tag is a source.
+
+    Args:
+        placeholders (iterable of Placeholder): The placeholders of a template,
+            other tags are ignored.
+        max_threads (int): Maximum number of sources read at the same time.
+
+    Returns:
+        dict: Value by (section, key), for the source placeholders only.
+
+    Raises:
+        ValueError: If sources can't be read, with every error at once.
+    """
+    fields = []
+    for placeholder in placeholders:
+        source_type = get_source_type(placeholder.value_type)
+        if source_type is not None:
+            fields.append(
+                (
+                    (placeholder.section, placeholder.key),
+                    (source_type, placeholder.argument),
+                )
+            )
+    if not fields:
+        return {}
+
+    sources = list(set(source for _, source in fields))
+    pool = ThreadPool(min(max_threads, len(sources)))
+    try:
+        results = dict(zip(sources, pool.map(_read_source, sources)))
+    finally:
+        pool.close()
+        pool.join()
+
+    values = {}
+    errors = []
+    for field, source in fields:
+        value, error = results[source]
+        if error is None:
+            values[field] = value
+        else:
+            errors.append("[%s] %s: %s" % (field + (error,)))
+    if errors:
+        raise ValueError("Can't read the values of:\n%s" % "\n".join(errors))
+    return values
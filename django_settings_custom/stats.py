@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+.. module:: stats
+   :synopsis: Module to count calls and measure time of encryption and generation.
+
+Nothing is measured until stats are enabled or a hook is added, so the cost of the
+instrumentation is a single check per call otherwise.
+
+Example:
+    stats.enable()
+    loader.load_settings()
+    print(stats.get_stats()["decrypt_many"])  # {"calls": 1, "time": 0.0001}
+
+    stats.add_hook(lambda name, duration: statsd.timing(name, duration * 1000))
+"""
+import contextlib
+import functools
+import threading
+import timeit
+
+_enabled = False
+_hooks = []
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def enable(enabled=True):
+    """
+    Enable (or disable) the collection of stats.
+
+    Args:
+        enabled (bool): Collect stats ?
+
+    Returns:
+        bool: The previous state.
+    """
+    global _enabled
+    previous, _enabled = _enabled, enabled
+    return previous
+
+
+def disable():
+    """Disable the collection of stats, hooks are still called."""
+    return enable(False)
+
+
+def is_active():
+    """Return True if stats are collected or hooks are registered."""
+    return _enabled or bool(_hooks)
+
+
+def add_hook(callback):
+    """
+    Register a function called for each measure, even if stats are disabled.
+
+    Args:
+        callback (callable): Function called with the name of the measure and its
+            duration in seconds.
+    """
+    _hooks.append(callback)
+
+
+def remove_hook(callback):
+    """Unregister a function registered by add_hook."""
+    _hooks.remove(callback)
+
+
+def reset_stats():
+    """Remove every collected stat."""
+    with _stats_lock:
+        _stats.clear()
+
+
+def get_stats():
+    """
+    Return the collected stats.
+
+    Returns:
+        dict: {"calls": number of calls, "time": cumulative time in seconds} by name.
+    """
+    with _stats_lock:
+        return {
+            name: {"calls": calls, "time": duration}
+            for name, (calls, duration) in _stats.items()
+        }
+
+
+def record(name, duration=0.0):
+    """
+    Record one call of name.
+
+    Args:
+        name (str): Name of the measure, e.g. "encrypt".
+        duration (float): Duration of the call in seconds.
+    """
+    if _enabled:
+        with _stats_lock:
+            calls, total = _stats.get(name, (0, 0.0))
+            _stats[name] = (calls + 1, total + duration)
+    for callback in list(_hooks):
+        callback(name, duration)
+
+
+@contextlib.contextmanager
+def timer(name):
+    """
+    Context manager recording the duration of its block under name.
+
+    Args:
+        name (str): Name of the measure.
+    """
+    if not is_active():
+        yield
+        return
+    start = timeit.default_timer()
+    try:
+        yield
+    finally:
+        record(name, timeit.default_timer() - start)
+
+
+def timed(name):
+    """
+    Decorator recording the calls of a function under name.
+
+    Args:
+        name (str): Name of the measure.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled and not _hooks:
+                return function(*args, **kwargs)
+            start = timeit.default_timer()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, timeit.default_timer() - start)
+
+        return wrapper
+
+    return decorator
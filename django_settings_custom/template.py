@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+.. module:: template
+   :synopsis: Module to compile settings templates into a placeholder index.
+
+Example:
+    compiled = template.compile_template("path/to/template/settings.ini")
+    for placeholder in compiled.placeholders:
+        print(placeholder.section, placeholder.key, placeholder.value_type)
+
+A placeholder is a tag, optionally followed by a colon and an argument, e.g.
+"{ ENV_VALUE: DATABASE_HOST }". The tag is case insensitive, the argument is not.
+
+A template can be composed of a base template and overlays (e.g. one per
+environment), whose sections and values are added to the base or replace its
+values:
+    compiled = template.merge_templates("base.ini", ["prod.ini", "eu-west.ini"])
+"""
+import collections
+import hashlib
+import io
+import os
+import re
+import threading
+
+from six.moves.configparser import DEFAULTSECT, RawConfigParser
+
+VARIABLE_REGEX = re.compile(r" *{(.+)} *")
+
+SOURCE_VALUE_TYPES = ("ENV_VALUE", "FILE_VALUE", "COMMAND_VALUE")
+ENCRYPTED_VALUE_TYPES = ("ENCRYPTED_USER_VALUE",) + tuple(
+    "ENCRYPTED_" + value_type for value_type in SOURCE_VALUE_TYPES
+)
+
+Placeholder = collections.namedtuple(
+    "Placeholder", ["section", "key", "value_type", "position", "argument"]
+)
+
+MERGE_CACHE_SIZE = 64
+
+_cache = {}
+_cache_lock = threading.Lock()
+_merge_cache = collections.OrderedDict()
+
+
+def parse_tag(text):
+    """
+    Split the content of a placeholder into its tag and its argument.
+
+    Args:
+        text (str): The text between the braces, e.g. " ENV_VALUE: DATABASE_HOST ".
+
+    Returns:
+        tuple: The tag in upper case and the argument, or None if there is none.
+    """
+    tag, _, argument = text.partition(":")
+    return tag.strip().upper(), argument.strip() or None
+
+
+class CompiledTemplate(object):
+    """
+    A parsed settings template and the index of its placeholders.
+
+    Attributes:
+        config (RawConfigParser): The parsed template, it must not be modified.
+        placeholders (tuple of Placeholder): The placeholders in template order,
+            position being the index of the field among all fields of the template
+            and argument the text after the colon of the tag, or None.
+        digest (bytes): SHA256 of the template file, or of the digests of a merged
+            template and its overlays. None for a template parsed in memory.
+    """
+
+    def __init__(self, config, digest=None):
+        self.config = config
+        self.digest = digest
+        placeholders = []
+        position = 0
+        for section in config.sections():
+            for key, value in config.items(section):
+                match_groups = VARIABLE_REGEX.match(value)
+                if match_groups:
+                    value_type, argument = parse_tag(match_groups.group(1))
+                    placeholders.append(
+                        Placeholder(section, key, value_type, position, argument)
+                    )
+                position += 1
+        self.placeholders = tuple(placeholders)
+
+    def fields(self, *value_types):
+        """
+        List the (section, key) of the placeholders.
+
+        Args:
+            *value_types (str): Only list the placeholders with one of these tags,
+                or every placeholder if there is none.
+
+        Returns:
+            list: (section, key) of the placeholders, in template order.
+        """
+        return [
+            (placeholder.section, placeholder.key)
+            for placeholder in self.placeholders
+            if not value_types or placeholder.value_type in value_types
+        ]
+
+
+def clear_template_cache():
+    """
+    Remove every compiled and merged template from the cache.
+    """
+    with _cache_lock:
+        _cache.clear()
+        _merge_cache.clear()
+
+
+def compile_template(template):
+    """
+    Compile a settings template, reusing the cached result while the file is unchanged.
+
+    Args:
+        template (str or RawConfigParser): Path to the template, or an already
+            parsed template (compiled without cache).
+
+    Returns:
+        CompiledTemplate: The parsed template and its placeholders.
+
+    Compiled templates are cached by path and compiled again only when the mtime or
+    the size of the file changes. The file is read once, to parse it and compute its
+    digest.
+    """
+    if isinstance(template, CompiledTemplate):
+        return template
+    if isinstance(template, RawConfigParser):
+        return CompiledTemplate(template)
+
+    stat = os.stat(template)
+    stamp = stat.st_mtime, stat.st_size
+    cached = _cache.get(template)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with open(template, "rb") as template_file:
+        source = template_file.read()
+    config = RawConfigParser()
+    if hasattr(config, "read_string"):
+        config.read_string(source.decode("utf-8"), template)
+    else:
+        config.readfp(io.StringIO(source.decode("utf-8")), template)
+    compiled = CompiledTemplate(config, hashlib.sha256(source).digest())
+    with _cache_lock:
+        _cache[template] = (stamp, compiled)
+    return compiled
+
+
+def section_items(config, section):
+    """
+    List the values set in a section itself, without those inherited from DEFAULT.
+
+    Args:
+        config (RawConfigParser): The configuration.
+        section (str): The section name.
+
+    Returns:
+        list: (key, value) of the section, in file order.
+    """
+    return [
+        (key, value)
+        for key, value in config._sections[section].items()
+        if key != "__name__"
+    ]
+
+
+def _merge_configs(configs):
+    """Return a new configuration with the values of configs, the last one wins."""
+    merged = RawConfigParser()
+    for config in configs:
+        for key, value in config.defaults().items():
+            merged.set(DEFAULTSECT, key, value)
+        for section in config.sections():
+            if not merged.has_section(section):
+                merged.add_section(section)
+            for key, value in section_items(config, section):
+                merged.set(section, key, value)
+    return merged
+
+
+def merge_templates(template, overlays=()):
+    """
+    Compile a settings template with overlays applied in order.
+
+    Args:
+        template (str, RawConfigParser or CompiledTemplate): The base template.
+        overlays (iterable): Templates (same types) whose sections and values are
+            added to the base, or replace its values.
+
+    Returns:
+        CompiledTemplate: The merged template and its placeholders, or the compiled
+            base template if there is no overlay.
+
+    Each file is compiled once (see compile_template) and merged results are cached
+    by the digests of their inputs (at most MERGE_CACHE_SIZE), so rendering many
+    variants of a base template reuses its parsed configuration. Templates parsed in
+    memory are merged without cache.
+    """
+    compiled = [compile_template(template)]
+    compiled.extend(compile_template(overlay) for overlay in overlays)
+    if len(compiled) == 1:
+        return compiled[0]
+
+    digests = tuple(item.digest for item in compiled)
+    if None in digests:
+        return CompiledTemplate(_merge_configs(item.config for item in compiled))
+    with _cache_lock:
+        merged = _merge_cache.pop(digests, None)
+        if merged is not None:
+            _merge_cache[digests] = merged
+            return merged
+
+    merged = CompiledTemplate(
+        _merge_configs(item.config for item in compiled),
+        hashlib.sha256(b"".join(digests)).digest(),
+    )
+    with _cache_lock:
+        _merge_cache[digests] = merged
+        while len(_merge_cache) > MERGE_CACHE_SIZE:
+            _merge_cache.popitem(last=False)
+    return merged
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Test decryption module."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from django_settings_custom import decryption, encryption
+
+SECRET_KEY = "b(l$!na5rzuo+h(psyrlees(p9talk)u!=pjk#6=0v!n*q#y!m"
+SOURCE = "A protected sentence !"
+HEAVY_MODULES = ("django", "six", "Crypto", "cryptography")
+IMPORT_TIME_BUDGET = 0.1
+
+
+def test_decrypt():
+    """Values encrypted by the encryption module are decrypted."""
+    encrypted_sources = [
+        encryption.encrypt(SOURCE, SECRET_KEY),
+        encryption.encrypt(SOURCE, SECRET_KEY, encryption.MODE_GCM),
+        encryption.encrypt(
+            SOURCE, SECRET_KEY, key_id=decryption.get_key_id(SECRET_KEY)
+        ),
+    ]
+    for encrypted_source in encrypted_sources:
+        assert decryption.decrypt(encrypted_source, SECRET_KEY) == SOURCE
+    assert decryption.decrypt_many(encrypted_sources, SECRET_KEY) == [SOURCE] * 3
+    with pytest.raises(ValueError):
+        decryption.decrypt("Bad value", SECRET_KEY)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="-X importtime needs 3.7")
+def test_import_time():
+    """The module imports neither Django nor the AES backends, and fast."""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    output = subprocess.check_output(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import django_settings_custom.decryption",
+        ],
+        cwd=root,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+    )
+    cumulative_times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        cumulative_times[module.strip()] = int(cumulative) / 1e6
+    heavy_modules = [
+        module for module in cumulative_times if module.split(".")[0] in HEAVY_MODULES
+    ]
+    assert heavy_modules == []
+    assert cumulative_times["django_settings_custom.decryption"] < IMPORT_TIME_BUDGET
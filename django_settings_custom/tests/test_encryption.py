@@ -1,13 +1,35 @@
 # -*- coding: utf-8 -*-
 """Test encryption module."""
+import io
+import os
+
 import pytest
+from six.moves import configparser
 
 from django_settings_custom import encryption
 
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+RESOURCES_DIR = os.path.join(os.path.dirname(__file__), "resources")
+TEMPLATE_FILE_PATH = os.path.join(RESOURCES_DIR, "conf_template_test.ini")
 SECRET_KEY = "b(l$!na5rzuo+h(psyrlees(p9talk)u!=pjk#6=0v!n*q#y!m"
 SOURCE = "A protected sentence !"
 
 
+class FakeSettings:
+    """Class to mock django settings."""
+
+    configured = True
+    SECRET_KEY = "$lj&)_)1cc7tm3qikje-u*45mz8za^0wuf*^pm0qjs=xcwy=vo"
+
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
 def test_string_can_be_decrypt():
     """Basic encryption decryption test."""
     encrypted_source = encryption.encrypt(SOURCE, SECRET_KEY)
@@ -30,3 +52,300 @@ def test_decryption_error():
     """Basic decryption error."""
     with pytest.raises(ValueError):
         encryption.decrypt("Bad value", SECRET_KEY)
+
+
+def test_key_cache():
+    """Derived keys are cached per secret key and the cache is bounded."""
+    encryption.clear_key_cache()
+    key = encryption._compute_key(SECRET_KEY)
+    assert encryption._compute_key(SECRET_KEY) is key
+    assert encryption._compute_key(SECRET_KEY.encode()) == key
+    assert encryption._compute_key("another key") != key
+
+    for index in range(encryption.KEY_CACHE_SIZE + 1):
+        encryption._compute_key("key %s" % index)
+    assert len(encryption._key_cache) == encryption.KEY_CACHE_SIZE
+    assert SECRET_KEY not in encryption._key_cache
+
+    encryption.clear_key_cache()
+    assert not encryption._key_cache
+
+
+def test_decrypt_many():
+    """Batch decryption keeps the order of the values."""
+    sources = ["first", "second", ""]
+    encrypted_sources = [encryption.encrypt(source, SECRET_KEY) for source in sources]
+    assert encryption.decrypt_many(encrypted_sources, SECRET_KEY) == sources
+    with pytest.raises(ValueError):
+        encryption.decrypt_many(encrypted_sources + ["Bad value"], SECRET_KEY)
+
+
+def test_decrypt_section():
+    """Decrypt the encrypted fields of a config section."""
+    config = configparser.RawConfigParser()
+    config.add_section("CREDENTIALS")
+    config.set("CREDENTIALS", "USER", encryption.encrypt("user", SECRET_KEY))
+    config.set("CREDENTIALS", "PASSWORD", encryption.encrypt("pass", SECRET_KEY))
+
+    values = encryption.decrypt_section(config, "CREDENTIALS", ["PASSWORD"], SECRET_KEY)
+    assert values == {"PASSWORD": "pass"}
+    with pytest.raises(ValueError):
+        encryption.decrypt_section(config, "CREDENTIALS", secret_key=SECRET_KEY)
+
+
+def test_decrypt_section_template():
+    """Without keys, the encrypted fields are the encrypted placeholders."""
+    config = configparser.RawConfigParser()
+    config.add_section("DATABASE_CREDENTIALS")
+    config.set("DATABASE_CREDENTIALS", "USER", "user")
+    config.set(
+        "DATABASE_CREDENTIALS", "PASSWORD", encryption.encrypt("pass", SECRET_KEY)
+    )
+
+    values = encryption.decrypt_section(
+        config,
+        "DATABASE_CREDENTIALS",
+        secret_key=SECRET_KEY,
+        template=TEMPLATE_FILE_PATH,
+    )
+    assert values == {"password": "pass"}
+
+
+def test_lazy_decrypt():
+    """Lazy values are decrypted once, on first access."""
+    encrypted_source = encryption.encrypt(SOURCE, SECRET_KEY)
+    with mock.patch(
+        "django_settings_custom.encryption.decrypt", wraps=encryption.decrypt
+    ) as decrypt_mock:
+        value = encryption.LazyDecrypt(encrypted_source, SECRET_KEY)
+        assert value.source == encrypted_source
+        decrypt_mock.assert_not_called()
+
+        assert value == SOURCE
+        assert str(value) == SOURCE
+        assert value.upper() == SOURCE.upper()
+        decrypt_mock.assert_called_once_with(encrypted_source, SECRET_KEY)
+
+
+def test_reencrypt_many():
+    """Values are encrypted again with the new key."""
+    new_secret_key = "a new secret key"
+    encrypted_sources = [encryption.encrypt(source, SECRET_KEY) for source in "ab"]
+    values = encryption.reencrypt_many(encrypted_sources, SECRET_KEY, new_secret_key)
+    assert encryption.decrypt_many(values, new_secret_key) == ["a", "b"]
+
+
+def test_gcm_mode():
+    """Authenticated encryption and its integrity check."""
+    encrypted_source = encryption.encrypt(SOURCE, SECRET_KEY, encryption.MODE_GCM)
+    assert encrypted_source.startswith(encryption.GCM_PREFIX)
+    assert encryption.get_mode(encrypted_source) == encryption.MODE_GCM
+    assert encryption.decrypt(encrypted_source, SECRET_KEY) == SOURCE
+
+    tampered_source = encrypted_source[:-4] + (
+        "AAAA" if encrypted_source[-4:] != "AAAA" else "BBBB"
+    )
+    with pytest.raises(ValueError):
+        encryption.decrypt(tampered_source, SECRET_KEY)
+    with pytest.raises(ValueError):
+        encryption.decrypt(encrypted_source, "another key")
+    with pytest.raises(ValueError):
+        encryption.decrypt(encryption.GCM_PREFIX + "AAAA", SECRET_KEY)
+    with pytest.raises(ValueError):
+        encryption.encrypt(SOURCE, SECRET_KEY, "unknown")
+
+
+def test_siv_mode():
+    """Deterministic encryption gives equal values for equal plain texts."""
+    encrypted_source = encryption.encrypt(SOURCE, SECRET_KEY, encryption.MODE_SIV)
+    assert encrypted_source.startswith(encryption.SIV_PREFIX)
+    assert encryption.get_mode(encrypted_source) == encryption.MODE_SIV
+    assert encryption.decrypt(encrypted_source, SECRET_KEY) == SOURCE
+    assert encryption.encrypt(SOURCE, SECRET_KEY, encryption.MODE_SIV) == (
+        encrypted_source
+    )
+    assert encryption.encrypt("", SECRET_KEY, encryption.MODE_SIV) != (encrypted_source)
+    assert encryption.encrypt(SOURCE, "another key", encryption.MODE_SIV) != (
+        encrypted_source
+    )
+    empty_source = encryption.encrypt("", SECRET_KEY, encryption.MODE_SIV)
+    assert encryption.decrypt(empty_source, SECRET_KEY) == ""
+
+    tampered_source = encrypted_source[:-4] + (
+        "AAAA" if encrypted_source[-4:] != "AAAA" else "BBBB"
+    )
+    with pytest.raises(ValueError):
+        encryption.decrypt(tampered_source, SECRET_KEY)
+    with pytest.raises(ValueError):
+        encryption.decrypt(encrypted_source, "another key")
+    with pytest.raises(ValueError):
+        encryption.decrypt(encryption.SIV_PREFIX + "AAAA", SECRET_KEY)
+
+
+def test_reencrypt_many_modes():
+    """Modes are kept unless a new mode is given."""
+    encrypted_sources = [
+        encryption.encrypt("a", SECRET_KEY),
+        encryption.encrypt("b", SECRET_KEY, encryption.MODE_GCM),
+        encryption.encrypt("c", SECRET_KEY, encryption.MODE_SIV),
+    ]
+    values = encryption.reencrypt_many(encrypted_sources, SECRET_KEY, "new key")
+    assert [encryption.get_mode(value) for value in values] == [
+        encryption.MODE_CBC,
+        encryption.MODE_GCM,
+        encryption.MODE_SIV,
+    ]
+    values = encryption.reencrypt_many(
+        encrypted_sources, SECRET_KEY, "new key", encryption.MODE_GCM
+    )
+    assert encryption.decrypt_many(values, "new key") == ["a", "b", "c"]
+    assert all(value.startswith(encryption.GCM_PREFIX) for value in values)
+
+
+def test_backends_are_compatible():
+    """Values encrypted by a backend are decrypted by every other backend."""
+    backends = encryption.available_backends()
+    assert backends
+    try:
+        for encryption_backend in backends:
+            encryption.set_backend(encryption_backend)
+            encrypted_sources = [
+                encryption.encrypt(SOURCE, SECRET_KEY),
+                encryption.encrypt(SOURCE, SECRET_KEY, encryption.MODE_GCM),
+                encryption.encrypt(SOURCE, SECRET_KEY, encryption.MODE_SIV),
+            ]
+            for decryption_backend in backends:
+                encryption.set_backend(decryption_backend)
+                assert encryption.decrypt_many(encrypted_sources, SECRET_KEY) == [
+                    SOURCE,
+                    SOURCE,
+                    SOURCE,
+                ]
+                assert encryption.encrypt(SOURCE, SECRET_KEY, encryption.MODE_SIV) == (
+                    encrypted_sources[2]
+                )
+                with pytest.raises(ValueError):
+                    encryption.decrypt(encrypted_sources[1], "another key")
+        with pytest.raises(ImportError):
+            encryption.set_backend("unknown")
+    finally:
+        encryption.set_backend()
+
+
+def test_key_id():
+    """Values carrying a key ID are decrypted with the key of this ID."""
+    key_id = encryption.get_key_id(SECRET_KEY)
+    assert len(key_id) == encryption.KEY_ID_SIZE
+    assert key_id != encryption.get_key_id("another key")
+    encrypted_source = encryption.encrypt(SOURCE, SECRET_KEY, key_id=key_id)
+    assert encrypted_source.startswith(encryption.KEY_ID_PREFIX + key_id + "$")
+    assert encryption.decrypt(encrypted_source, SECRET_KEY) == SOURCE
+    assert encryption.decrypt(encrypted_source, keyring={key_id: SECRET_KEY}) == SOURCE
+    with pytest.raises(ValueError):
+        encryption.decrypt(encrypted_source, "another key", {})
+
+    encrypted_source = encryption.encrypt(
+        SOURCE, SECRET_KEY, encryption.MODE_GCM, key_id="2024"
+    )
+    assert encryption.get_mode(encrypted_source) == encryption.MODE_GCM
+    assert encryption.decrypt_many(
+        [encrypted_source, encryption.encrypt(SOURCE, "current key")],
+        "current key",
+        {"2024": SECRET_KEY},
+    ) == [SOURCE, SOURCE]
+    with pytest.raises(ValueError):
+        encryption.encrypt(SOURCE, SECRET_KEY, key_id="a$b")
+
+    value = encryption.reencrypt_many([encrypted_source], SECRET_KEY, "new key")[0]
+    assert value.startswith(
+        encryption.KEY_ID_PREFIX + encryption.get_key_id("new key") + "$"
+    )
+
+
+def test_keyring_settings():
+    """The keyring defaults to the SECRET_KEY and the SECRET_KEY_FALLBACKS."""
+    old_value = encryption.encrypt(
+        SOURCE, SECRET_KEY, key_id=encryption.get_key_id(SECRET_KEY)
+    )
+    with mock.patch(
+        "django.conf.settings",
+        FakeSettings(SECRET_KEY_FALLBACKS=[SECRET_KEY]),
+    ):
+        keyring = encryption.get_keyring()
+        assert len(keyring) == 2
+        assert encryption.get_keyring() is keyring
+        assert encryption.decrypt(old_value) == SOURCE
+    with mock.patch("django.conf.settings", FakeSettings()):
+        assert len(encryption.get_keyring()) == 1
+    with mock.patch(
+        "django.conf.settings",
+        FakeSettings(SETTINGS_KEYRING={"old": SECRET_KEY}),
+    ):
+        assert encryption.get_keyring() == {"old": SECRET_KEY}
+        assert (
+            encryption.decrypt(encryption.encrypt(SOURCE, SECRET_KEY, key_id="old"))
+            == SOURCE
+        )
+    with mock.patch("django.conf.settings", FakeSettings()):
+        with pytest.raises(ValueError):
+            encryption.decrypt(old_value)
+
+
+def test_stream():
+    """Streams are encrypted chunk by chunk and checked when decrypted."""
+    for size in (0, 10, 64, 65, 1000):
+        data = os.urandom(size)
+        encrypted_stream = io.BytesIO()
+        encryption.encrypt_stream(
+            io.BytesIO(data), encrypted_stream, SECRET_KEY, chunk_size=64
+        )
+        encrypted_data = encrypted_stream.getvalue()
+        assert data not in encrypted_data or not data
+
+        decrypted_stream = io.BytesIO()
+        encryption.decrypt_stream(
+            io.BytesIO(encrypted_data), decrypted_stream, SECRET_KEY
+        )
+        assert decrypted_stream.getvalue() == data
+
+        reencrypted_stream = io.BytesIO()
+        encryption.reencrypt_stream(
+            io.BytesIO(encrypted_data), reencrypted_stream, SECRET_KEY, "new key"
+        )
+        decrypted_stream = io.BytesIO()
+        encryption.decrypt_stream(
+            io.BytesIO(reencrypted_stream.getvalue()), decrypted_stream, "new key"
+        )
+        assert decrypted_stream.getvalue() == data
+
+    tampered_data = bytearray(encrypted_data)
+    tampered_data[-1] ^= 1
+    for invalid_data in (
+        bytes(tampered_data),
+        encrypted_data[: encryption.STREAM_HEADER_SIZE + 64 + 16],
+        encrypted_data[: encryption.STREAM_HEADER_SIZE],
+        b"not a stream",
+    ):
+        with pytest.raises(ValueError):
+            encryption.decrypt_stream(
+                io.BytesIO(invalid_data), io.BytesIO(), SECRET_KEY
+            )
+    with pytest.raises(ValueError):
+        encryption.decrypt_stream(io.BytesIO(encrypted_data), io.BytesIO(), "bad key")
+
+
+def test_backend_setting_read_once_configured():
+    """A backend used while settings are unconfigured is not kept once configured."""
+    from django_settings_custom import decryption
+
+    try:
+        with mock.patch.object(decryption, "_backend", None):
+            with mock.patch("django.conf.settings", FakeSettings(configured=False)):
+                assert decryption.get_backend() is decryption.get_backend()
+            with mock.patch(
+                "django.conf.settings",
+                FakeSettings(SETTINGS_ENCRYPTION_BACKEND="pycryptodome"),
+            ):
+                assert decryption.get_backend().name == "pycryptodome"
+    finally:
+        encryption.set_backend()
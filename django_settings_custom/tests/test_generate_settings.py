@@ -4,11 +4,12 @@ import argparse
 import os
 
 import pytest
+import six
 from six.moves import configparser
 
 from django.core.management.base import CommandError
 
-from django_settings_custom import encryption
+from django_settings_custom import encryption, generation, loader, snapshot, stats
 from django_settings_custom.management.commands import generate_settings
 
 try:
@@ -239,3 +240,513 @@ def test_generate_file_with_subclass(input_mock, getpass_mock):
     init_and_launch_command([], CustomCommand)
     assert os.path.exists(CREATED_FILE_PATH)
     os.remove(CREATED_FILE_PATH)
+
+
+@mock.patch("getpass.getpass")
+@mock.patch("django_settings_custom.management.commands.generate_settings.get_input")
+@mock.patch("django.conf.settings", FakeSettings())
+def test_generate_file_with_snapshot(input_mock, getpass_mock):
+    """Test snapshot option."""
+    input_mock.side_effect = ["user"]
+    getpass_mock.return_value = "pass"
+    init_and_launch_command(
+        [TEMPLATE_FILE_PATH, CREATED_FILE_PATH, "--force-secretkey", "--snapshot"]
+    )
+    snapshot_file_path = snapshot.snapshot_path(CREATED_FILE_PATH)
+    assert os.path.exists(snapshot_file_path)
+    values = snapshot.read_values(CREATED_FILE_PATH)
+    assert values["DATABASE_CREDENTIALS"]["user"] == "user"
+    os.remove(CREATED_FILE_PATH)
+    os.remove(snapshot_file_path)
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_generate_file_without_input(tmpdir):
+    """Test no-input generation with an answers file and the environment."""
+    answers_file = str(tmpdir.join("answers.yaml"))
+    with open(answers_file, "w") as answers:
+        answers.write("DATABASE_CREDENTIALS:\n  USER: user\n  PASSWORD: pass\n")
+    with open(CREATED_FILE_PATH, "w") as created_file:
+        created_file.write("An existing settings file")
+
+    with mock.patch.dict(
+        os.environ, {"SETTINGS_DATABASE_CREDENTIALS_PASSWORD": "env pass"}
+    ):
+        init_and_launch_command(
+            [
+                TEMPLATE_FILE_PATH,
+                CREATED_FILE_PATH,
+                "--no-input",
+                "--answers",
+                answers_file,
+            ]
+        )
+
+    config = configparser.RawConfigParser()
+    config.read(CREATED_FILE_PATH)
+    secret_key = config.get("DJANGO", "KEY")
+    assert config.get("DATABASE_CREDENTIALS", "USER") == "user"
+    assert (
+        encryption.decrypt(config.get("DATABASE_CREDENTIALS", "PASSWORD"), secret_key)
+        == "env pass"
+    )
+    os.remove(CREATED_FILE_PATH)
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_generate_file_encrypted_file(tmpdir):
+    """Test ENCRYPTED_FILE placeholders, kept by update."""
+    template_file_path = str(tmpdir.join("template.ini"))
+    with open(template_file_path, "w") as template_file:
+        template_file.write(
+            "[TLS]\nKEY = { ENCRYPTED_FILE }\n[DJANGO]\nKEY = { DJANGO_SECRET_KEY }\n"
+        )
+    source_path = str(tmpdir.join("tls.key"))
+    with open(source_path, "wb") as source_file:
+        source_file.write(b"private key")
+    settings_file_path = str(tmpdir.join("conf.ini"))
+
+    with mock.patch.dict(os.environ, {"SETTINGS_TLS_KEY": source_path}):
+        init_and_launch_command([template_file_path, settings_file_path, "--no-input"])
+    config = configparser.RawConfigParser()
+    config.read(settings_file_path)
+    blob_path = str(tmpdir.join(config.get("TLS", "KEY")))
+    decrypted_stream = six.BytesIO()
+    with open(blob_path, "rb") as blob_file:
+        encryption.decrypt_stream(
+            blob_file, decrypted_stream, config.get("DJANGO", "KEY")
+        )
+    assert decrypted_stream.getvalue() == b"private key"
+
+    blob_mtime = os.path.getmtime(blob_path)
+    init_and_launch_command(
+        [template_file_path, settings_file_path, "--no-input", "--update"]
+    )
+    assert os.path.getmtime(blob_path) == blob_mtime
+    with pytest.raises(CommandError):
+        init_and_launch_command([template_file_path, settings_file_path, "--no-input"])
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_generate_file_sources(tmpdir):
+    """Test source placeholders, read again by update."""
+    template_file_path = str(tmpdir.join("template.ini"))
+    with open(template_file_path, "w") as template_file:
+        template_file.write(
+            "[DATABASE]\n"
+            "HOST = { ENV_VALUE: DATABASE_HOST }\n"
+            "PASSWORD = { ENCRYPTED_FILE_VALUE: %s }\n"
+            "[DJANGO]\nKEY = { DJANGO_SECRET_KEY }\n" % tmpdir.join("password.txt")
+        )
+    with open(str(tmpdir.join("password.txt")), "w") as password_file:
+        password_file.write("pass\n")
+    settings_file_path = str(tmpdir.join("conf.ini"))
+
+    with pytest.raises(CommandError) as error:
+        init_and_launch_command([template_file_path, settings_file_path, "--no-input"])
+    assert "DATABASE_HOST" in str(error.value)
+    with mock.patch.dict(os.environ, {"DATABASE_HOST": "localhost"}):
+        init_and_launch_command([template_file_path, settings_file_path, "--no-input"])
+    values = loader.load_settings(settings_file_path, template_file_path)
+    assert values["DATABASE"] == {"host": "localhost", "password": "pass"}
+
+    with mock.patch.dict(os.environ, {"DATABASE_HOST": "remote"}):
+        init_and_launch_command(
+            [template_file_path, settings_file_path, "--no-input", "--update"]
+        )
+    loader.clear_cache()
+    values = loader.load_settings(settings_file_path, template_file_path)
+    assert values["DATABASE"] == {"host": "remote", "password": "pass"}
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_generate_file_overlays(tmpdir):
+    """Test generation with overlays of the settings template."""
+    overlay_path = str(tmpdir.join("overlay.ini"))
+    with open(overlay_path, "w") as overlay_file:
+        overlay_file.write("[DATABASE_CREDENTIALS]\nUSER = prod_user\n")
+    settings_file_path = str(tmpdir.join("conf.ini"))
+
+    with pytest.raises(CommandError):
+        init_and_launch_command(
+            [
+                TEMPLATE_FILE_PATH,
+                settings_file_path,
+                "--no-input",
+                "--overlay",
+                str(tmpdir.join("missing.ini")),
+            ]
+        )
+    with mock.patch.dict(
+        os.environ, {"SETTINGS_DATABASE_CREDENTIALS_PASSWORD": "pass"}
+    ):
+        init_and_launch_command(
+            [
+                TEMPLATE_FILE_PATH,
+                settings_file_path,
+                "--no-input",
+                "--overlay",
+                overlay_path,
+            ]
+        )
+    config = configparser.RawConfigParser()
+    config.read(settings_file_path)
+    assert config.get("DATABASE_CREDENTIALS", "USER") == "prod_user"
+    assert (
+        encryption.decrypt(
+            config.get("DATABASE_CREDENTIALS", "PASSWORD"), config.get("DJANGO", "KEY")
+        )
+        == "pass"
+    )
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_generate_file_if_changed(tmpdir, capsys):
+    """Test dry run and write if changed, with values encrypted again."""
+    template_file_path = str(tmpdir.join("template.ini"))
+    with open(template_file_path, "w") as template_file:
+        template_file.write(
+            "[DATABASE]\n"
+            "HOST = { ENV_VALUE: DATABASE_HOST }\n"
+            "PASSWORD = { ENCRYPTED_ENV_VALUE: DATABASE_PASSWORD }\n"
+            "[DJANGO]\nKEY = { DJANGO_SECRET_KEY }\n"
+        )
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    arguments = [template_file_path, settings_file_path, "--no-input", "--update"]
+    environment = {"DATABASE_HOST": "localhost", "DATABASE_PASSWORD": "pass"}
+
+    with mock.patch.dict(os.environ, environment):
+        init_and_launch_command(arguments + ["--dry-run"])
+        assert not os.path.exists(settings_file_path)
+        init_and_launch_command(arguments + ["--if-changed"])
+        with open(settings_file_path) as settings_file:
+            content = settings_file.read()
+        mtime = os.path.getmtime(settings_file_path)
+        capsys.readouterr()
+
+        init_and_launch_command(arguments + ["--if-changed"])
+        assert "No changes." in capsys.readouterr().out
+        with open(settings_file_path) as settings_file:
+            assert settings_file.read() == content
+        assert os.path.getmtime(settings_file_path) == mtime
+
+    environment["DATABASE_HOST"] = "remote"
+    with mock.patch.dict(os.environ, environment):
+        init_and_launch_command(arguments + ["--dry-run"])
+        assert "~ [DATABASE] host: localhost -> remote" in capsys.readouterr().out
+        with open(settings_file_path) as settings_file:
+            assert settings_file.read() == content
+        init_and_launch_command(arguments + ["--if-changed"])
+    config = configparser.RawConfigParser()
+    config.read(settings_file_path)
+    assert config.get("DATABASE", "HOST") == "remote"
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_generate_file_if_changed_answers(tmpdir, capsys):
+    """The secret key is kept without update, and answers replace kept values."""
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    arguments = [TEMPLATE_FILE_PATH, settings_file_path, "--no-input"]
+    environment = {
+        "SETTINGS_DATABASE_CREDENTIALS_USER": "user",
+        "SETTINGS_DATABASE_CREDENTIALS_PASSWORD": "pass",
+    }
+    with mock.patch.dict(os.environ, environment):
+        init_and_launch_command(arguments + ["--if-changed"])
+        with open(settings_file_path) as settings_file:
+            content = settings_file.read()
+        capsys.readouterr()
+        init_and_launch_command(arguments + ["--if-changed"])
+        assert "No changes." in capsys.readouterr().out
+        with open(settings_file_path) as settings_file:
+            assert settings_file.read() == content
+
+    environment["SETTINGS_DATABASE_CREDENTIALS_PASSWORD"] = "new pass"
+    with mock.patch.dict(os.environ, environment):
+        init_and_launch_command(arguments + ["--update", "--if-changed"])
+    assert "~ [DATABASE_CREDENTIALS] password" in capsys.readouterr().out
+    config = configparser.RawConfigParser()
+    config.read(settings_file_path)
+    secret_key = config.get("DJANGO", "KEY")
+    assert secret_key in content
+    assert (
+        encryption.decrypt(config.get("DATABASE_CREDENTIALS", "PASSWORD"), secret_key)
+        == "new pass"
+    )
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_generate_file_if_changed_blobs(tmpdir, capsys):
+    """Blobs are kept while their file is unchanged, and changes are reported."""
+    template_file_path = str(tmpdir.join("template.ini"))
+    with open(template_file_path, "w") as template_file:
+        template_file.write(
+            "[TLS]\nKEY = { ENCRYPTED_FILE }\n[DJANGO]\nKEY = { DJANGO_SECRET_KEY }\n"
+        )
+    source_path = str(tmpdir.join("tls.key"))
+    with open(source_path, "wb") as source_file:
+        source_file.write(b"private key")
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    arguments = [template_file_path, settings_file_path, "--no-input"]
+
+    with mock.patch.dict(os.environ, {"SETTINGS_TLS_KEY": source_path}):
+        init_and_launch_command(arguments)
+        blob_path = generation.sidecar_path(settings_file_path, "TLS", "key")
+        with open(blob_path, "rb") as blob_file:
+            blob = blob_file.read()
+        capsys.readouterr()
+
+        init_and_launch_command(arguments + ["--if-changed"])
+        assert "No changes." in capsys.readouterr().out
+        with open(blob_path, "rb") as blob_file:
+            assert blob_file.read() == blob
+
+        with open(source_path, "wb") as source_file:
+            source_file.write(b"new private key")
+        init_and_launch_command(arguments + ["--dry-run"])
+        assert "~ [TLS] key" in capsys.readouterr().out
+        with open(blob_path, "rb") as blob_file:
+            assert blob_file.read() == blob
+
+        init_and_launch_command(arguments + ["--if-changed"])
+        output = capsys.readouterr().out
+        assert "Encrypted file written at %s." % blob_path in output
+        assert "Configuration file unchanged" in output
+    config = configparser.RawConfigParser()
+    config.read(settings_file_path)
+    decrypted_stream = six.BytesIO()
+    with open(blob_path, "rb") as blob_file:
+        encryption.decrypt_stream(
+            blob_file, decrypted_stream, config.get("DJANGO", "KEY")
+        )
+    assert decrypted_stream.getvalue() == b"new private key"
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_generate_file_profile(capsys):
+    """Test the profile of the generation."""
+    with mock.patch.dict(
+        os.environ,
+        {
+            "SETTINGS_DATABASE_CREDENTIALS_USER": "user",
+            "SETTINGS_DATABASE_CREDENTIALS_PASSWORD": "pass",
+        },
+    ):
+        init_and_launch_command(
+            [TEMPLATE_FILE_PATH, CREATED_FILE_PATH, "--no-input", "--profile"]
+        )
+    output = capsys.readouterr().out
+    assert "** Profile: **" in output
+    for name in ("generate_settings.total", "generate_settings.encryption", "encrypt"):
+        assert name in output
+    assert not stats.is_active()
+    os.remove(CREATED_FILE_PATH)
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_generate_file_json_answers(tmpdir):
+    """Test answers file in JSON, still prompting for missing values."""
+    answers_file = str(tmpdir.join("answers.json"))
+    with open(answers_file, "w") as answers:
+        answers.write('{"database_credentials": {"user": "user"}}')
+
+    with mock.patch("getpass.getpass") as getpass_mock:
+        getpass_mock.return_value = "pass"
+        init_and_launch_command(
+            [TEMPLATE_FILE_PATH, CREATED_FILE_PATH, "--force-secretkey"]
+            + ["--answers", answers_file]
+        )
+        getpass_mock.assert_called_once()
+
+    config = configparser.RawConfigParser()
+    config.read(CREATED_FILE_PATH)
+    assert config.get("DATABASE_CREDENTIALS", "USER") == "user"
+    os.remove(CREATED_FILE_PATH)
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_error_generate_file_without_input():
+    """Test every missing value is reported."""
+    with pytest.raises(CommandError) as error:
+        init_and_launch_command([TEMPLATE_FILE_PATH, CREATED_FILE_PATH, "--no-input"])
+    assert "[DATABASE_CREDENTIALS] user" in str(error.value)
+    assert "[DATABASE_CREDENTIALS] password" in str(error.value)
+    assert not os.path.exists(CREATED_FILE_PATH)
+
+    with pytest.raises(CommandError):
+        init_and_launch_command(
+            [TEMPLATE_FILE_PATH, CREATED_FILE_PATH, "--answers", "not/existing.yaml"]
+        )
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_generate_fleet(tmpdir):
+    """Test fleet generation from a CSV file."""
+    fleet_file = str(tmpdir.join("fleet.csv"))
+    with open(fleet_file, "w") as fleet:
+        fleet.write("path,DATABASE_CREDENTIALS.USER,DATABASE_CREDENTIALS.PASSWORD\n")
+        for index in range(3):
+            fleet.write(
+                "%s,user%s,pass%s\n" % (tmpdir.join("conf%s.ini" % index), index, index)
+            )
+
+    init_and_launch_command([TEMPLATE_FILE_PATH, "--fleet", fleet_file, "--jobs", "2"])
+
+    for index in range(3):
+        config = configparser.RawConfigParser()
+        config.read(str(tmpdir.join("conf%s.ini" % index)))
+        secret_key = config.get("DJANGO", "KEY")
+        assert config.get("DATABASE_CREDENTIALS", "USER") == "user%s" % index
+        assert (
+            encryption.decrypt(
+                config.get("DATABASE_CREDENTIALS", "PASSWORD"), secret_key
+            )
+            == "pass%s" % index
+        )
+        assert config.get("CONSTANT", "SAME") == "'CONSTANT VALUE'"
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_error_generate_fleet(tmpdir):
+    """Test fleet generation from JSON lines with a missing value."""
+    fleet_file = str(tmpdir.join("fleet.jsonl"))
+    with open(fleet_file, "w") as fleet:
+        fleet.write(
+            '{"path": "%s", "DATABASE_CREDENTIALS": {"USER": "u", "PASSWORD": "p"}}\n'
+            % tmpdir.join("good.ini")
+        )
+        fleet.write(
+            '{"path": "%s", "DATABASE_CREDENTIALS": {"USER": "u"}}\n'
+            % tmpdir.join("bad.ini")
+        )
+
+    with pytest.raises(CommandError) as error:
+        init_and_launch_command([TEMPLATE_FILE_PATH, "--fleet", fleet_file])
+    assert "bad.ini" in str(error.value)
+    assert tmpdir.join("good.ini").check()
+    assert not tmpdir.join("bad.ini").check()
+
+    with pytest.raises(CommandError):
+        init_and_launch_command([TEMPLATE_FILE_PATH, "--fleet", "not/existing.csv"])
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_error_generate_fleet_rows(tmpdir):
+    """Invalid rows and unwritable files are reported, other targets generated."""
+    fleet_file = str(tmpdir.join("fleet.csv"))
+    with open(fleet_file, "w") as fleet:
+        fleet.write("path,DATABASE_CREDENTIALS.USER,DATABASE_CREDENTIALS.PASSWORD\n")
+        fleet.write("%s,u,p\n" % tmpdir.join("good.ini"))
+        fleet.write("%s,u,p\n" % tmpdir.join("fleet.csv", "bad.ini"))
+        fleet.write(",u,p\n")
+    with pytest.raises(CommandError) as error:
+        init_and_launch_command([TEMPLATE_FILE_PATH, "--fleet", fleet_file])
+    assert "bad.ini" in str(error.value)
+    assert "fleet.csv line 4: The target has no path." in str(error.value)
+    assert tmpdir.join("good.ini").check()
+
+    with open(fleet_file, "w") as fleet:
+        fleet.write("DATABASE_CREDENTIALS.USER,PASSWORD\nu,p\n")
+    with pytest.raises(CommandError) as error:
+        init_and_launch_command([TEMPLATE_FILE_PATH, "--fleet", fleet_file])
+    assert "The target has no path." in str(error.value)
+
+    with open(fleet_file, "w") as fleet:
+        fleet.write("path,PASSWORD\n%s,p\n" % tmpdir.join("other.ini"))
+    with pytest.raises(CommandError) as error:
+        init_and_launch_command([TEMPLATE_FILE_PATH, "--fleet", fleet_file])
+    assert "other.ini: PASSWORD is not a SECTION.KEY column." in str(error.value)
+
+
+@mock.patch("getpass.getpass")
+@mock.patch("django_settings_custom.management.commands.generate_settings.get_input")
+@mock.patch("django.conf.settings", FakeSettings())
+def test_update_file(input_mock, getpass_mock, tmpdir):
+    """Test update keeps existing values and only prompts for new ones."""
+    input_mock.side_effect = ["user"]
+    getpass_mock.return_value = "pass"
+    init_and_launch_command(
+        [TEMPLATE_FILE_PATH, CREATED_FILE_PATH, "--force-secretkey"]
+    )
+    config = configparser.RawConfigParser()
+    config.read(CREATED_FILE_PATH)
+    secret_key = config.get("DJANGO", "KEY")
+    password = config.get("DATABASE_CREDENTIALS", "PASSWORD")
+
+    template_file_path = str(tmpdir.join("template.ini"))
+    with open(TEMPLATE_FILE_PATH) as template_file:
+        template = template_file.read()
+    with open(template_file_path, "w") as template_file:
+        template_file.write(
+            template.replace("USER = { USER_VALUE }", "USER = { ENCRYPTED_USER_VALUE }")
+            + "\n[NEW]\nVALUE = { USER_VALUE }\n"
+        )
+
+    input_mock.side_effect = ["new"]
+    getpass_mock.return_value = "new user"
+    init_and_launch_command([template_file_path, CREATED_FILE_PATH, "--update"])
+    assert input_mock.call_count == 2
+    assert getpass_mock.call_count == 2
+
+    config = configparser.RawConfigParser()
+    config.read(CREATED_FILE_PATH)
+    assert config.get("DJANGO", "KEY") == secret_key
+    assert config.get("DATABASE_CREDENTIALS", "PASSWORD") == password
+    assert config.get("NEW", "VALUE") == "new"
+    assert (
+        encryption.decrypt(config.get("DATABASE_CREDENTIALS", "USER"), secret_key)
+        == "new user"
+    )
+
+    init_and_launch_command([TEMPLATE_FILE_PATH, CREATED_FILE_PATH, "--update"])
+    config = configparser.RawConfigParser()
+    config.read(CREATED_FILE_PATH)
+    assert config.get("DATABASE_CREDENTIALS", "USER") == "new user"
+    assert config.get("DATABASE_CREDENTIALS", "PASSWORD") == password
+    os.remove(CREATED_FILE_PATH)
+
+
+@mock.patch("getpass.getpass")
+@mock.patch("django_settings_custom.management.commands.generate_settings.get_input")
+@mock.patch("django.conf.settings", FakeSettings())
+def test_generate_file_envelope(input_mock, getpass_mock):
+    """Test envelope encryption, kept by update."""
+    input_mock.side_effect = ["user"]
+    getpass_mock.return_value = "pass"
+    init_and_launch_command(
+        [TEMPLATE_FILE_PATH, CREATED_FILE_PATH, "--force-secretkey"]
+    )
+    init_and_launch_command(
+        [TEMPLATE_FILE_PATH, CREATED_FILE_PATH, "--update", "--envelope"]
+    )
+    config = configparser.RawConfigParser()
+    config.read(CREATED_FILE_PATH)
+    data_key = encryption.read_data_key(config, config.get("DJANGO", "KEY"))
+    password = config.get("DATABASE_CREDENTIALS", "PASSWORD")
+    assert encryption.decrypt(password, data_key) == "pass"
+
+    init_and_launch_command([TEMPLATE_FILE_PATH, CREATED_FILE_PATH, "--update"])
+    config = configparser.RawConfigParser()
+    config.read(CREATED_FILE_PATH)
+    assert encryption.read_data_key(config, config.get("DJANGO", "KEY")) == data_key
+    assert config.get("DATABASE_CREDENTIALS", "PASSWORD") == password
+    assert getpass_mock.call_count == 1
+    os.remove(CREATED_FILE_PATH)
+
+
+@mock.patch("getpass.getpass")
+@mock.patch("django_settings_custom.management.commands.generate_settings.get_input")
+@mock.patch("django.conf.settings", FakeSettings(SETTINGS_ENCRYPTION_MODE="gcm"))
+def test_generate_file_gcm(input_mock, getpass_mock):
+    """Test authenticated encryption mode from settings."""
+    input_mock.side_effect = ["user"]
+    getpass_mock.return_value = "pass"
+    init_and_launch_command(
+        [TEMPLATE_FILE_PATH, CREATED_FILE_PATH, "--force-secretkey"]
+    )
+    config = configparser.RawConfigParser()
+    config.read(CREATED_FILE_PATH)
+    password = config.get("DATABASE_CREDENTIALS", "PASSWORD")
+    assert encryption.get_mode(password) == encryption.MODE_GCM
+    assert encryption.decrypt(password, config.get("DJANGO", "KEY")) == "pass"
+    os.remove(CREATED_FILE_PATH)
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""Test generation module."""
+import os
+
+import pytest
+import six
+from six.moves import configparser
+
+from django_settings_custom import encryption, generation
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+RESOURCES_DIR = os.path.join(os.path.dirname(__file__), "resources")
+TEMPLATE_FILE_PATH = os.path.join(RESOURCES_DIR, "conf_template_test.ini")
+SECRET_KEY = "b(l$!na5rzuo+h(psyrlees(p9talk)u!=pjk#6=0v!n*q#y!m"
+VALUES = {"DATABASE_CREDENTIALS": {"USER": "user", "password": "pass"}}
+
+
+def test_get_placeholders():
+    """Placeholders are listed in template order."""
+    template = generation.parse_template(TEMPLATE_FILE_PATH)
+    assert generation.get_placeholders(template) == [
+        ("DATABASE_CREDENTIALS", "user", "USER_VALUE"),
+        ("DATABASE_CREDENTIALS", "password", "ENCRYPTED_USER_VALUE"),
+        ("DJANGO", "key", "DJANGO_SECRET_KEY"),
+    ]
+
+
+def test_render_settings():
+    """Render with a given secret key, without modifying the template."""
+    template = generation.parse_template(TEMPLATE_FILE_PATH)
+    config, secret_key = generation.render_settings(template, VALUES, SECRET_KEY)
+
+    assert secret_key == SECRET_KEY
+    assert config.get("DJANGO", "key") == SECRET_KEY
+    assert config.get("DATABASE_CREDENTIALS", "user") == "user"
+    password = config.get("DATABASE_CREDENTIALS", "password")
+    assert encryption.decrypt(password, SECRET_KEY) == "pass"
+    assert config.get("CONSTANT", "same") == "'CONSTANT VALUE'"
+    assert template.get("DATABASE_CREDENTIALS", "user") == "{ USER_VALUE }"
+
+
+def test_render_settings_keeps_secret_key():
+    """A given secret key is never replaced by a generated one."""
+    with mock.patch(
+        "django_settings_custom.encryption.decrypt", side_effect=ValueError
+    ) as decrypt_mock:
+        with pytest.raises(ValueError):
+            generation.render_settings(TEMPLATE_FILE_PATH, VALUES, SECRET_KEY)
+    assert decrypt_mock.call_count == 1
+
+
+def test_read_properties():
+    """Placeholders are classified, existing values are kept as written."""
+    answers = {
+        ("DATABASE_CREDENTIALS", "user"): "user",
+        ("DATABASE_CREDENTIALS", "password"): generation.ExistingValue("encrypted"),
+    }
+    properties = generation.read_properties(
+        TEMPLATE_FILE_PATH, lambda section, key, value_type: answers[(section, key)]
+    )
+    assert properties.values["DATABASE_CREDENTIALS"] == {
+        "user": "user",
+        "password": "encrypted",
+    }
+    assert properties.encrypted_fields == []
+    assert properties.django_keys == [("DJANGO", "key")]
+
+    answers[("DATABASE_CREDENTIALS", "password")] = "pass"
+    properties = generation.read_properties(
+        TEMPLATE_FILE_PATH, lambda section, key, value_type: answers[(section, key)]
+    )
+    assert properties.encrypted_fields == [("DATABASE_CREDENTIALS", "password")]
+
+
+def test_render_settings_generated_key(tmpdir):
+    """Render with a generated secret key and write the file."""
+    config, secret_key = generation.render_settings(TEMPLATE_FILE_PATH, VALUES)
+    assert config.get("DJANGO", "key") == secret_key
+    assert "%" not in secret_key
+
+    settings_file_path = str(tmpdir.join("settings", "conf.ini"))
+    generation.write_settings(config, settings_file_path)
+    written = configparser.RawConfigParser()
+    written.read(settings_file_path)
+    assert written.get("DATABASE_CREDENTIALS", "user") == "user"
+    with open(settings_file_path) as settings_file:
+        assert settings_file.read() == generation.settings_to_string(config)
+
+
+def test_render_settings_missing_values():
+    """Every missing value is reported."""
+    with pytest.raises(ValueError) as error:
+        generation.render_settings(TEMPLATE_FILE_PATH, {})
+    assert "[DATABASE_CREDENTIALS] user" in str(error.value)
+    assert "[DATABASE_CREDENTIALS] password" in str(error.value)
+
+
+def test_copy_config_defaults():
+    """Default values are kept once in the copy."""
+    config = configparser.RawConfigParser()
+    config.set(configparser.DEFAULTSECT, "shared", "value")
+    config.add_section("SECTION")
+    config.set("SECTION", "key", "value")
+    config.add_section("OTHER")
+    config.set("OTHER", "shared", "value")
+
+    copy = generation.copy_config(config)
+    assert copy.defaults() == {"shared": "value"}
+    section = generation.settings_to_string(copy).split("[SECTION]")[1]
+    assert "shared" not in section.split("[OTHER]")[0]
+    assert copy.get("SECTION", "shared") == "value"
+    copy.set(configparser.DEFAULTSECT, "shared", "changed")
+    assert copy.get("OTHER", "shared") == "value"
+
+
+def test_write_settings_mode(tmpdir):
+    """A new file gets the default mode, an existing file keeps its mode."""
+    config = configparser.RawConfigParser()
+    config.add_section("SECTION")
+    config.set("SECTION", "key", "value")
+    settings_file_path = str(tmpdir.join("conf", "conf.ini"))
+    umask = os.umask(0o027)
+    try:
+        generation.write_settings(config, settings_file_path)
+    finally:
+        os.umask(umask)
+    assert os.stat(settings_file_path).st_mode & 0o777 == 0o640
+
+    os.chmod(settings_file_path, 0o600)
+    generation.write_settings(config, settings_file_path)
+    assert os.stat(settings_file_path).st_mode & 0o777 == 0o600
+    assert os.listdir(os.path.dirname(settings_file_path)) == ["conf.ini"]
+
+
+def test_render_settings_gcm():
+    """GCM values are not decrypted again to be checked."""
+    with mock.patch("django_settings_custom.encryption.decrypt") as decrypt_mock:
+        config, secret_key = generation.render_settings(
+            TEMPLATE_FILE_PATH, VALUES, SECRET_KEY, encryption.MODE_GCM
+        )
+        decrypt_mock.assert_not_called()
+    password = config.get("DATABASE_CREDENTIALS", "password")
+    assert password.startswith(encryption.GCM_PREFIX)
+    assert encryption.decrypt(password, SECRET_KEY) == "pass"
+
+
+def test_render_settings_siv():
+    """Rendering again with the same key gives the same file."""
+    config, _ = generation.render_settings(
+        TEMPLATE_FILE_PATH, VALUES, SECRET_KEY, encryption.MODE_SIV
+    )
+    password = config.get("DATABASE_CREDENTIALS", "password")
+    assert password.startswith(encryption.SIV_PREFIX)
+    assert encryption.decrypt(password, SECRET_KEY) == "pass"
+    config_again, _ = generation.render_settings(
+        TEMPLATE_FILE_PATH, VALUES, SECRET_KEY, encryption.MODE_SIV
+    )
+    assert generation.settings_to_string(config_again) == (
+        generation.settings_to_string(config)
+    )
+
+
+def test_render_settings_envelope(tmpdir):
+    """Values are encrypted with a data key and rotation only wraps it again."""
+    config, secret_key = generation.render_settings(
+        TEMPLATE_FILE_PATH, VALUES, SECRET_KEY, envelope=True
+    )
+    data_key = encryption.read_data_key(config, SECRET_KEY)
+    assert data_key != SECRET_KEY
+    password = config.get("DATABASE_CREDENTIALS", "password")
+    assert encryption.decrypt(password, data_key) == "pass"
+
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    generation.write_settings(config, settings_file_path)
+    new_secret_key = generation.rotate_settings(settings_file_path, TEMPLATE_FILE_PATH)
+    rotated = configparser.RawConfigParser()
+    rotated.read(settings_file_path)
+    assert rotated.get("DJANGO", "key") == new_secret_key
+    assert rotated.get("DATABASE_CREDENTIALS", "password") == password
+    assert encryption.read_data_key(rotated, new_secret_key) == data_key
+    with pytest.raises(ValueError):
+        encryption.read_data_key(rotated, SECRET_KEY)
+
+
+def test_render_settings_sources(tmpdir):
+    """Source placeholders are read from their source, and encrypted if tagged."""
+    template = configparser.RawConfigParser()
+    template.add_section("DATABASE")
+    template.set("DATABASE", "host", "{ ENV_VALUE: DATABASE_HOST }")
+    template.set("DATABASE", "password", "{ ENCRYPTED_ENV_VALUE: DATABASE_PASSWORD }")
+    template.add_section("DJANGO")
+    template.set("DJANGO", "key", "{ DJANGO_SECRET_KEY }")
+
+    with pytest.raises(ValueError):
+        generation.render_settings(template, {}, SECRET_KEY)
+    with mock.patch.dict(
+        os.environ, {"DATABASE_HOST": "localhost", "DATABASE_PASSWORD": "pass"}
+    ):
+        config, _ = generation.render_settings(template, {}, SECRET_KEY)
+    assert config.get("DATABASE", "host") == "localhost"
+    password = config.get("DATABASE", "password")
+    assert encryption.decrypt(password, SECRET_KEY) == "pass"
+
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    generation.write_settings(config, settings_file_path)
+    new_secret_key = generation.rotate_settings(settings_file_path, template)
+    rotated = configparser.RawConfigParser()
+    rotated.read(settings_file_path)
+    assert (
+        encryption.decrypt(rotated.get("DATABASE", "password"), new_secret_key)
+        == "pass"
+    )
+
+
+def test_diff_settings(tmpdir):
+    """Encrypted values are compared decrypted, secret values are masked."""
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    config, _ = generation.render_settings(TEMPLATE_FILE_PATH, VALUES, SECRET_KEY)
+    assert generation.write_settings_if_changed(
+        config, settings_file_path, TEMPLATE_FILE_PATH
+    )
+    mtime = os.path.getmtime(settings_file_path)
+
+    config, _ = generation.render_settings(TEMPLATE_FILE_PATH, VALUES, SECRET_KEY)
+    assert (
+        generation.diff_settings(config, settings_file_path, TEMPLATE_FILE_PATH) == []
+    )
+    assert not generation.write_settings_if_changed(
+        config, settings_file_path, TEMPLATE_FILE_PATH
+    )
+    assert os.path.getmtime(settings_file_path) == mtime
+
+    values = {"DATABASE_CREDENTIALS": {"USER": "other", "PASSWORD": "other pass"}}
+    config, _ = generation.render_settings(
+        TEMPLATE_FILE_PATH, values, SECRET_KEY, mode=encryption.MODE_GCM
+    )
+    config.remove_option("CONSTANT", "same")
+    config.set("CONSTANT", "new", "value")
+    assert generation.diff_settings(config, settings_file_path, TEMPLATE_FILE_PATH) == [
+        ("DATABASE_CREDENTIALS", "password", generation.MASK, generation.MASK),
+        ("DATABASE_CREDENTIALS", "user", "user", "other"),
+        ("CONSTANT", "new", None, "value"),
+        ("CONSTANT", "same", "'CONSTANT VALUE'", None),
+    ]
+
+    values = {"DATABASE_CREDENTIALS": {"USER": "user", "PASSWORD": "pass"}}
+    config, _ = generation.render_settings(TEMPLATE_FILE_PATH, values, envelope=True)
+    assert [
+        (change.section, change.key)
+        for change in generation.diff_settings(
+            config, settings_file_path, TEMPLATE_FILE_PATH
+        )
+    ] == [("DJANGO", "key"), (encryption.DATA_KEY_SECTION, encryption.DATA_KEY_OPTION)]
+
+
+def test_render_settings_encrypted_file(tmpdir):
+    """ENCRYPTED_FILE fields are encrypted in a blob next to the settings file."""
+    template = configparser.RawConfigParser()
+    template.add_section("TLS")
+    template.set("TLS", "key", "{ ENCRYPTED_FILE }")
+    template.add_section("DJANGO")
+    template.set("DJANGO", "key", "{ DJANGO_SECRET_KEY }")
+    source_path = str(tmpdir.join("tls.key"))
+    with open(source_path, "wb") as source_file:
+        source_file.write(b"private key")
+    settings_file_path = str(tmpdir.join("settings", "conf.ini"))
+
+    with pytest.raises(ValueError):
+        generation.render_settings(template, {"TLS": {"key": source_path}})
+    config, secret_key = generation.render_settings(
+        template, {"TLS": {"key": source_path}}, settings_file_path=settings_file_path
+    )
+    blob_path = generation.sidecar_path(settings_file_path, "TLS", "key")
+    assert config.get("TLS", "key") == os.path.basename(blob_path)
+    with open(blob_path, "rb") as blob_file:
+        assert b"private key" not in blob_file.read()
+
+    generation.write_settings(config, settings_file_path)
+    new_secret_key = generation.rotate_settings(settings_file_path, template)
+    decrypted_stream = six.BytesIO()
+    with open(blob_path, "rb") as blob_file:
+        encryption.decrypt_stream(blob_file, decrypted_stream, new_secret_key)
+    assert decrypted_stream.getvalue() == b"private key"
+
+
+def test_rotate_settings_missing_blob(tmpdir):
+    """Blobs are not changed if one of them can't be encrypted again."""
+    template = configparser.RawConfigParser()
+    template.add_section("TLS")
+    template.set("TLS", "key", "{ ENCRYPTED_FILE }")
+    template.set("TLS", "certificate", "{ ENCRYPTED_FILE }")
+    template.add_section("DJANGO")
+    template.set("DJANGO", "key", "{ DJANGO_SECRET_KEY }")
+    values = {}
+    for key in ("key", "certificate"):
+        source_path = str(tmpdir.join(key))
+        with open(source_path, "wb") as source_file:
+            source_file.write(b"content of " + key.encode())
+        values[key] = source_path
+    settings_file_path = str(tmpdir.join("settings", "conf.ini"))
+    config, secret_key = generation.render_settings(
+        template, {"TLS": values}, settings_file_path=settings_file_path
+    )
+    generation.write_settings(config, settings_file_path)
+    with open(settings_file_path) as settings_file:
+        content = settings_file.read()
+    os.remove(generation.sidecar_path(settings_file_path, "TLS", "certificate"))
+
+    with pytest.raises(IOError):
+        generation.rotate_settings(settings_file_path, template)
+    with open(settings_file_path) as settings_file:
+        assert settings_file.read() == content
+    assert sorted(os.listdir(str(tmpdir.join("settings")))) == [
+        "conf.ini",
+        os.path.basename(generation.sidecar_path(settings_file_path, "TLS", "key")),
+    ]
+    decrypted_stream = six.BytesIO()
+    blob_path = generation.sidecar_path(settings_file_path, "TLS", "key")
+    with open(blob_path, "rb") as blob_file:
+        encryption.decrypt_stream(blob_file, decrypted_stream, secret_key)
+    assert decrypted_stream.getvalue() == b"content of key"
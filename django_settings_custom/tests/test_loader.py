@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Test loader module."""
+import os
+
+import pytest
+
+from django.conf import LazySettings
+from django.core.exceptions import ImproperlyConfigured
+
+from django_settings_custom import encryption, generation, loader
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+RESOURCES_DIR = os.path.join(os.path.dirname(__file__), "resources")
+TEMPLATE_FILE_PATH = os.path.join(RESOURCES_DIR, "conf_template_test.ini")
+SECRET_KEY = "b(l$!na5rzuo+h(psyrlees(p9talk)u!=pjk#6=0v!n*q#y!m"
+
+
+class FakeSettings:
+    """Class to mock django settings."""
+
+    configured = True
+    SECRET_KEY = "$lj&)_)1cc7tm3qikje-u*45mz8za^0wuf*^pm0qjs=xcwy=vo"
+
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
+def write_settings_file(path, password="pass", user="user"):
+    """Write a settings file as generate_settings does for the test template."""
+    with open(path, "w") as settings_file:
+        settings_file.write(
+            "[DATABASE_CREDENTIALS]\n"
+            "USER = %s\n"
+            "PASSWORD = %s\n\n"
+            "[DJANGO]\n"
+            "KEY = %s\n\n"
+            "[CONSTANT]\n"
+            "SAME = 'CONSTANT VALUE'\n"
+            % (user, encryption.encrypt(password, SECRET_KEY), SECRET_KEY)
+        )
+
+
+def test_load_settings(tmpdir):
+    """Encrypted fields are decrypted with the DJANGO_SECRET_KEY field."""
+    loader.clear_cache()
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    write_settings_file(settings_file_path)
+
+    values = loader.load_settings(settings_file_path, TEMPLATE_FILE_PATH)
+    assert values["DATABASE_CREDENTIALS"] == {"user": "user", "password": "pass"}
+    assert values["DJANGO"]["key"] == SECRET_KEY
+    assert values["CONSTANT"]["same"] == "'CONSTANT VALUE'"
+
+
+def test_load_settings_snapshot(tmpdir):
+    """The snapshot of the settings file is written, not the one of the template."""
+    loader.clear_cache()
+    template_file_path = str(tmpdir.join("template.ini"))
+    with open(TEMPLATE_FILE_PATH) as source, open(template_file_path, "w") as target:
+        target.write(source.read())
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    write_settings_file(settings_file_path)
+
+    values = loader.load_settings(
+        settings_file_path, template_file_path, use_snapshot=True
+    )
+    assert values["DATABASE_CREDENTIALS"] == {"user": "user", "password": "pass"}
+    assert os.path.exists(settings_file_path + ".snapshot")
+    assert not os.path.exists(template_file_path + ".snapshot")
+
+
+def test_load_settings_envelope(tmpdir):
+    """Encrypted fields are decrypted with the unwrapped data key."""
+    loader.clear_cache()
+    config, _ = generation.render_settings(
+        TEMPLATE_FILE_PATH,
+        {"DATABASE_CREDENTIALS": {"USER": "user", "PASSWORD": "pass"}},
+        SECRET_KEY,
+        envelope=True,
+    )
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    generation.write_settings(config, settings_file_path)
+
+    values = loader.load_settings(settings_file_path, TEMPLATE_FILE_PATH)
+    assert values["DATABASE_CREDENTIALS"] == {"user": "user", "password": "pass"}
+    assert encryption.DATA_KEY_SECTION not in values
+
+
+def test_load_settings_encrypted_file(tmpdir):
+    """ENCRYPTED_FILE fields are the absolute path of their blob."""
+    loader.clear_cache()
+    template_file_path = str(tmpdir.join("template.ini"))
+    with open(template_file_path, "w") as template_file:
+        template_file.write("[TLS]\nKEY = { ENCRYPTED_FILE }\n")
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    with open(settings_file_path, "w") as settings_file:
+        settings_file.write("[TLS]\nKEY = conf.ini.tls.key.enc\n")
+
+    values = loader.load_settings(settings_file_path, template_file_path)
+    assert values["TLS"]["key"] == str(tmpdir.join("conf.ini.tls.key.enc"))
+
+
+def test_load_settings_overlays(tmpdir):
+    """Encrypted fields of the overlays are decrypted."""
+    overlay_path = str(tmpdir.join("overlay.ini"))
+    with open(overlay_path, "w") as overlay_file:
+        overlay_file.write("[DATABASE_CREDENTIALS]\nUSER = { ENCRYPTED_USER_VALUE }\n")
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    write_settings_file(settings_file_path, user=encryption.encrypt("user", SECRET_KEY))
+
+    values = loader.load_settings(
+        settings_file_path, TEMPLATE_FILE_PATH, template_overlays=[overlay_path]
+    )
+    assert values["DATABASE_CREDENTIALS"] == {"user": "user", "password": "pass"}
+    with mock.patch(
+        "django.conf.settings", FakeSettings(SETTINGS_TEMPLATE_OVERLAYS=[overlay_path])
+    ):
+        assert loader.load_settings(settings_file_path, TEMPLATE_FILE_PATH) is values
+
+
+def test_load_settings_cache(tmpdir):
+    """The file is parsed again only when it changes."""
+    loader.clear_cache()
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    write_settings_file(settings_file_path)
+
+    with mock.patch(
+        "django_settings_custom.loader._parse", wraps=loader._parse
+    ) as parse_mock:
+        values = loader.load_settings(settings_file_path, TEMPLATE_FILE_PATH)
+        assert loader.load_settings(settings_file_path, TEMPLATE_FILE_PATH) is values
+        assert parse_mock.call_count == 1
+
+        write_settings_file(settings_file_path, password="a new password")
+        values = loader.load_settings(settings_file_path, TEMPLATE_FILE_PATH)
+        assert values["DATABASE_CREDENTIALS"]["password"] == "a new password"
+        assert parse_mock.call_count == 2
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_load_settings_without_template(tmpdir):
+    """Without template, values are not decrypted."""
+    loader.clear_cache()
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    write_settings_file(settings_file_path)
+
+    values = loader.load_settings(settings_file_path)
+    assert values["DATABASE_CREDENTIALS"]["password"] != "pass"
+
+
+@mock.patch("django.conf.settings", LazySettings())
+def test_load_settings_unconfigured(tmpdir):
+    """The settings file can be loaded from settings.py, before configuration."""
+    loader.clear_cache()
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    write_settings_file(settings_file_path)
+
+    values = loader.load_settings(settings_file_path)
+    assert values["DJANGO"]["key"] == SECRET_KEY
+    with pytest.raises(ImproperlyConfigured):
+        loader.load_settings()
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_load_settings_missing_path():
+    """The settings file path is needed."""
+    with pytest.raises(ImproperlyConfigured):
+        loader.load_settings()
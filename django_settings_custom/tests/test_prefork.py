@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Test prefork module."""
+import os
+import sys
+
+import pytest
+
+from django_settings_custom import encryption, loader, prefork
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+RESOURCES_DIR = os.path.join(os.path.dirname(__file__), "resources")
+TEMPLATE_FILE_PATH = os.path.join(RESOURCES_DIR, "conf_template_test.ini")
+SECRET_KEY = "b(l$!na5rzuo+h(psyrlees(p9talk)u!=pjk#6=0v!n*q#y!m"
+
+
+def test_warm_settings(tmpdir):
+    """Warmed values are read-only and returned without parsing again."""
+    loader.clear_cache()
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    with open(settings_file_path, "w") as settings_file:
+        settings_file.write(
+            "[DATABASE_CREDENTIALS]\nUSER = user\nPASSWORD = %s\n\n[DJANGO]\nKEY = %s\n"
+            % (encryption.encrypt("pass", SECRET_KEY), SECRET_KEY)
+        )
+
+    values = prefork.warm_settings(
+        settings_file_path, TEMPLATE_FILE_PATH, use_snapshot=False, freeze_gc=False
+    )
+    assert values["DATABASE_CREDENTIALS"]["password"] == "pass"
+    if sys.version_info >= (3,):
+        with pytest.raises(TypeError):
+            values["DATABASE_CREDENTIALS"]["password"] = "other"
+        with pytest.raises(TypeError):
+            values["OTHER"] = {}
+
+    with mock.patch("django_settings_custom.loader._parse") as parse_mock:
+        assert (
+            loader.load_settings(
+                settings_file_path, TEMPLATE_FILE_PATH, use_snapshot=False
+            )
+            is values
+        )
+        parse_mock.assert_not_called()
+    loader.clear_cache()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Test rotation of settings key."""
+import argparse
+import os
+
+import pytest
+from six.moves import configparser
+
+from django.core.management.base import CommandError
+
+from django_settings_custom import encryption, generation
+from django_settings_custom.management.commands import rotate_settings_key
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+RESOURCES_DIR = os.path.join(os.path.dirname(__file__), "resources")
+TEMPLATE_FILE_PATH = os.path.join(RESOURCES_DIR, "conf_template_test.ini")
+SECRET_KEY = "b(l$!na5rzuo+h(psyrlees(p9talk)u!=pjk#6=0v!n*q#y!m"
+NEW_SECRET_KEY = "$lj&)_)1cc7tm3qikje-u*45mz8za^0wuf*^pm0qjs=xcwy=vo"
+
+
+class FakeSettings:
+    """Class to mock django settings."""
+
+    configured = True
+
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
+def init_and_launch_command(command_arguments):
+    """Launch key rotation as command."""
+    parser = argparse.ArgumentParser()
+    command = rotate_settings_key.Command()
+    command.add_arguments(parser)
+    options = parser.parse_args(command_arguments)
+    command.handle(**vars(options))
+
+
+def write_settings_file(path, password):
+    """Write a settings file encrypted with SECRET_KEY."""
+    config, _ = generation.render_settings(
+        TEMPLATE_FILE_PATH,
+        {"DATABASE_CREDENTIALS": {"USER": "user", "PASSWORD": password}},
+        SECRET_KEY,
+    )
+    generation.write_settings(config, path)
+
+
+def read_password(path):
+    """Return the secret key and the decrypted password of a settings file."""
+    config = configparser.RawConfigParser()
+    config.read(path)
+    secret_key = config.get("DJANGO", "KEY")
+    password = config.get("DATABASE_CREDENTIALS", "PASSWORD")
+    return secret_key, encryption.decrypt(password, secret_key)
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_rotate_directory(tmpdir):
+    """Every settings file of a directory is rotated."""
+    for index in range(3):
+        write_settings_file(str(tmpdir.join("conf%s.ini" % index)), "pass%s" % index)
+    tmpdir.join("other.txt").write("not a settings file")
+
+    init_and_launch_command(
+        [str(tmpdir), "--template", TEMPLATE_FILE_PATH, "--new-key", NEW_SECRET_KEY]
+    )
+    for index in range(3):
+        path = str(tmpdir.join("conf%s.ini" % index))
+        assert read_password(path) == (NEW_SECRET_KEY, "pass%s" % index)
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_rotate_generated_key(tmpdir):
+    """A new key is generated when none is given."""
+    path = str(tmpdir.join("conf.ini"))
+    write_settings_file(path, "pass")
+
+    init_and_launch_command([path, "--template", TEMPLATE_FILE_PATH])
+    secret_key, password = read_password(path)
+    assert secret_key != SECRET_KEY
+    assert password == "pass"
+
+
+@mock.patch("django.conf.settings", FakeSettings())
+def test_rotate_errors(tmpdir):
+    """Files which can't be decrypted are reported."""
+    path = str(tmpdir.join("conf.ini"))
+    write_settings_file(path, "pass")
+
+    with pytest.raises(CommandError):
+        init_and_launch_command(
+            [path, "--template", TEMPLATE_FILE_PATH, "--old-key", NEW_SECRET_KEY]
+        )
+    assert read_password(path) == (SECRET_KEY, "pass")
+
+    without_key_path = str(tmpdir.join("without_key.ini"))
+    with open(path) as settings_file, open(without_key_path, "w") as target:
+        target.write(settings_file.read().replace("[DJANGO]", "[OTHER]"))
+    with pytest.raises(CommandError):
+        init_and_launch_command(
+            [
+                without_key_path,
+                "--template",
+                TEMPLATE_FILE_PATH,
+                "--old-key",
+                SECRET_KEY,
+            ]
+        )
+    config = configparser.RawConfigParser()
+    config.read(without_key_path)
+    password = config.get("DATABASE_CREDENTIALS", "PASSWORD")
+    assert encryption.decrypt(password, SECRET_KEY) == "pass"
+
+    with open(TEMPLATE_FILE_PATH) as template_file:
+        template = template_file.read()
+    template_file_path = str(tmpdir.join("template.ini"))
+    with open(template_file_path, "w") as template_file:
+        template_file.write(template + "\n[TLS]\nKEY = { ENCRYPTED_FILE }\n")
+    with open(path, "a") as settings_file:
+        settings_file.write("\n[TLS]\nKEY = missing.enc\n")
+    with pytest.raises(CommandError) as error:
+        init_and_launch_command([path, "--template", template_file_path])
+    assert "missing.enc" in str(error.value)
+
+    with pytest.raises(CommandError):
+        init_and_launch_command([path])
+    with pytest.raises(CommandError):
+        init_and_launch_command(["--template", TEMPLATE_FILE_PATH])
+    with pytest.raises(CommandError):
+        init_and_launch_command(["not/existing.ini", "--template", TEMPLATE_FILE_PATH])
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Test snapshot module."""
+import os
+
+from django_settings_custom import snapshot
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+CONTENT = "[DATABASE]\nNAME = a_name\nPORT = 900\n\n[DJANGO]\nKEY = a_key\n"
+VALUES = {"DATABASE": {"name": "a_name", "port": "900"}, "DJANGO": {"key": "a_key"}}
+
+
+def write_file(path, content):
+    """Write content in the file."""
+    with open(path, "w") as created_file:
+        created_file.write(content)
+
+
+def test_read_values_from_snapshot(tmpdir):
+    """The snapshot is written on first read and used afterwards."""
+    path = str(tmpdir.join("conf.ini"))
+    write_file(path, CONTENT)
+
+    assert snapshot.read_values(path) == VALUES
+    assert os.path.exists(snapshot.snapshot_path(path))
+    with mock.patch("django_settings_custom.snapshot.parse_values") as parse_mock:
+        assert snapshot.read_values(path) == VALUES
+        parse_mock.assert_not_called()
+
+
+def test_outdated_snapshot(tmpdir):
+    """The snapshot is not used when the file changed."""
+    path = str(tmpdir.join("conf.ini"))
+    write_file(path, CONTENT)
+    snapshot.write_snapshot(path)
+
+    write_file(path, CONTENT.replace("900", "901"))
+    assert snapshot.read_values(path)["DATABASE"]["port"] == "901"
+
+
+def test_corrupted_snapshot(tmpdir):
+    """A corrupted snapshot is ignored and written again."""
+    path = str(tmpdir.join("conf.ini"))
+    write_file(path, CONTENT)
+    snapshot.write_snapshot(path)
+    with open(snapshot.snapshot_path(path), "r+b") as snapshot_file:
+        snapshot_file.truncate(50)
+
+    assert snapshot.read_values(path) == VALUES
+    assert snapshot.read_values(path) == VALUES
+
+
+def test_read_values_without_snapshot(tmpdir):
+    """No snapshot is written when it is disabled."""
+    path = str(tmpdir.join("conf.ini"))
+    write_file(path, CONTENT)
+
+    assert snapshot.read_values(path, use_snapshot=False) == VALUES
+    assert not os.path.exists(snapshot.snapshot_path(path))
+    assert snapshot.read_values(path, refresh=False) == VALUES
+    assert not os.path.exists(snapshot.snapshot_path(path))
+
+
+def test_snapshot_mode(tmpdir):
+    """The snapshot gets the mode of the file, which holds the same secrets."""
+    path = str(tmpdir.join("conf.ini"))
+    write_file(path, CONTENT)
+    os.chmod(path, 0o600)
+
+    snapshot.read_values(path)
+    assert os.stat(snapshot.snapshot_path(path)).st_mode & 0o777 == 0o600
+    assert sorted(os.listdir(str(tmpdir))) == ["conf.ini", "conf.ini.snapshot"]
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Test sources module."""
+import os
+import sys
+
+import pytest
+
+from django_settings_custom import sources
+from django_settings_custom.template import Placeholder
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+def placeholder(key, value_type, argument):
+    """Return a placeholder of the SOURCES section."""
+    return Placeholder("SOURCES", key, value_type, 0, argument)
+
+
+def python_command(code):
+    """Return a command line running Python code."""
+    return '"%s" -c "%s"' % (sys.executable, code)
+
+
+def test_resolve_sources(tmpdir):
+    """Sources are read by tag, other placeholders are ignored."""
+    source_file_path = str(tmpdir.join("secret.txt"))
+    with open(source_file_path, "w") as source_file:
+        source_file.write("file value\n")
+
+    with mock.patch.dict(os.environ, {"SOURCE_VARIABLE": "env value"}):
+        values = sources.resolve_sources(
+            [
+                placeholder("env", "ENV_VALUE", "SOURCE_VARIABLE"),
+                placeholder("file", "ENCRYPTED_FILE_VALUE", source_file_path),
+                placeholder("command", "COMMAND_VALUE", python_command("print(42)")),
+                placeholder("user", "USER_VALUE", None),
+            ]
+        )
+    assert values == {
+        ("SOURCES", "env"): "env value",
+        ("SOURCES", "file"): "file value",
+        ("SOURCES", "command"): "42",
+    }
+    assert sources.resolve_sources([placeholder("user", "USER_VALUE", None)]) == {}
+
+
+def test_resolve_sources_once():
+    """A source used by several placeholders is read once."""
+    with mock.patch.dict(sources.READERS, {"ENV_VALUE": mock.Mock(return_value="v")}):
+        values = sources.resolve_sources(
+            [
+                placeholder("first", "ENV_VALUE", "SOURCE_VARIABLE"),
+                placeholder("second", "ENCRYPTED_ENV_VALUE", "SOURCE_VARIABLE"),
+            ]
+        )
+        assert sources.READERS["ENV_VALUE"].call_count == 1
+    assert values == {("SOURCES", "first"): "v", ("SOURCES", "second"): "v"}
+
+
+def test_resolve_sources_errors(tmpdir):
+    """Every source which can't be read is reported at once."""
+    with pytest.raises(ValueError) as error:
+        sources.resolve_sources(
+            [
+                placeholder("env", "ENV_VALUE", "UNDEFINED_SOURCE_VARIABLE"),
+                placeholder("file", "FILE_VALUE", str(tmpdir.join("missing"))),
+                placeholder("command", "COMMAND_VALUE", python_command("exit(3)")),
+                placeholder("empty", "ENV_VALUE", None),
+            ]
+        )
+    message = str(error.value)
+    assert "[SOURCES] env: The environment variable" in message
+    assert "[SOURCES] file: Can't read" in message
+    assert "[SOURCES] command: " in message and "exit status 3" in message
+    assert "[SOURCES] empty: ENV_VALUE needs an argument" in message
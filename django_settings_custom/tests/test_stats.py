@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Test stats module."""
+from django_settings_custom import encryption, stats
+
+SECRET_KEY = "b(l$!na5rzuo+h(psyrlees(p9talk)u!=pjk#6=0v!n*q#y!m"
+
+
+def test_stats_disabled():
+    """Nothing is recorded while stats are disabled."""
+    stats.reset_stats()
+    encryption.encrypt("value", SECRET_KEY)
+    with stats.timer("block"):
+        pass
+    assert stats.get_stats() == {}
+
+
+def test_stats_enabled():
+    """Calls and time are recorded by name."""
+    stats.reset_stats()
+    previous = stats.enable()
+    try:
+        value = encryption.encrypt("value", SECRET_KEY)
+        encryption.decrypt(value, SECRET_KEY)
+        encryption.decrypt_many([value, value], SECRET_KEY)
+        with stats.timer("block"):
+            pass
+    finally:
+        stats.enable(previous)
+
+    collected = stats.get_stats()
+    assert collected["encrypt"]["calls"] == 1
+    assert collected["decrypt"]["calls"] == 1
+    assert collected["decrypt_many"]["calls"] == 1
+    assert collected["compute_key"]["calls"] == 3
+    assert collected["block"]["calls"] == 1
+    assert collected["encrypt"]["time"] > 0
+    stats.reset_stats()
+    assert stats.get_stats() == {}
+
+
+def test_stats_hooks():
+    """Hooks receive every measure, even if stats are disabled."""
+    stats.reset_stats()
+    measures = []
+
+    def hook(name, duration):
+        measures.append((name, duration))
+
+    stats.add_hook(hook)
+    try:
+        assert stats.is_active()
+        encryption.encrypt("value", SECRET_KEY)
+    finally:
+        stats.remove_hook(hook)
+    assert [name for name, _ in measures] == ["compute_key", "encrypt"]
+    assert not stats.is_active()
+    assert stats.get_stats() == {}
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Test template module."""
+import os
+import shutil
+
+from django_settings_custom import template
+
+RESOURCES_DIR = os.path.join(os.path.dirname(__file__), "resources")
+TEMPLATE_FILE_PATH = os.path.join(RESOURCES_DIR, "conf_template_test.ini")
+
+
+def test_compile_template():
+    """Placeholders are indexed with their tag and position."""
+    compiled = template.compile_template(TEMPLATE_FILE_PATH)
+    assert compiled.placeholders == (
+        ("DATABASE_CREDENTIALS", "user", "USER_VALUE", 0, None),
+        ("DATABASE_CREDENTIALS", "password", "ENCRYPTED_USER_VALUE", 1, None),
+        ("DJANGO", "key", "DJANGO_SECRET_KEY", 2, None),
+    )
+    assert compiled.fields("ENCRYPTED_USER_VALUE") == [
+        ("DATABASE_CREDENTIALS", "password")
+    ]
+    assert len(compiled.fields()) == 3
+    assert template.compile_template(compiled.config).placeholders == (
+        compiled.placeholders
+    )
+
+
+def test_compile_template_cache(tmpdir):
+    """A compiled template is reused until the file changes."""
+    template.clear_template_cache()
+    template_file_path = str(tmpdir.join("template.ini"))
+    shutil.copy(TEMPLATE_FILE_PATH, template_file_path)
+
+    compiled = template.compile_template(template_file_path)
+    assert template.compile_template(template_file_path) is compiled
+    assert template.compile_template(compiled) is compiled
+
+    with open(template_file_path, "a") as template_file:
+        template_file.write("\n[NEW]\nVALUE = { USER_VALUE }\n")
+    compiled = template.compile_template(template_file_path)
+    assert compiled.placeholders[-1] == ("NEW", "value", "USER_VALUE", 4, None)
+
+
+def test_compile_template_argument(tmpdir):
+    """The argument of a tag keeps its case and may contain colons."""
+    template_file_path = str(tmpdir.join("template.ini"))
+    with open(template_file_path, "w") as template_file:
+        template_file.write(
+            "[DATABASE]\n"
+            "HOST = { env_value: Database_Host }\n"
+            "PASSWORD = { ENCRYPTED_COMMAND_VALUE: pass show db:password }\n"
+        )
+    compiled = template.compile_template(template_file_path)
+    assert compiled.placeholders == (
+        ("DATABASE", "host", "ENV_VALUE", 0, "Database_Host"),
+        ("DATABASE", "password", "ENCRYPTED_COMMAND_VALUE", 1, "pass show db:password"),
+    )
+    assert compiled.fields(*template.ENCRYPTED_VALUE_TYPES) == [
+        ("DATABASE", "password")
+    ]
+
+
+def test_merge_templates(tmpdir):
+    """Overlays add sections and values, or replace the values of the template."""
+    template.clear_template_cache()
+    overlay_path = str(tmpdir.join("prod.ini"))
+    with open(overlay_path, "w") as overlay_file:
+        overlay_file.write(
+            "[DATABASE_CREDENTIALS]\n"
+            "USER = prod_user\n"
+            "[DATABASE]\n"
+            "HOST = { ENV_VALUE: DATABASE_HOST }\n"
+        )
+
+    assert template.merge_templates(TEMPLATE_FILE_PATH) is (
+        template.compile_template(TEMPLATE_FILE_PATH)
+    )
+    merged = template.merge_templates(TEMPLATE_FILE_PATH, [overlay_path])
+    assert merged.config.get("DATABASE_CREDENTIALS", "user") == "prod_user"
+    assert merged.config.get("CONSTANT", "same") == "'CONSTANT VALUE'"
+    assert merged.fields() == [
+        ("DATABASE_CREDENTIALS", "password"),
+        ("DJANGO", "key"),
+        ("DATABASE", "host"),
+    ]
+    assert template.compile_template(TEMPLATE_FILE_PATH).fields("USER_VALUE")
+
+    assert template.merge_templates(TEMPLATE_FILE_PATH, [overlay_path]) is merged
+    copy_path = str(tmpdir.join("copy.ini"))
+    shutil.copy(overlay_path, copy_path)
+    assert template.merge_templates(TEMPLATE_FILE_PATH, [copy_path]) is merged
+    assert template.merge_templates(
+        TEMPLATE_FILE_PATH, [overlay_path, TEMPLATE_FILE_PATH]
+    ).fields("USER_VALUE") == [("DATABASE_CREDENTIALS", "user")]
+
+
+def test_merge_templates_defaults(tmpdir):
+    """A section value equal to the DEFAULT value of its overlay is merged."""
+    template.clear_template_cache()
+    overlay_path = str(tmpdir.join("overlay.ini"))
+    with open(overlay_path, "w") as overlay_file:
+        overlay_file.write(
+            "[DEFAULT]\nuser = shared\n[DATABASE_CREDENTIALS]\nuser = shared\n"
+        )
+
+    merged = template.merge_templates(TEMPLATE_FILE_PATH, [overlay_path])
+    assert merged.config.get("DATABASE_CREDENTIALS", "user") == "shared"
+    assert merged.fields("USER_VALUE") == []
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Test watcher module."""
+import os
+import threading
+
+import pytest
+
+from django_settings_custom import encryption, signals, watcher
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+RESOURCES_DIR = os.path.join(os.path.dirname(__file__), "resources")
+TEMPLATE_FILE_PATH = os.path.join(RESOURCES_DIR, "conf_template_test.ini")
+SECRET_KEY = "b(l$!na5rzuo+h(psyrlees(p9talk)u!=pjk#6=0v!n*q#y!m"
+PASSWORD = encryption.encrypt("pass", SECRET_KEY)
+
+
+class FakeSettings:
+    """Class to mock django settings."""
+
+    configured = True
+    SECRET_KEY = "$lj&)_)1cc7tm3qikje-u*45mz8za^0wuf*^pm0qjs=xcwy=vo"
+
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
+def write_settings_file(path, user="user", password=PASSWORD):
+    """Write a settings file as generate_settings does for the test template."""
+    with open(path, "w") as settings_file:
+        settings_file.write(
+            "[DATABASE_CREDENTIALS]\n"
+            "USER = %s\n"
+            "PASSWORD = %s\n\n"
+            "[DJANGO]\n"
+            "KEY = %s\n" % (user, password, SECRET_KEY)
+        )
+
+
+def test_check(tmpdir):
+    """Only changed encrypted values are decrypted again and subscribers notified."""
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    write_settings_file(settings_file_path)
+    settings_watcher = watcher.SettingsWatcher(settings_file_path, TEMPLATE_FILE_PATH)
+    assert settings_watcher.values["DATABASE_CREDENTIALS"]["password"] == "pass"
+    assert settings_watcher.check() == []
+
+    notifications = []
+
+    def receiver(sender, **kwargs):
+        notifications.append(kwargs["changed"])
+
+    signals.settings_file_changed.connect(receiver)
+    try:
+        with mock.patch(
+            "django_settings_custom.encryption.decrypt_many",
+            wraps=encryption.decrypt_many,
+        ) as decrypt_mock:
+            write_settings_file(settings_file_path, user="new user")
+            assert settings_watcher.check() == [("DATABASE_CREDENTIALS", "user")]
+            assert list(decrypt_mock.call_args[0][0]) == []
+
+            write_settings_file(
+                settings_file_path, password=encryption.encrypt("new", SECRET_KEY)
+            )
+            assert settings_watcher.check() == [
+                ("DATABASE_CREDENTIALS", "password"),
+                ("DATABASE_CREDENTIALS", "user"),
+            ]
+    finally:
+        signals.settings_file_changed.disconnect(receiver)
+    assert settings_watcher.values["DATABASE_CREDENTIALS"] == {
+        "user": "user",
+        "password": "new",
+    }
+    assert len(notifications) == 2
+
+
+def test_check_overlays(tmpdir):
+    """The template overlays are applied, and watched."""
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    write_settings_file(settings_file_path, user=encryption.encrypt("dba", SECRET_KEY))
+    overlay_path = str(tmpdir.join("overlay.ini"))
+    with open(overlay_path, "w") as overlay_file:
+        overlay_file.write("[DATABASE_CREDENTIALS]\nUSER = { ENCRYPTED_USER_VALUE }\n")
+
+    with mock.patch(
+        "django.conf.settings", FakeSettings(SETTINGS_TEMPLATE_OVERLAYS=[overlay_path])
+    ):
+        settings_watcher = watcher.SettingsWatcher(
+            settings_file_path, TEMPLATE_FILE_PATH
+        )
+    assert settings_watcher.template_overlays == (overlay_path,)
+    assert settings_watcher.values["DATABASE_CREDENTIALS"]["user"] == "dba"
+
+    with open(overlay_path, "w") as overlay_file:
+        overlay_file.write("[OTHER]\nUSER = { USER_VALUE }\n# changed\n")
+    assert settings_watcher.check() == [("DATABASE_CREDENTIALS", "user")]
+    assert settings_watcher.values["DATABASE_CREDENTIALS"]["user"] != "dba"
+
+
+@pytest.mark.parametrize("use_inotify", [False, None])
+def test_watch_settings(tmpdir, use_inotify):
+    """The started watcher reloads the file when it is replaced."""
+    settings_file_path = str(tmpdir.join("conf.ini"))
+    write_settings_file(settings_file_path)
+    changed = threading.Event()
+
+    def receiver(sender, **kwargs):
+        changed.set()
+
+    signals.settings_file_changed.connect(receiver)
+    settings_watcher = watcher.watch_settings(
+        settings_file_path, TEMPLATE_FILE_PATH, interval=0.05, use_inotify=use_inotify
+    )
+    try:
+        temporary_path = str(tmpdir.join("conf.ini.tmp"))
+        write_settings_file(temporary_path, user="new user")
+        os.rename(temporary_path, settings_file_path)
+        assert changed.wait(5)
+    finally:
+        settings_watcher.stop()
+        signals.settings_file_changed.disconnect(receiver)
+    assert settings_watcher.values["DATABASE_CREDENTIALS"]["user"] == "new user"
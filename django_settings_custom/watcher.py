@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+.. module:: watcher
+   :synopsis: Module to reload a settings file when it changes, without restart.
+
+Example:
+    from django_settings_custom import signals, watcher
+
+    def on_change(sender, watcher, values, changed, **kwargs):
+        if ("DATABASE_CREDENTIALS", "password") in changed:
+            reconnect(values["DATABASE_CREDENTIALS"]["password"])
+
+    signals.settings_file_changed.connect(on_change)
+    watcher.watch_settings()
+
+The file is watched with inotify on Linux, or else polled. It is parsed again only
+when its mtime or size changes, and only the encrypted values which changed are
+decrypted again.
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import sys
+import threading
+
+from django_settings_custom import loader, signals
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+logger = logging.getLogger(__name__)
+
+
+def _inotify_init(directory):
+    """
+    Watch a directory with inotify.
+
+    Args:
+        directory (str): The directory to watch.
+
+    Returns:
+        int: The inotify file descriptor, or None if inotify is not available.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        file_descriptor = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if file_descriptor < 0:
+        return None
+    if not isinstance(directory, bytes):
+        directory = directory.encode(sys.getfilesystemencoding())
+    if libc.inotify_add_watch(file_descriptor, directory, WATCH_MASK) < 0:
+        os.close(file_descriptor)
+        return None
+    return file_descriptor
+
+
+class SettingsWatcher(object):
+    """
+    Keep the values of a settings file up to date.
+
+    Args:
+        settings_file_path (str): Path to the settings file,
+            or None if you want use settings.SETTINGS_FILE_PATH.
+        settings_template_file (str): Path to the settings template file,
+            or None if you want use settings.SETTINGS_TEMPLATE_FILE.
+        secret_key (str): The key for decryption, see loader.load_settings.
+        interval (float): Seconds between two checks when the file is polled.
+        use_inotify (bool): Watch the file with inotify, or None to use inotify
+            when it is available.
+        template_overlays (list): Paths to the overlays of the template,
+            or None if you want use settings.SETTINGS_TEMPLATE_OVERLAYS.
+
+    Attributes:
+        values (dict): The current values by key, by section, encrypted fields
+            being decrypted.
+
+    check() can also be called without start(), e.g. at the beginning of each
+    request or task.
+    """
+
+    def __init__(
+        self,
+        settings_file_path=None,
+        settings_template_file=None,
+        secret_key=None,
+        interval=1.0,
+        use_inotify=None,
+        template_overlays=None,
+    ):
+        from django.conf import settings
+
+        if settings_file_path is None:
+            settings_file_path = getattr(settings, "SETTINGS_FILE_PATH", None)
+        if settings_template_file is None:
+            settings_template_file = getattr(settings, "SETTINGS_TEMPLATE_FILE", None)
+        if template_overlays is None and settings.configured:
+            template_overlays = getattr(settings, "SETTINGS_TEMPLATE_OVERLAYS", None)
+        if not settings_file_path:
+            raise ValueError("Parameter settings_file_path undefined.")
+        self.settings_file_path = settings_file_path
+        self.settings_template_file = settings_template_file
+        self.secret_key = secret_key
+        self.interval = interval
+        self.use_inotify = use_inotify
+        self.template_overlays = tuple(template_overlays or ())
+        self._parsed = None
+        self._stamp = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.check()
+
+    @property
+    def values(self):
+        """The current values by key, by section."""
+        return self._parsed.values
+
+    def check(self):
+        """
+        Parse the settings file again if it changed, and send settings_file_changed.
+
+        Returns:
+            list: The (section, key) of the changed values, sorted.
+        """
+        with self._lock:
+            stamp = (
+                loader._file_stamp(self.settings_file_path),
+                loader._file_stamp(self.settings_template_file),
+                tuple(loader._file_stamp(path) for path in self.template_overlays),
+            )
+            if stamp == self._stamp:
+                return []
+            previous = self._parsed
+            parsed = loader._parse(
+                self.settings_file_path,
+                self.settings_template_file,
+                self.secret_key,
+                False,
+                previous,
+                overlays=self.template_overlays,
+            )
+            self._parsed = parsed
+            self._stamp = stamp
+        if previous is None:
+            return []
+        changed = _changed_fields(previous.values, parsed.values)
+        if changed:
+            signals.settings_file_changed.send(
+                sender=self.__class__,
+                watcher=self,
+                values=parsed.values,
+                changed=changed,
+            )
+        return changed
+
+    def start(self):
+        """
+        Watch the settings file in a daemon thread.
+
+        Returns:
+            SettingsWatcher: self.
+        """
+        if self._thread is None:
+            self._stop.clear()
+            file_descriptor = None
+            if self.use_inotify is not False:
+                file_descriptor = _inotify_init(
+                    os.path.dirname(os.path.abspath(self.settings_file_path))
+                )
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(file_descriptor,),
+                name="settings-watcher %s" % self.settings_file_path,
+            )
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the thread started by start()."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _safe_check(self):
+        """Check the file, keeping the current values if it can't be read."""
+        try:
+            self.check()
+        except (IOError, OSError, ValueError) as error:
+            logger.warning("Can't reload %s: %s", self.settings_file_path, error)
+
+    def _run(self, file_descriptor):
+        """Watch the file until stop() is called, with inotify if file_descriptor."""
+        self._safe_check()
+        if file_descriptor is None:
+            while not self._stop.wait(self.interval):
+                self._safe_check()
+            return
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([file_descriptor], [], [], self.interval)
+                if ready:
+                    try:
+                        while os.read(file_descriptor, 4096):
+                            pass
+                    except (IOError, OSError):
+                        pass
+                    self._safe_check()
+        finally:
+            os.close(file_descriptor)
+
+
+def _changed_fields(previous_values, values):
+    """Return the sorted (section, key) whose value differs between two parses."""
+    changed = []
+    for section in set(previous_values) | set(values):
+        previous_section = previous_values.get(section, {})
+        section_values = values.get(section, {})
+        for key in set(previous_section) | set(section_values):
+            if previous_section.get(key) != section_values.get(key):
+                changed.append((section, key))
+    return sorted(changed)
+
+
+def watch_settings(
+    settings_file_path=None,
+    settings_template_file=None,
+    secret_key=None,
+    interval=1.0,
+    use_inotify=None,
+    template_overlays=None,
+):
+    """
+    Start watching a settings file, see SettingsWatcher.
+
+    Returns:
+        SettingsWatcher: The started watcher.
+    """
+    return SettingsWatcher(
+        settings_file_path,
+        settings_template_file,
+        secret_key,
+        interval,
+        use_inotify,
+        template_overlays,
+    ).start()